@@ -1,31 +1,105 @@
+import math
+import os
+
+import requests
 import streamlit as st
-from geopy.distance import geodesic
 from FlightRadar24 import FlightRadar24API
 from streamlit_js_eval import get_geolocation
 
 # from streamlit_geolocation import streamlit_geolocation
 from datetime import datetime
+from types import SimpleNamespace
 from translations import translations
-from countryinfo import CountryInfo
 import folium
 from streamlit_folium import st_folium
 
 # import json
-import geocoder
+from backend.src.utils import countries, geoip
+from backend.src.utils.geo import nearest
+
+MAX_DISPLAYED_FLIGHTS = 10
+# Flight details are shared by every session for this long before being refetched.
+DETAILS_CACHE_TTL_SECONDS = 60
+DETAILS_CACHE_MAX_ENTRIES = 1000
+# Backend serving the map layer (see /flights/map in the backend README).
+API_URL = os.getenv("FLIGHT_TOWER_API_URL", "http://localhost:8000")
+MAP_START_ZOOM = 10
+# The backend refreshes traffic every few seconds; reruns within this reuse the layer.
+MAP_LAYER_CACHE_TTL_SECONDS = 5
+KM_PER_DEG_LAT = 111.32
+
+
+@st.cache_resource
+def get_fr_api():
+    """One FlightRadar24API client shared by every session of this process."""
+    return FlightRadar24API()
+
+
+@st.cache_data(
+    ttl=DETAILS_CACHE_TTL_SECONDS,
+    max_entries=DETAILS_CACHE_MAX_ENTRIES,
+    show_spinner=False,
+)
+def get_flight_details(flight_id):
+    """Flight details keyed by flight id, cached across sessions and reruns."""
+    # The client only reads the id from the flight it is given.
+    return get_fr_api().get_flight_details(SimpleNamespace(id=flight_id))
+
+
+@st.cache_data(ttl=MAP_LAYER_CACHE_TTL_SECONDS, max_entries=100, show_spinner=False)
+def get_map_layer(south, west, north, east, zoom):
+    """GeoJSON of the aircraft in a viewport; the backend clusters them when zoomed out."""
+    response = requests.get(
+        f"{API_URL}/flights/map",
+        params={"south": south, "west": west, "north": north, "east": east, "zoom": zoom},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def map_viewport(view, lat, lon, radius_km):
+    """(south, west, north, east, zoom) last reported by the map, or around the search circle before that."""
+    bounds = (view or {}).get("bounds") or {}
+    south_west, north_east = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    if None not in (south_west.get("lat"), south_west.get("lng"), north_east.get("lat"), north_east.get("lng")):
+        return (
+            max(south_west["lat"], -90.0),
+            south_west["lng"],
+            min(north_east["lat"], 90.0),
+            north_east["lng"],
+            int(view.get("zoom") or MAP_START_ZOOM),
+        )
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    return max(lat - dlat, -90.0), lon - dlon, min(lat + dlat, 90.0), lon + dlon, MAP_START_ZOOM
+
+
+def map_feature_label(properties):
+    if properties["cluster"]:
+        return get_text("aircraft_cluster").format(count=properties["count"])
+    altitude = properties["altitude_ft"]
+    return f"{properties['callsign'] or 'N/A'} ({properties['aircraft_code'] or 'N/A'}, {'N/A' if altitude is None else altitude} ft)"
+
+
+def map_feature_style(feature):
+    properties = feature["properties"]
+    if properties["cluster"]:
+        radius = min(6 + 3 * math.log2(properties["count"]), 24)
+        return {"radius": radius, "color": "darkred", "fillColor": "red", "fillOpacity": 0.6, "weight": 1}
+    return {"radius": 5, "color": "red", "fillColor": "red", "fillOpacity": 0.9, "weight": 1}
 
 
 def get_country_flag(country_name):
-    try:
-        return CountryInfo(country_name).flag()
-    except (KeyError, StopIteration):
-        return "🏴‍☠️"
+    return countries.get_flag(country_name)
 
 
 def update_location_by_ip():
-    """Updates the user's location using the geocoder library."""
-    g = geocoder.ip("me")
-    if g.ok and g.latlng:
-        st.session_state.user_lat, st.session_state.user_lon = g.latlng
+    """Updates the user's location from the viewer's IP address using the local IP range table."""
+    ip = geoip.client_ip(st.context.ip_address, st.context.headers.get("X-Forwarded-For"))
+    location = geoip.lookup(ip) if ip else None
+    if location:
+        st.session_state.user_lat, st.session_state.user_lon = location.lat, location.lon
         st.sidebar.success(get_text("location_updated"))
         st.session_state.trigger_flight_search = True
     else:
@@ -37,6 +111,70 @@ def get_text(key):
     return translations[st.session_state.lang].get(key, key)
 
 
+def build_flight_card(flight):
+    """Returns the HTML card for a flight, or None if its details couldn't be retrieved."""
+    if not (hasattr(flight, "id") and flight.id):
+        return f"""
+                    <div style="border: 1px solid #e6e6e6; border-radius: 10px; padding: 15px; margin-bottom: 15px;">
+                        <h3 style="margin-bottom: 10px;">{getattr(flight, "callsign", "N/A")}</h3>
+                        <p>
+                            <strong>{get_text("distance")}:</strong> {flight.distance:.2f} km<br>
+                        </p>
+                        <p>Incomplete data. Detailed flight information is unavailable.</p>
+                    </div>
+                    """
+
+    flight_details = get_flight_details(flight.id)
+    if not isinstance(flight_details, dict):
+        return None
+    flight.set_flight_details(flight_details)
+
+    origin_country = "N/A"
+    dest_country = "N/A"
+    try:
+        origin_country = flight_details["airport"]["origin"]["position"]["country"][
+            "name"
+        ]
+    except (KeyError, TypeError):
+        pass
+    try:
+        dest_country = flight_details["airport"]["destination"]["position"]["country"][
+            "name"
+        ]
+    except (KeyError, TypeError):
+        pass
+
+    origin_flag = get_country_flag(origin_country)
+    dest_flag = get_country_flag(dest_country)
+
+    flight_time_str = "N/A"
+    try:
+        departure = flight_details["time"]["scheduled"]["departure"]
+        arrival = flight_details["time"]["scheduled"]["arrival"]
+        if departure and arrival:
+            duration = arrival - departure
+            hours = duration // 3600
+            minutes = (duration % 3600) // 60
+            flight_time_str = f"{int(hours)}h {int(minutes)}m"
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    return f"""
+                        <div style="border: 1px solid #e6e6e6; border-radius: 10px; padding: 15px; margin-bottom: 15px;">
+                                    <h3 style="margin-bottom: 10px;">{getattr(flight, "callsign", "N/A")}</h3>
+                                    <p>
+                                        {get_text("from")}: {getattr(flight, "origin_airport_name", "N/A")} ({getattr(flight, "origin_airport_iata", "")}) - {origin_country} {origin_flag}<br>
+                                        {get_text("to")}: {getattr(flight, "destination_airport_name", "N/A")} ({getattr(flight, "destination_airport_iata", "")}) - {dest_country} {dest_flag}
+                                    </p>
+                                    <p>
+                                        <strong>{get_text("distance")}:</strong> {flight.distance:.2f} km<br>
+                                        <strong>{get_text("aircraft")}:</strong> {getattr(flight, "aircraft_code", "N/A")}<br>
+                                        <strong>{get_text("flight_time")}:</strong> {flight_time_str}
+                                    </p>
+                                </div>
+                        """
+
+
 # --- LANGUAGE SELECTION ---
 if "lang" not in st.session_state:
     st.session_state.lang = "pl"  # Default to Polish
@@ -46,6 +184,8 @@ if "show_results" not in st.session_state:
     st.session_state.show_results = False
 if "flight_data" not in st.session_state:
     st.session_state.flight_data = None
+if "flight_cards" not in st.session_state:
+    st.session_state.flight_cards = {}
 if "trigger_flight_search" not in st.session_state:
     st.session_state.trigger_flight_search = False
 if "user_lat" not in st.session_state:
@@ -56,6 +196,8 @@ if "user_lon" not in st.session_state:
     st.session_state.user_lon = 0
 if "location_request_sent" not in st.session_state:
     st.session_state.location_request_sent = False
+if "map_key" not in st.session_state:
+    st.session_state.map_key = 0
 
 # Language selector in the sidebar
 st.sidebar.header(get_text("language"))
@@ -115,8 +257,8 @@ with st.sidebar:
             )
 
 
-# Initialize the FlightRadar24API
-fr_api = FlightRadar24API()
+# Shared FlightRadar24API client, created once per process
+fr_api = get_fr_api()
 
 st.set_page_config(page_title=get_text("page_title"), page_icon="✈️", layout="centered")
 
@@ -146,6 +288,9 @@ if st.button(get_text("find_flights")) or st.session_state.trigger_flight_search
     # Reset display state
     st.session_state.show_results = False
     st.session_state.flight_data = None
+    st.session_state.flight_cards = {}
+    # A new search starts a new map, centred on the search.
+    st.session_state.map_key += 1
 
     st.header(get_text("nearby_flights"))
 
@@ -163,26 +308,34 @@ if st.button(get_text("find_flights")) or st.session_state.trigger_flight_search
         else:
             st.success(get_text("found_flights").format(count=len(flights)))
 
-            user_location = (user_lat, user_lon)
+            positioned = [
+                flight
+                for flight in flights
+                if hasattr(flight, "latitude")
+                and hasattr(flight, "longitude")
+                and flight.latitude
+                and flight.longitude
+            ]
+
+            # Only the closest flights are displayed, so select them with one
+            # vectorized distance pass instead of measuring and sorting everything.
+            indices, distances = nearest(
+                user_lat,
+                user_lon,
+                [flight.latitude for flight in positioned],
+                [flight.longitude for flight in positioned],
+                k=MAX_DISPLAYED_FLIGHTS,
+            )
             valid_flights = []
-
-            for flight in flights:
-                if (
-                    hasattr(flight, "latitude")
-                    and hasattr(flight, "longitude")
-                    and flight.latitude
-                    and flight.longitude
-                ):
-                    flight.distance = geodesic(
-                        user_location, (flight.latitude, flight.longitude)
-                    ).km
-                    valid_flights.append(flight)
+            for index, distance in zip(indices.tolist(), distances.tolist()):
+                flight = positioned[index]
+                flight.distance = distance
+                valid_flights.append(flight)
 
             if not valid_flights:
                 st.warning(get_text("no_valid_flight_data"))
                 # No st.stop() here, just don't set show_results
             else:
-                valid_flights.sort(key=lambda f: f.distance)
                 st.session_state.flight_data = valid_flights
                 st.session_state.show_results = True
 
@@ -198,90 +351,44 @@ if st.session_state.show_results and st.session_state.flight_data:
     # user_lat and user_lon are already available in the global scope of the script
 
     # Display flight information
-    for flight in valid_flights[:10]:  # Display top 10 closest flights
-        with st.spinner(
-            f"Fetching details for {getattr(flight, 'callsign', 'N/A')}..."
-        ):
-            try:
-                if hasattr(flight, "id") and flight.id:
-                    flight_details = fr_api.get_flight_details(flight)
-                    if isinstance(flight_details, dict):
-                        flight.set_flight_details(flight_details)
-
-                        origin_country = "N/A"
-                        dest_country = "N/A"
-                        try:
-                            origin_country = flight_details["airport"]["origin"][
-                                "position"
-                            ]["country"]["name"]
-                        except (KeyError, TypeError):
-                            pass
-                        try:
-                            dest_country = flight_details["airport"]["destination"][
-                                "position"
-                            ]["country"]["name"]
-                        except (KeyError, TypeError):
-                            pass
-
-                        origin_flag = get_country_flag(origin_country)
-                        dest_flag = get_country_flag(dest_country)
-
-                        flight_time_str = "N/A"
-                        try:
-                            departure = flight_details["time"]["scheduled"]["departure"]
-                            arrival = flight_details["time"]["scheduled"]["arrival"]
-                            if departure and arrival:
-                                duration = arrival - departure
-                                hours = duration // 3600
-                                minutes = (duration % 3600) // 60
-                                flight_time_str = f"{int(hours)}h {int(minutes)}m"
-                        except (KeyError, TypeError, ValueError):
-                            pass
-
-                        st.markdown(
-                            f"""
-                        <div style="border: 1px solid #e6e6e6; border-radius: 10px; padding: 15px; margin-bottom: 15px;">
-                                    <h3 style="margin-bottom: 10px;">{getattr(flight, "callsign", "N/A")}</h3>
-                                    <p>
-                                        {get_text("from")}: {getattr(flight, "origin_airport_name", "N/A")} ({getattr(flight, "origin_airport_iata", "")}) - {origin_country} {origin_flag}<br>
-                                        {get_text("to")}: {getattr(flight, "destination_airport_name", "N/A")} ({getattr(flight, "destination_airport_iata", "")}) - {dest_country} {dest_flag}
-                                    </p>
-                                    <p>
-                                        <strong>{get_text("distance")}:</strong> {flight.distance:.2f} km<br>
-                                        <strong>{get_text("aircraft")}:</strong> {getattr(flight, "aircraft_code", "N/A")}<br>
-                                        <strong>{get_text("flight_time")}:</strong> {flight_time_str}
-                                    </p>
-                                </div>
-                        """,
-                            unsafe_allow_html=True,
-                        )
-
-                    else:
-                        st.warning(
-                            f"Could not retrieve details for {getattr(flight, 'callsign', 'N/A')}"
-                        )
-                else:
-                    st.markdown(
-                        f"""
-                    <div style="border: 1px solid #e6e6e6; border-radius: 10px; padding: 15px; margin-bottom: 15px;">
-                        <h3 style="margin-bottom: 10px;">{getattr(flight, "callsign", "N/A")}</h3>
-                        <p>
-                            <strong>{get_text("distance")}:</strong> {flight.distance:.2f} km<br>
-                        </p>
-                        <p>Incomplete data. Detailed flight information is unavailable.</p>
-                    </div>
-                    """,
-                        unsafe_allow_html=True,
+    for flight in valid_flights[:MAX_DISPLAYED_FLIGHTS]:  # Display top closest flights
+        # Cards are memoized per session, so reruns that don't start a new search
+        # (moving a widget, panning the map) re-display them without any lookups.
+        card_key = (getattr(flight, "id", None), st.session_state.lang)
+        card = st.session_state.flight_cards.get(card_key)
+        if card is None:
+            with st.spinner(
+                f"Fetching details for {getattr(flight, 'callsign', 'N/A')}..."
+            ):
+                try:
+                    card = build_flight_card(flight)
+                except Exception as e:
+                    st.error(
+                        f"Error fetching details for {getattr(flight, 'callsign', 'N/A')}: {e}"
                     )
-
-            except Exception as e:
-                st.error(
-                    f"Error fetching details for {getattr(flight, 'callsign', 'N/A')}: {e}"
+                    continue
+            if card is None:
+                st.warning(
+                    f"Could not retrieve details for {getattr(flight, 'callsign', 'N/A')}"
                 )
+                continue
+            if card_key[0]:
+                st.session_state.flight_cards[card_key] = card
+
+        st.markdown(card, unsafe_allow_html=True)
 
     # --- MAP DISPLAY ---
     st.header(get_text("flights_on_map"))
-    m = folium.Map(location=[user_lat, user_lon], zoom_start=10)
+    # The map reports its viewport after every pan or zoom, and the rerun that
+    # follows draws the traffic in that viewport as a single GeoJSON layer.
+    map_key = f"flight_map_{st.session_state.map_key}"
+    view = st.session_state.get(map_key)
+    south, west, north, east, zoom = map_viewport(view, user_lat, user_lon, radius_km)
+    center = (view or {}).get("center") or {}
+    m = folium.Map(
+        location=[center.get("lat", user_lat), center.get("lng", user_lon)],
+        zoom_start=zoom,
+    )
 
     # Add user's location marker
     folium.Marker(
@@ -290,21 +397,23 @@ if st.session_state.show_results and st.session_state.flight_data:
         icon=folium.Icon(color="blue", icon="home", prefix="fa"),
     ).add_to(m)
 
-    # Add flight markers
-    for flight in valid_flights[:10]:
-        if (
-            hasattr(flight, "latitude")
-            and hasattr(flight, "longitude")
-            and flight.latitude
-            and flight.longitude
-        ):
-            folium.Marker(
-                [flight.latitude, flight.longitude],
-                tooltip=f"{getattr(flight, 'callsign', 'N/A')} ({flight.distance:.2f} km)",
-                icon=folium.Icon(color="red", icon="plane", prefix="fa"),
+    # Add the traffic layer
+    try:
+        layer = get_map_layer(south, west, north, east, zoom)
+    except requests.RequestException as e:
+        st.warning(get_text("map_unavailable").format(error=e))
+    else:
+        for feature in layer["features"]:
+            feature["properties"]["label"] = map_feature_label(feature["properties"])
+        if layer["features"]:
+            folium.GeoJson(
+                layer,
+                marker=folium.CircleMarker(),
+                style_function=map_feature_style,
+                tooltip=folium.GeoJsonTooltip(fields=["label"], labels=False),
             ).add_to(m)
 
-    st_folium(m, width=700, height=500)
+    st_folium(m, width=700, height=500, key=map_key, returned_objects=["bounds", "zoom", "center"])
 
     # # Add a download button for flight data as JSON  -for debuging only
     # if st.session_state.flight_data:
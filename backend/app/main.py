@@ -1,8 +1,28 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from src.routes import health, flights, geo
+from fastapi.middleware.gzip import GZipMiddleware
+from src.routes import health, flights, geo, metrics as metrics_routes
+from src.services import flightradar, upstream
+from src.services.poller import poller
+from src.utils import log, metrics
 
-app = FastAPI()
+log.configure()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(flightradar.tracks.restore)
+    yield
+    await poller.stop()
+    await flightradar.prefetcher.stop()
+    await flightradar.tracks.stop()
+    await upstream.client.aclose()
+    log.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,8 +31,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(log.RequestIdMiddleware)
 
 app.include_router(health.router, prefix="/health", tags=["health"])
 app.include_router(flights.router, prefix="/flights", tags=["flights"])
 app.include_router(geo.router, prefix="/geo", tags=["geo"])
+app.include_router(metrics_routes.router, tags=["metrics"])
 
@@ -0,0 +1,19 @@
+import argparse
+import asyncio
+
+from .replay import record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a live FlightRadar24 feed into a benchmark fixture.")
+    parser.add_argument("--lat", type=float, default=51.5072)
+    parser.add_argument("--lon", type=float, default=-0.1276)
+    parser.add_argument("--radius-km", type=float, default=500)
+    parser.add_argument("--details", type=int, default=100, help="number of flights to record details for")
+    parser.add_argument("--out", default="bench/fixtures/recording.json")
+    args = parser.parse_args()
+    asyncio.run(record(args.lat, args.lon, args.radius_km, args.details, args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import asyncio
+import dataclasses
+import json
+import os
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from FlightRadar24.api import FlightTrackerConfig
+from FlightRadar24.core import Core
+
+from src.services import upstream
+
+
+def load_fixture(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def synthetic_fixture(
+    flights: int = 20000,
+    seed: int = 7,
+    center: tuple = (50.0, 10.0),
+    spread_deg: float = 12.0,
+) -> Dict[str, Any]:
+    """Deterministic stand-in for a recording: a dense cluster of traffic plus detail payloads."""
+    rnd = random.Random(seed)
+    airports = [
+        ("WAW", "Warsaw Chopin Airport", "Poland"),
+        ("LHR", "London Heathrow Airport", "United Kingdom"),
+        ("FRA", "Frankfurt Airport", "Germany"),
+        ("CDG", "Paris Charles de Gaulle Airport", "France"),
+        ("AMS", "Amsterdam Schiphol Airport", "Netherlands"),
+        ("MUC", "Munich Airport", "Germany"),
+        ("FCO", "Rome Fiumicino Airport", "Italy"),
+        ("MAD", "Madrid Barajas Airport", "Spain"),
+    ]
+    now = int(time.time())
+    feed = {}
+    details = {}
+    for i in range(flights):
+        flight_id = f"3{i:07x}"
+        origin, destination = rnd.sample(airports, 2)
+        callsign = f"TST{i:04d}"
+        feed[flight_id] = [
+            f"{rnd.getrandbits(24):06X}",
+            round(center[0] + rnd.uniform(-spread_deg, spread_deg) / 2, 4),
+            round(center[1] + rnd.uniform(-spread_deg, spread_deg), 4),
+            rnd.randrange(360),
+            rnd.randrange(0, 41000, 25),
+            rnd.randrange(0, 520),
+            f"{rnd.randrange(7777):04d}",
+            "F-TEST",
+            "A320",
+            f"SP-{i:04d}",
+            now,
+            origin[0],
+            destination[0],
+            f"TS{i}",
+            0,
+            0,
+            callsign,
+            0,
+            "TST",
+        ]
+        departure = now - rnd.randrange(0, 4 * 3600)
+        details[flight_id] = {
+            "identification": {"id": flight_id, "callsign": callsign},
+            "airline": {"name": "Test Airways"},
+            "aircraft": {"code": {"text": "Airbus A320"}},
+            "airport": {
+                side: {
+                    "name": airport[1],
+                    "code": {"iata": airport[0]},
+                    "position": {"country": {"name": airport[2]}},
+                }
+                for side, airport in (("origin", origin), ("destination", destination))
+            },
+            "time": {"scheduled": {"departure": departure, "arrival": departure + rnd.randrange(3600, 4 * 3600)}},
+        }
+    return {"feed": feed, "details": details}
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport answering the FlightRadar24 feed and details endpoints from a fixture.
+
+    Feed requests are filtered by their bounds like the live service does. Every
+    response is delayed by `latency` seconds plus up to `jitter` seconds.
+    """
+
+    def __init__(self, fixture: Dict[str, Any], latency: float = 0.05, jitter: float = 0.0, seed: int = 0):
+        self.feed = fixture["feed"]
+        self.details = fixture["details"]
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = {"get_flights": 0, "get_flight_details": 0}
+        self._random = random.Random(seed)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        url = str(request.url)
+        if url.startswith(Core.real_time_flight_tracker_data_url):
+            self.calls["get_flights"] += 1
+            top, bottom, left, right = (float(v) for v in request.url.params["bounds"].split(","))
+            content = {
+                flight_id: info
+                for flight_id, info in self.feed.items()
+                if bottom <= info[1] <= top and left <= info[2] <= right
+            }
+            content["full_count"] = len(self.feed)
+            content["version"] = 4
+            return httpx.Response(200, json=content)
+
+        self.calls["get_flight_details"] += 1
+        details = self.details.get(request.url.params.get("flight"))
+        if details is None:
+            return httpx.Response(404)
+        return httpx.Response(200, json=details)
+
+
+async def record(lat: float, lon: float, radius_km: float, details_limit: int, path: str):
+    """Capture a live feed around a point plus details for its first flights into a fixture file."""
+    client = upstream.UpstreamClient()
+    try:
+        params = dataclasses.asdict(FlightTrackerConfig())
+        params["bounds"] = client.get_bounds_by_point(lat, lon, radius_km * 1000)
+        raw = await client._get_json(Core.real_time_flight_tracker_data_url, params)
+        feed = {key: value for key, value in raw.items() if key[0].isnumeric()}
+
+        details = {}
+        for flight_id in list(feed)[:details_limit]:
+            try:
+                details[flight_id] = await client.get_flight_details(flight_id)
+            except upstream.UpstreamError as e:
+                print(f"Skipping details for {flight_id}: {e}")
+    finally:
+        await client.aclose()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"feed": feed, "details": details}, f)
+    print(f"Recorded {len(feed)} flights and {len(details)} detail payloads to {path}")
+
+
+def install(
+    fixture: Dict[str, Any], latency: float, jitter: float = 0.0, rate_limit: float = float("inf")
+) -> ReplayTransport:
+    """Point the service layer's upstream client at a replay transport, unthrottled by default."""
+    transport = ReplayTransport(fixture, latency=latency, jitter=jitter)
+    upstream.client = upstream.UpstreamClient(transport=transport, rate_limit=rate_limit)
+    return transport
+
+
+def fixture_center(fixture: Dict[str, Any]) -> Optional[tuple]:
+    feed = fixture["feed"]
+    if not feed:
+        return None
+    lats = sorted(info[1] for info in feed.values())
+    lons = sorted(info[2] for info in feed.values())
+    return lats[len(lats) // 2], lons[len(lons) // 2]
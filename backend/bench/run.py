@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import resource
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+import numpy as np
+
+from src.services import flightradar, snapshot
+from src.utils import cache, log
+
+from . import replay
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "recording.json")
+
+Operation = Callable[[random.Random], Awaitable[None]]
+
+
+def _search_operation(center, radii: List[int], limits: List[int], spread_deg: float) -> Operation:
+    async def operation(rnd: random.Random):
+        lat = center[0] + rnd.uniform(-spread_deg, spread_deg)
+        lon = center[1] + rnd.uniform(-spread_deg, spread_deg)
+        await flightradar.get_flights(lat, lon, rnd.choice(radii), rnd.choice(limits))
+    return operation
+
+
+def _batch_operation(center, radii: List[int], limits: List[int], spread_deg: float, size: int) -> Operation:
+    async def operation(rnd: random.Random):
+        await flightradar.get_flights_batch([
+            (
+                center[0] + rnd.uniform(-spread_deg, spread_deg),
+                center[1] + rnd.uniform(-spread_deg, spread_deg),
+                rnd.choice(radii),
+                rnd.choice(limits),
+            )
+            for _ in range(size)
+        ])
+    return operation
+
+
+def _details_operation(flight_ids: List[str]) -> Operation:
+    async def operation(rnd: random.Random):
+        details = await flightradar.get_flight_details_from_obj(rnd.choice(flight_ids))
+        if "error" in details:
+            raise RuntimeError(details["message"])
+    return operation
+
+
+def _routes_operation(client: httpx.AsyncClient, center, radii, limits, spread_deg, flight_ids) -> Operation:
+    async def operation(rnd: random.Random):
+        # Roughly what a results page does: one search, then a detail lookup for some cards.
+        if rnd.random() < 0.2:
+            response = await client.get(f"/flights/{rnd.choice(flight_ids)}")
+        else:
+            response = await client.post("/flights/search", json={
+                "lat": center[0] + rnd.uniform(-spread_deg, spread_deg),
+                "lon": center[1] + rnd.uniform(-spread_deg, spread_deg),
+                "radius_km": rnd.choice(radii),
+                "limit": rnd.choice(limits),
+            })
+        response.raise_for_status()
+    return operation
+
+
+async def _drive(operation: Operation, requests: int, concurrency: int, seed: int) -> Dict[str, object]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker(worker_id: int):
+        nonlocal remaining, errors
+        rnd = random.Random(seed * 1000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                await operation(rnd)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+    }
+
+
+def _reset_state():
+    cache.clear()
+    flightradar.snapshot.clear()
+
+
+async def _run(args, fixture) -> List[Dict[str, object]]:
+    transport = replay.install(fixture, latency=args.latency, jitter=args.jitter, rate_limit=args.upstream_rate or float("inf"))
+    center = replay.fixture_center(fixture)
+    flight_ids = list(fixture["details"])
+    radii = [int(r) for r in args.radius.split(",")]
+    limits = [int(n) for n in args.limit.split(",")]
+
+    from app.main import app
+    # The app configures logging on import; keep per-request lines out of the report.
+    log.configure(level=args.log_level)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    operations = {
+        "search": _search_operation(center, radii, limits, args.spread),
+        "batch": _batch_operation(center, radii, limits, args.spread, args.batch_size),
+        "details": _details_operation(flight_ids),
+        "routes": _routes_operation(client, center, radii, limits, args.spread, flight_ids),
+    }
+
+    results = []
+    try:
+        for scenario in args.scenarios.split(","):
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                _reset_state()
+                calls_before = dict(transport.calls)
+                if args.trace_memory:
+                    tracemalloc.start()
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+                    result = await _drive(operations[scenario], args.requests, concurrency, args.seed)
+                if args.trace_memory:
+                    result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                    tracemalloc.stop()
+                result["scenario"] = scenario
+                result["concurrency"] = concurrency
+                result["upstream_calls"] = sum(transport.calls.values()) - sum(calls_before.values())
+                results.append(result)
+                _print_row(result)
+    finally:
+        await client.aclose()
+        await flightradar.upstream.client.aclose()
+    return results
+
+
+_HEADER = f"{'scenario':<10}{'conc':>6}{'reqs':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'upstream':>10}{'peak MB':>10}"
+
+
+def _print_row(result: Dict[str, object]):
+    peak = f"{result['peak_mb']:>10.1f}" if "peak_mb" in result else f"{'-':>10}"
+    print(
+        f"{result['scenario']:<10}{result['concurrency']:>6}{result['requests']:>8}{result['errors']:>8}"
+        f"{result['throughput']:>10.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+        f"{result['upstream_calls']:>10}{peak}",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the backend against a replayed FlightRadar24 fixture.")
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE, help="recording made with `python -m bench.record`")
+    parser.add_argument("--synthetic-flights", type=int, default=20000, help="size of the synthetic fixture used when no recording exists")
+    parser.add_argument("--scenarios", default="search,details,routes")
+    parser.add_argument("--batch-size", type=int, default=12, help="points per request in the batch scenario")
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario and concurrency level")
+    parser.add_argument("--radius", default="10,50,100", help="radius_km values to mix")
+    parser.add_argument("--limit", default="10,50", help="limit values to mix")
+    parser.add_argument("--spread", type=float, default=1.0, help="degrees of random offset between search centers")
+    parser.add_argument("--latency", type=float, default=0.08, help="injected upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.04, help="extra random upstream latency in seconds")
+    parser.add_argument("--upstream-rate", type=float, default=0, help="upstream requests per second budget (0: unlimited)")
+    parser.add_argument("--prefetch-k", type=int, default=0, help="prefetch details for the top K results of each search")
+    parser.add_argument("--tile-ttl", type=float, default=None, help="override the snapshot tile TTL in seconds")
+    parser.add_argument("--trace-memory", action="store_true", help="report tracemalloc peak per run (slower)")
+    parser.add_argument("--log-level", default="WARNING", help="application log level during runs")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if os.path.exists(args.fixture):
+        fixture = replay.load_fixture(args.fixture)
+        source = args.fixture
+    else:
+        fixture = replay.synthetic_fixture(args.synthetic_flights)
+        source = f"synthetic ({args.synthetic_flights} flights)"
+    if args.tile_ttl is not None:
+        snapshot.TILE_TTL_SECONDS = args.tile_ttl
+    flightradar.prefetcher.top_k = args.prefetch_k
+
+    print(f"fixture: {source}, upstream latency {args.latency * 1000:.0f}+{args.jitter * 1000:.0f} ms")
+    print(_HEADER)
+    asyncio.run(_run(args, fixture))
+    print(f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
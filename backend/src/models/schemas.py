@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, List, Optional
 
 class SearchRequest(BaseModel):
     lat: float
@@ -20,6 +20,28 @@ class FlightSummary(BaseModel):
     destination_airport_name: Optional[str]
     destination_airport_iata: Optional[str]
     heading_deg: Optional[int]
+    # Resolved from the bundled reference data, no detail lookup needed.
+    origin_country: Optional[str] = None
+    origin_country_code: Optional[str] = None
+    origin_country_flag: Optional[str] = None
+    destination_country: Optional[str] = None
+    destination_country_code: Optional[str] = None
+    destination_country_flag: Optional[str] = None
+    airline_name: Optional[str] = None
+    aircraft_code: Optional[str] = None
+    aircraft_type: Optional[str] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchRequest] = Field(..., min_length=1, max_length=50)
+
+class SearchResult(BaseModel):
+    count: int
+    flights: List[FlightSummary]
+    stale: bool = False
+
+class BatchSearchResponse(BaseModel):
+    # One per query, in order.
+    results: List[SearchResult]
 
 # Stricter model for the 'route' part of FlightDetail
 class RouteDetail(BaseModel):
@@ -44,4 +66,37 @@ class FlightDetail(BaseModel):
     route: RouteDetail
     times: TimeDetail
     origin_country: Optional[str]
-    destination_country: Optional[str]
\ No newline at end of file
+    destination_country: Optional[str]
+    # ISO 3166-1 alpha-2 codes and emoji flags resolved from the country names.
+    origin_country_code: Optional[str] = None
+    origin_country_flag: Optional[str] = None
+    destination_country_code: Optional[str] = None
+    destination_country_flag: Optional[str] = None
+    # True when served from the last known copy because FlightRadar24 was unavailable.
+    stale: bool = False
+
+class BatchDetailsRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=50)
+
+class BatchDetailsResponse(BaseModel):
+    results: Dict[str, FlightDetail]
+    errors: Dict[str, str]
+
+class TrackPoint(BaseModel):
+    time: int
+    lat: float
+    lon: float
+    altitude_ft: Optional[int]
+    speed_kts: Optional[int]
+    heading_deg: Optional[int]
+
+class FlightTrack(BaseModel):
+    id: str
+    # Oldest first.
+    points: List[TrackPoint]
+
+class ReplayResponse(BaseModel):
+    start: float
+    end: float
+    count: int
+    tracks: List[FlightTrack]
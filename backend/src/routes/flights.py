@@ -1,11 +1,25 @@
-from fastapi import APIRouter, Response, HTTPException
-from ..models.schemas import SearchRequest, FlightDetail
-from ..services import flightradar
-import sys
-import traceback
+from fastapi import APIRouter, Depends, Response, HTTPException, Query, Request, Header
+from typing import Optional
+import numpy as np
+from fastapi.responses import JSONResponse, StreamingResponse
+from ..models.schemas import SearchRequest, BatchSearchRequest, BatchSearchResponse, FlightDetail, BatchDetailsRequest, BatchDetailsResponse, FlightTrack, ReplayResponse
+from ..services import flightradar, maplayer, snapshot, tracks, upstream
+from ..services.poller import poller
+from ..utils import log, metrics, wire
+from email.utils import formatdate, parsedate_to_datetime
+import asyncio
+import json
+import time
 
 router = APIRouter()
 
+logger = log.get_logger("routes.flights")
+
+# Idle streams send an SSE comment this often so proxies keep the connection open.
+STREAM_KEEPALIVE_SECONDS = 15
+# Set on search responses served from expired data while upstream is failing.
+STALE_HEADER = "X-Data-Stale"
+
 @router.options("/search")
 def search_flights_options():
     return Response(
@@ -13,46 +27,295 @@ def search_flights_options():
         headers={
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "POST, GET, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type",
+            "Access-Control-Allow-Headers": "Content-Type, Accept, If-None-Match, If-Modified-Since",
         },
     )
 
-@router.post("/search")
-def search_flights(request: SearchRequest, response: Response):
-    print(f"[/flights/search] Received request with body: {request.model_dump_json()}", flush=True)
-    response.headers["Access-Control-Allow-Origin"] = "*"
+def _etag(version: str, compact: bool, stale: bool) -> str:
+    return f'"{version}{"-c" if compact else ""}{"-s" if stale else ""}"'
+
+
+def _not_modified(etag: str, updated_at: float, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """Evaluate conditional headers; If-None-Match wins over If-Modified-Since when both are sent."""
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(updated_at) <= since
+    return False
+
+
+def _cache_control(flights) -> str:
+    # Shared caches may reuse a response for as long as the snapshot would, and
+    # keep serving it while they revalidate for as long as the snapshot would too.
+    if flights.stale:
+        return "no-cache"
+    max_age = max(0, int(snapshot.TILE_TTL_SECONDS - (time.time() - flights.fetched_at)))
+    if snapshot.DEAD_RECKONING_HORIZON_SECONDS > 0:
+        # Dead-reckoned positions move on every step.
+        max_age = min(max_age, snapshot.DEAD_RECKONING_STEP_SECONDS)
+    revalidate = max(0, int(snapshot.TILE_HARD_TTL_SECONDS - snapshot.TILE_TTL_SECONDS))
+    return f"public, max-age={max_age}, stale-while-revalidate={revalidate}"
+
+
+async def _search(
+    request: SearchRequest,
+    response_format: Optional[str],
+    since: Optional[str],
+    accept: Optional[str],
+    accept_encoding: Optional[str],
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+    cacheable: bool,
+):
+    logger.debug("Search request: lat=%s, lon=%s, radius_km=%s, limit=%s", request.lat, request.lon, request.radius_km, request.limit)
     try:
-        print(f"[/flights/search] Calling flightradar.get_flights with lat={request.lat}, lon={request.lon}, radius_km={request.radius_km}, limit={request.limit}", flush=True)
-        flights = flightradar.get_flights(request.lat, request.lon, request.radius_km, request.limit)
-        print(f"[/flights/search] flightradar.get_flights returned {len(flights)} flights.", flush=True)
+        flights = await flightradar.get_flights(request.lat, request.lon, request.radius_km, request.limit)
+
+        compact = wire.wants_compact(response_format, accept)
+        version = wire.snapshot_version(flights)
+        headers = {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": f"ETag, Last-Modified, {STALE_HEADER}",
+            "Vary": "Accept",
+            "ETag": _etag(version, compact, flights.stale),
+            "Last-Modified": formatdate(flights.updated_at, usegmt=True),
+        }
+        if cacheable:
+            headers["Cache-Control"] = _cache_control(flights)
+        if flights.stale:
+            headers[STALE_HEADER] = "true"
+
+        if _not_modified(headers["ETag"], flights.updated_at, if_none_match, if_modified_since):
+            logger.debug("Search results unchanged since %s, sending 304", headers["ETag"])
+            return Response(status_code=304, headers=headers)
+
+        if compact:
+            with metrics.timed(metrics.search_stage_duration, stage="encode"):
+                payload = wire.encode_compact(flights, since, version)
+                body, encoding = wire.encode_body(payload, accept_encoding)
+            if encoding:
+                headers["Content-Encoding"] = encoding
+                # GZipMiddleware passes bodies encoded here through untouched, Vary included.
+                headers["Vary"] = "Accept, Accept-Encoding"
+            logger.debug("Sending compact response: %d of %d rows, delta=%s, %d bytes", payload["rows"], payload["count"], payload["delta"], len(body))
+            return Response(content=body, media_type=wire.COMPACT_MEDIA_TYPE, headers=headers)
 
         response_data = {
             "count": len(flights),
-            "flights": flights
+            "flights": flights,
+            "stale": flights.stale,
+        }
+        logger.debug("Sending response with %d flights", response_data["count"])
+        return JSONResponse(response_data, headers=headers)
+    except upstream.UpstreamUnavailable as e:
+        # Nothing cached to fall back on; tell the client when to come back.
+        logger.warning("Search unavailable: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    except Exception as e:
+        logger.exception("Search failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
+
+
+@router.get("/search")
+async def search_flights_get(
+    request: SearchRequest = Depends(),
+    response_format: Optional[str] = Query(None, alias="format"),
+    since: Optional[str] = Query(None),
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
+    """Search as a cacheable GET, for CDNs and the frontend proxy."""
+    return await _search(request, response_format, since, accept, accept_encoding, if_none_match, if_modified_since, cacheable=True)
+
+
+@router.post("/search")
+async def search_flights(
+    request: SearchRequest,
+    response_format: Optional[str] = Query(None, alias="format"),
+    since: Optional[str] = Query(None),
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
+    return await _search(request, response_format, since, accept, accept_encoding, if_none_match, if_modified_since, cacheable=False)
+
+
+@router.post("/search:batch", response_model=BatchSearchResponse)
+async def search_flights_batch(request: BatchSearchRequest):
+    """Search around many points at once; results come back in the order of the queries."""
+    logger.debug("Batch search request for %d points", len(request.queries))
+    try:
+        batch = await flightradar.get_flights_batch(
+            [(query.lat, query.lon, query.radius_km, query.limit) for query in request.queries]
+        )
+        results = [{"count": len(flights), "flights": flights, "stale": flights.stale} for flights in batch]
+        logger.debug("Returning %d flights for %d points", sum(len(flights) for flights in batch), len(batch))
+        return JSONResponse({"results": results}, headers={"Access-Control-Allow-Origin": "*"})
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Batch search unavailable: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    except Exception as e:
+        logger.exception("Batch search failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
+
+
+@router.post("/details:batch", response_model=BatchDetailsResponse)
+async def get_flight_details_batch(request: BatchDetailsRequest):
+    logger.debug("Batch details request for %d flight ids", len(request.ids))
+    try:
+        batch = await flightradar.get_flight_details_batch(request.ids)
+        logger.debug("Returning %d results and %d errors", len(batch["results"]), len(batch["errors"]))
+        return batch
+    except Exception as e:
+        logger.exception("Batch details failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
+
+
+@router.get("/stream")
+async def stream_flights(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: int = Query(..., ge=5, le=100),
+):
+    """
+    Server-Sent Events stream of live traffic around a point.
+
+    The first event carries every flight in the region (reset=true); later events
+    only list flights that were added, moved or removed since the previous one.
+    """
+    logger.info("New stream subscriber for lat=%s, lon=%s, radius_km=%s", lat, lon, radius_km)
+    subscription = poller.subscribe(lat, lon, radius_km)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(subscription.queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {delta['version']}\nevent: delta\ndata: {json.dumps(delta)}\n\n"
+        finally:
+            logger.info("Stream subscriber for lat=%s, lon=%s disconnected", lat, lon)
+            poller.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Access-Control-Allow-Origin": "*",
+        },
+    )
+
+
+@router.get("/map")
+async def get_map_layer(
+    south: float = Query(..., ge=-90, le=90),
+    west: float = Query(...),
+    north: float = Query(..., ge=-90, le=90),
+    east: float = Query(...),
+    zoom: int = Query(..., ge=0, le=22),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
+    """
+    Aircraft in a map viewport as one GeoJSON FeatureCollection.
+
+    Below MAP_FULL_DETAIL_ZOOM nearby aircraft are merged into cluster features
+    carrying a count. The viewport is widened to whole snapshot tiles, so the
+    response only depends on those tiles and the zoom level and is cached like
+    a search.
+    """
+    logger.debug("Map request: %s,%s,%s,%s at zoom %s", south, west, north, east, zoom)
+    try:
+        layer = await maplayer.viewport(south, west, north, east, zoom)
+        headers = {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": f"ETag, Last-Modified, {STALE_HEADER}",
+            "ETag": _etag(layer.version, False, layer.stale),
+            "Last-Modified": formatdate(layer.updated_at, usegmt=True),
+            "Cache-Control": _cache_control(layer),
         }
-        print(f"[/flights/search] Sending response: {{'count': {response_data['count']}, 'flights': [...]}}", flush=True)
-        return response_data
+        if layer.stale:
+            headers[STALE_HEADER] = "true"
+        if _not_modified(headers["ETag"], layer.updated_at, if_none_match, if_modified_since):
+            return Response(status_code=304, headers=headers)
+        return Response(content=layer.body, media_type=maplayer.MEDIA_TYPE, headers=headers)
+    except maplayer.ViewportTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Map layer unavailable: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    except Exception as e:
+        logger.exception("Map layer failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
+
+
+@router.get("/replay", response_model=ReplayResponse)
+async def replay_flights(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: int = Query(..., ge=5, le=100),
+    start: Optional[float] = Query(None, description="Unix time; defaults to the start of the retention window."),
+    end: Optional[float] = Query(None, description="Unix time; defaults to now."),
+):
+    """Every recorded position within radius_km of a point between start and end, grouped by aircraft."""
+    end = time.time() if end is None else end
+    start = end - tracks.TRACK_RETENTION_SECONDS if start is None else start
+    logger.debug("Replay request: lat=%s, lon=%s, radius_km=%s, %s..%s", lat, lon, radius_km, start, end)
+    try:
+        # Scans mapped segments; keep it off the event loop.
+        points = await asyncio.to_thread(flightradar.tracks.replay, lat, lon, radius_km, start, end)
+        # Points come sorted by aircraft, so each one's track is a contiguous run.
+        ids, firsts = np.unique(points["id"], return_index=True)
+        bounds = np.append(firsts, len(points)).tolist()
+        flight_tracks = [
+            {"id": flight_id.decode(), "points": tracks.as_rows(points[bounds[i]:bounds[i + 1]])}
+            for i, flight_id in enumerate(ids.tolist())
+        ]
+        logger.debug("Replaying %d points from %d aircraft", len(points), len(flight_tracks))
+        return JSONResponse({"start": start, "end": end, "count": len(points), "tracks": flight_tracks})
     except Exception as e:
-        print(f"[/flights/search] An exception occurred: {e}", file=sys.stderr, flush=True)
-        traceback.print_exc(file=sys.stderr)
+        logger.exception("Replay failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
+
+
+@router.get("/{flight_id}/track", response_model=FlightTrack)
+async def get_flight_track(flight_id: str):
+    """Recent positions of one aircraft, oldest first; empty if it hasn't been seen."""
+    logger.debug("Track request for flight_id: %s", flight_id)
+    try:
+        return {"id": flight_id, "points": tracks.as_rows(flightradar.tracks.track(flight_id))}
+    except Exception as e:
+        logger.exception("Track for %s failed: %s", flight_id, e)
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
 
 
 @router.get("/{flight_id}", response_model=FlightDetail)
-def get_flight_details(flight_id: str):
-    print(f"[/flights/{{flight_id}}] Received request for flight_id: {flight_id}", flush=True)
+async def get_flight_details(flight_id: str):
+    logger.debug("Details request for flight_id: %s", flight_id)
     try:
-        print(f"[/flights/{{flight_id}}] Calling flightradar.get_flight_details_from_obj for flight_id: {flight_id}", flush=True)
-        flight_details = flightradar.get_flight_details_from_obj(flight_id)
-        print(f"[/flights/{{flight_id}}] flightradar.get_flight_details_from_obj returned: {flight_details is not None}", flush=True)
-
-        if flight_details is None:
-            print(f"[/flights/{{flight_id}}] Flight not found: {flight_id}", flush=True)
-            raise HTTPException(status_code=404, detail="Flight not found")
-        
-        print(f"[/flights/{{flight_id}}] Sending response for flight_id: {flight_id}", flush=True)
+        flight_details = await flightradar.get_flight_details_from_obj(flight_id)
+
+        if flight_details.get("error") == flightradar.FLIGHT_NOT_FOUND:
+            raise HTTPException(status_code=404, detail=flight_details["message"])
+
         return flight_details
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[/flights/{{flight_id}}] An exception occurred: {e}", file=sys.stderr, flush=True)
-        traceback.print_exc(file=sys.stderr)
+        logger.exception("Details for %s failed: %s", flight_id, e)
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
\ No newline at end of file
@@ -1,11 +1,23 @@
 from fastapi import APIRouter, Request
-import geocoder
+from ..utils import geoip, log
 
 router = APIRouter()
 
+logger = log.get_logger("routes.geo")
+
 @router.get("/ip")
-def get_ip_location(request: Request):
-    g = geocoder.ip("me")
-    if g.ok and g.latlng:
-        return {"lat": g.lat, "lon": g.lng, "source": "ip"}
-    return {"lat": 0, "lon": 0, "source": "ip"}
+async def get_ip_location(request: Request):
+    ip = geoip.client_ip(request.client.host if request.client else None, request.headers.get("x-forwarded-for"))
+    location = geoip.lookup(ip) if ip else None
+    if location is None:
+        # No range table, or the address isn't in it: say so rather than send
+        # coordinates, so clients keep their own default center.
+        logger.debug("No location for client address %s", ip)
+        return {"source": None}
+    return {
+        "lat": location.lat,
+        "lon": location.lon,
+        "source": "ip",
+        "country_code": location.country_code,
+        "city": location.city or None,
+    }
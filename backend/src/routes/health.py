@@ -1,8 +1,13 @@
 from fastapi import APIRouter
 from datetime import datetime
+from ..utils import cache
 
 router = APIRouter()
 
 @router.get("/")
 def read_health():
     return {"status": "ok", "time": datetime.utcnow().isoformat()}
+
+@router.get("/cache")
+def read_cache_stats():
+    return cache.stats()
@@ -0,0 +1,18 @@
+from anyio import to_thread
+from fastapi import APIRouter, Response
+from ..services.poller import poller
+from ..utils import log, metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def read_metrics():
+    """Prometheus text exposition of request, upstream, cache and saturation metrics."""
+    # Saturation gauges are sampled at scrape time rather than on every change.
+    limiter = to_thread.current_default_thread_limiter()
+    metrics.threadpool_busy.set(limiter.borrowed_tokens)
+    metrics.threadpool_size.set(limiter.total_tokens)
+    metrics.threadpool_waiting.set(limiter.statistics().tasks_waiting)
+    metrics.log_queue_depth.set(log.queue_depth())
+    metrics.stream_subscribers.set(poller.subscriber_count)
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
@@ -1,61 +1,133 @@
-from FlightRadar24 import FlightRadar24API
-from geopy.distance import geodesic
-import sys
-import traceback
-from ..utils import cache
+import asyncio
+import contextvars
+import time
+from functools import lru_cache
+from ..utils import cache, countries, log, metrics, positions, reference, shared
+from . import upstream
+from .prefetch import DetailPrefetcher
+from .scheduler import Priority, current_priority
+from .snapshot import TileSnapshot
+from .tracks import TrackStore
 
-fr_api = FlightRadar24API()
+# Lookups of flights that dropped out of the cache search around their last known
+# position, widened by how far an airliner could have flown since.
+LOOKUP_BASE_RADIUS_KM = 100
+LOOKUP_MAX_RADIUS_KM = 2000
+MAX_GROUND_SPEED_KM_S = 0.3
+# A flight last seen this recently is taken to still be live and is looked up by id alone.
+RECENTLY_SEEN_SECONDS = 600
 
-def get_flights(lat: float, lon: float, radius_km: int, limit: int):
-    print(f"[service.get_flights] Getting flights for lat={lat}, lon={lon}, radius_km={radius_km}", file=sys.stdout, flush=True)
-    try:
-        bounds = fr_api.get_bounds_by_point(lat, lon, radius_km * 1000)
-        print(f"[service.get_flights] Calculated bounds: {bounds}", file=sys.stdout, flush=True)
-        flights = fr_api.get_flights(bounds=bounds)
-        print(f"[service.get_flights] Received {len(flights)} flights from FlightRadar24 API.", file=sys.stdout, flush=True)
+logger = log.get_logger("service.flightradar")
+
+# Exact geodesic distances for the final candidates; "haversine" trades ~0.5% accuracy for speed.
+DISTANCE_MODE = "geodesic"
+# The "error" of the details payload for an id FlightRadar24 doesn't know; the
+# details route answers 404 for it.
+FLIGHT_NOT_FOUND = "Flight not found"
+
+def _cache_positions(records):
+    """Remember where each flight was last seen; that narrows later lookups of its id."""
+    records = records[positions.located(records)]
+    logger.debug("Caching %d flight positions", len(records))
+    seen_at = time.time()
+    cache.set_many(
+        (
+            (flight_id.decode(), (lat, lon, seen_at))
+            for flight_id, lat, lon in zip(records["id"].tolist(), records["latitude"].tolist(), records["longitude"].tolist())
+            if flight_id
+        ),
+        namespace="positions",
+    )
+
+tracks = TrackStore()
 
-        print(f"[service.get_flights] Caching {len(flights)} flight objects for 10 minutes...", file=sys.stdout, flush=True)
-        for flight in flights:
-            if flight.id:
-                cache.set(flight.id, flight, ttl=600)
+def _on_refresh(records):
+    _cache_positions(records)
+    tracks.append(records, time.time())
+
+snapshot = TileSnapshot(
+    fetch=lambda bounds: upstream.client.get_flights(bounds),
+    on_refresh=_on_refresh,
+    store=shared.tile_store(),
+    # The worker that fetched these already cached their positions and wrote them to the track segments.
+    on_adopt=lambda records: tracks.append(records, time.time(), persist=False),
+)
+
+# Reference data doesn't change while running, and a handful of airports cover most traffic.
+@lru_cache(maxsize=4096)
+def _route_end(prefix: str, iata):
+    """Airport name and country for one end of a route, from the bundled reference data."""
+    airport = reference.airport(iata)
+    country = countries.lookup(airport.country_code) if airport else None
+    return {
+        f"{prefix}_airport_name": airport.name if airport else None,
+        f"{prefix}_airport_iata": iata,
+        f"{prefix}_country": country.name if country else None,
+        f"{prefix}_country_code": country.alpha2 if country else None,
+        f"{prefix}_country_flag": country.flag if country else None,
+    }
+
+def _known(value):
+    """A flight field, or None for FlightRadar24's "N/A" placeholder and empty strings."""
+    return None if value == "N/A" or value == "" else value
+
+def summarize_flight(flight, distance_km: float) -> dict:
+    """Build the FlightSummary payload for a flight, enriched from local reference data."""
+    aircraft_code = _known(flight.aircraft_code)
+    airline = reference.airline(_known(flight.airline_icao)) or reference.airline(_known(flight.airline_iata))
+    aircraft_type = reference.aircraft_type(aircraft_code)
+    return {
+        "id": flight.id,
+        "callsign": _known(flight.callsign),
+        "lat": flight.latitude,
+        "lon": flight.longitude,
+        "distance_km": distance_km,
+        "altitude_ft": _known(flight.altitude),
+        "speed_kts": _known(flight.ground_speed),
+        **_route_end("origin", _known(flight.origin_airport_iata)),
+        **_route_end("destination", _known(flight.destination_airport_iata)),
+        "heading_deg": _known(flight.heading),
+        "airline_name": airline.name if airline else None,
+        "aircraft_code": aircraft_code,
+        "aircraft_type": aircraft_type.name if aircraft_type else None,
+    }
 
+def _summaries(matches):
+    with metrics.timed(metrics.search_stage_duration, stage="enrich"):
+        flight_summaries = matches.like(summarize_flight(flight, distance_km) for flight, distance_km in matches)
+    metrics.search_results.observe(len(flight_summaries))
+    # Users open the closest flights next; have their details ready by then.
+    prefetcher.enqueue(summary["id"] for summary in flight_summaries)
+    return flight_summaries
+
+async def get_flights(lat: float, lon: float, radius_km: int, limit: int):
+    logger.debug("Getting flights for lat=%s, lon=%s, radius_km=%s", lat, lon, radius_km)
+    try:
+        matches = await snapshot.nearest(lat, lon, radius_km, limit, mode=DISTANCE_MODE)
+        logger.debug("Snapshot index returned %d flights", len(matches))
     except Exception as e:
-        print(f"[service.get_flights] Error fetching flights from FlightRadar24 API: {e}", file=sys.stderr, flush=True)
+        logger.error("Error fetching flights from FlightRadar24 API: %s", e)
         raise
 
-    user_location = (lat, lon)
-    flight_summaries = []
-    print(f"[service.get_flights] Processing {len(flights)} flights...", file=sys.stdout, flush=True)
-    for i, flight in enumerate(flights):
-        try:
-            if hasattr(flight, 'latitude') and hasattr(flight, 'longitude') and flight.latitude and flight.longitude:
-                distance_km = geodesic(user_location, (flight.latitude, flight.longitude)).km
-                summary = {
-                    "id": flight.id,
-                    "callsign": flight.callsign,
-                    "lat": flight.latitude,
-                    "lon": flight.longitude,
-                    "distance_km": distance_km,
-                    "altitude_ft": flight.altitude,
-                    "speed_kts": flight.ground_speed,
-                    "origin_airport_name": getattr(flight, 'origin_airport_name', None),
-                    "origin_airport_iata": getattr(flight, 'origin_airport_iata', None),
-                    "destination_airport_name": getattr(flight, 'destination_airport_name', None),
-                    "destination_airport_iata": getattr(flight, 'destination_airport_iata', None),
-                    "heading_deg": flight.heading,
-                }
-                flight_summaries.append(summary)
-            else:
-                print(f"[service.get_flights] Skipping flight {getattr(flight, 'id', 'N/A')} due to missing coordinates.", file=sys.stdout, flush=True)
-        except Exception as e:
-            print(f"[service.get_flights] Error processing flight {getattr(flight, 'id', 'N/A')} (item {i}): {e}", file=sys.stderr, flush=True)
-
-    print(f"[service.get_flights] Successfully processed {len(flight_summaries)} flights.", file=sys.stdout, flush=True)
-    flight_summaries.sort(key=lambda f: f['distance_km'])
-    
-    limited_flights = flight_summaries[:limit]
-    print(f"[service.get_flights] Sorted and limited to {len(limited_flights)} flights. Returning.", file=sys.stdout, flush=True)
-    return limited_flights
+    flight_summaries = _summaries(matches)
+    logger.debug("Returning the %d closest flights", len(flight_summaries))
+    return flight_summaries
+
+async def get_flights_batch(queries):
+    """
+    Search around many points at once.
+
+    Takes (lat, lon, radius_km, limit) tuples and returns one list of flight
+    summaries per point, in order. The points share one refresh of the tiles
+    under them and one pass over the aircraft those tiles hold.
+    """
+    logger.debug("Getting flights around %d points", len(queries))
+    try:
+        batch = await snapshot.nearest_many(queries, mode=DISTANCE_MODE)
+    except Exception as e:
+        logger.error("Error fetching flights from FlightRadar24 API: %s", e)
+        raise
+    return [_summaries(matches) for matches in batch]
 
 def _create_error_response(error_type: str, message: str, airline: str, aircraft_code: str) -> dict:
     """Helper function to create consistent error responses."""
@@ -68,52 +140,124 @@ def _create_error_response(error_type: str, message: str, airline: str, aircraft
         "times": {"scheduled_departure": None, "scheduled_arrival": None, "duration_readable": "N/A"},
         "origin_country": "N/A",
         "destination_country": "N/A",
+        "origin_country_code": None,
+        "origin_country_flag": None,
+        "destination_country_code": None,
+        "destination_country_flag": None,
     }
 
-def _fetch_flight_from_api(flight_id: str):
-    """Attempt to fetch flight data directly from the API."""
+class _FlightRef:
+    """Stand-in for a Flight we hold no position for; the details endpoint is keyed by id alone."""
+    __slots__ = ("id",)
+
+    def __init__(self, flight_id: str):
+        self.id = flight_id
+
+def _lookup_radius_km(last_seen: float) -> float:
+    # Search wider the longer the aircraft has been out of sight.
+    age_s = max(time.time() - last_seen, 0.0)
+    return min(LOOKUP_BASE_RADIUS_KM + age_s * MAX_GROUND_SPEED_KM_S, LOOKUP_MAX_RADIUS_KM)
+
+async def _fetch_flight_from_api(flight_id: str):
+    """
+    Resolve a flight id before fetching its details.
+
+    Flights seen recently are taken as they are. If the id was seen longer ago,
+    only the area around its last known position is fetched to check it is
+    still flying. Ids we have never seen are looked up by id directly.
+    """
+    last_position = cache.get(flight_id, namespace="positions")
+    if last_position is None:
+        logger.debug("No known position for %s, looking it up by id", flight_id)
+        return _FlightRef(flight_id)
+
+    lat, lon, last_seen = last_position
+    if time.time() - last_seen < RECENTLY_SEEN_SECONDS:
+        # Seen by a recent search, possibly in another worker.
+        return _FlightRef(flight_id)
+    radius_km = _lookup_radius_km(last_seen)
     try:
-        flights = fr_api.get_flights(bounds=fr_api.get_bounds_by_point(lat=0, lon=0, radius=20000))
-        return next((f for f in flights if f.id == flight_id), None)
+        logger.debug("Searching %.0f km around last known position of %s", radius_km, flight_id)
+        records = await upstream.client.get_flights(upstream.client.get_bounds_by_point(lat, lon, radius_km * 1000))
     except Exception as e:
-        print(f"[service.get_flight_details] Error fetching flight from API: {str(e)}", file=sys.stderr, flush=True)
-        traceback.print_exc(file=sys.stderr)
-        return None
+        logger.warning("Error fetching flight %s from API: %s", flight_id, e, exc_info=True)
+        # Don't report a vanished flight just because the area lookup failed.
+        return _FlightRef(flight_id)
+
+    _cache_positions(records)
+    return _FlightRef(flight_id) if (records["id"] == flight_id.encode()).any() else None
+
+# Detail lookups in progress, shared by every caller asking for the same id:
+# flight id -> (task, the context it runs in).
+_details_in_flight = {}
+
+async def get_flight_details_from_obj(flight_id: str):
+    logger.debug("Getting details for flight_id: %s", flight_id)
+
+    cached_details = cache.get(flight_id, namespace="details")
+    if cached_details is not None:
+        logger.debug("Serving cached details for %s", flight_id)
+        return cached_details
+
+    # A prefetch or another request may already be fetching this flight; join it.
+    in_flight = _details_in_flight.get(flight_id)
+    if in_flight is None:
+        context = contextvars.copy_context()
+        task = asyncio.get_running_loop().create_task(_load_flight_details(flight_id), context=context)
+        _details_in_flight[flight_id] = (task, context)
+        task.add_done_callback(lambda _: _details_in_flight.pop(flight_id, None))
+    else:
+        task, context = in_flight
+        _expedite(task, context, current_priority.get())
+    # Shielded so one caller going away doesn't cancel the lookup for the others.
+    return await asyncio.shield(task)
+
+def _expedite(task: asyncio.Task, context: contextvars.Context, priority):
+    """
+    Raise a shared lookup to the priority of a caller joining it.
+
+    A lookup started by the prefetcher runs at BACKGROUND; a user opening the
+    same flight meanwhile must not wait behind every search for it.
+    """
+    running = context.get(current_priority)
+    # None means each operation's own default, which is the most urgent for details.
+    if running is None or (priority is not None and priority >= running):
+        return
+    context.run(current_priority.set, priority)
+    upstream.client.scheduler.promote(task, Priority.DETAILS if priority is None else priority)
+
+def _flight_not_found(flight_id: str, remember: bool = True) -> dict:
+    if remember:
+        # Remember the miss briefly so repeated lookups don't refetch.
+        cache.set(flight_id, True, namespace="missing")
+    logger.info("Flight %s not found in API results", flight_id)
+    return _create_error_response(
+        error_type=FLIGHT_NOT_FOUND,
+        message="The requested flight could not be found. Please try again or check the flight ID.",
+        airline="Flight not found",
+        aircraft_code="N/A"
+    )
+
+async def _load_flight_details(flight_id: str):
+    if cache.get(flight_id, namespace="missing") is not None:
+        return _flight_not_found(flight_id, remember=False)
+    if await _fetch_flight_from_api(flight_id) is None:
+        return _flight_not_found(flight_id)
 
-def get_flight_details_from_obj(flight_id: str):
-    print(f"[service.get_flight_details] Getting details for flight_id: {flight_id}", file=sys.stdout, flush=True)
-    
-    # Try to get flight from cache
-    flight_obj = cache.get(flight_id)
-    print(f"[service.get_flight_details] Cache get for {flight_id} returned: {flight_obj is not None}", file=sys.stdout, flush=True)
-    
-    # If not in cache, try to fetch from API
-    if not flight_obj:
-        print(f"[service.get_flight_details] Flight {flight_id} not in cache, fetching from API...", file=sys.stdout, flush=True)
-        flight_obj = _fetch_flight_from_api(flight_id)
-        
-        if not flight_obj:
-            print(f"[service.get_flight_details] Flight {flight_id} not found in API results", file=sys.stderr, flush=True)
-            return _create_error_response(
-                error_type="Flight not found",
-                message="The requested flight could not be found. Please try again or check the flight ID.",
-                airline="Flight not found",
-                aircraft_code="N/A"
-            )
-            
-        # Cache the flight object for future use
-        print(f"[service.get_flight_details] Caching flight {flight_id} for 5 minutes", file=sys.stdout, flush=True)
-        cache.set(flight_id, flight_obj, timeout=300)
-    
     # Get flight details
     try:
-        print("[service.get_flight_details] Fetching flight details...", file=sys.stdout, flush=True)
-        flight_details = fr_api.get_flight_details(flight_obj)
-        print("[service.get_flight_details] Successfully fetched flight details", file=sys.stdout, flush=True)
+        logger.debug("Fetching flight details for %s", flight_id)
+        flight_details = await upstream.client.get_flight_details(flight_id)
+    except upstream.UpstreamNotFound:
+        # Ids we hold no position for are only checked here.
+        return _flight_not_found(flight_id)
     except Exception as e:
-        error_msg = f"Failed to fetch flight details: {str(e)}"
-        print(f"[service.get_flight_details] {error_msg}", file=sys.stderr, flush=True)
-        traceback.print_exc(file=sys.stderr)
+        stale_details = cache.get(flight_id, namespace="stale_details")
+        if stale_details is not None:
+            logger.warning("Failed to fetch flight details for %s, serving last known: %s", flight_id, e)
+            metrics.stale_responses.labels("details").inc()
+            return {**stale_details, "stale": True}
+        logger.error("Failed to fetch flight details for %s: %s", flight_id, e, exc_info=True)
         return _create_error_response(
             error_type="API Error",
             message="Failed to fetch flight details. Please try again later.",
@@ -121,8 +265,11 @@ def get_flight_details_from_obj(flight_id: str):
             aircraft_code="N/A"
         )
 
+    if not flight_details:
+        return _flight_not_found(flight_id)
+
     if not isinstance(flight_details, dict):
-        print(f"[service.get_flight_details] Details for {flight_id} is not a dict, returning default structure.", file=sys.stdout, flush=True)
+        logger.warning("Details for %s is not a dict, returning default structure", flight_id)
         return {
             "airline": None,
             "aircraft_code": None,
@@ -130,9 +277,12 @@ def get_flight_details_from_obj(flight_id: str):
             "times": {"scheduled_departure": None, "scheduled_arrival": None, "duration_readable": None},
             "origin_country": None,
             "destination_country": None,
+            "origin_country_code": None,
+            "origin_country_flag": None,
+            "destination_country_code": None,
+            "destination_country_flag": None,
         }
 
-    print(f"[service.get_flight_details] Processing details for {flight_id}...", file=sys.stdout, flush=True)
 
     def get_nested(data, *keys, default=None):
         for key in keys:
@@ -164,6 +314,9 @@ def get_flight_details_from_obj(flight_id: str):
 
     origin_country = get_nested(flight_details, 'airport', 'origin', 'position', 'country', 'name')
     destination_country = get_nested(flight_details, 'airport', 'destination', 'position', 'country', 'name')
+    # Resolve by name first and fall back to the code FlightRadar24 sends alongside it.
+    origin = countries.lookup(origin_country) or countries.lookup(get_nested(flight_details, 'airport', 'origin', 'position', 'country', 'code'))
+    destination = countries.lookup(destination_country) or countries.lookup(get_nested(flight_details, 'airport', 'destination', 'position', 'country', 'code'))
 
     result = {
         "airline": airline_name,
@@ -176,18 +329,58 @@ def get_flight_details_from_obj(flight_id: str):
         },
         "origin_country": origin_country,
         "destination_country": destination_country,
+        "origin_country_code": origin.alpha2 if origin else None,
+        "origin_country_flag": origin.flag if origin else None,
+        "destination_country_code": destination.alpha2 if destination else None,
+        "destination_country_flag": destination.flag if destination else None,
     }
-    print(f"[service.get_flight_details] Processed details for {flight_id}: {result}", file=sys.stdout, flush=True)
+    logger.debug("Processed details for %s: %s", flight_id, result)
+    cache.set(flight_id, result, namespace="details")
+    cache.set(flight_id, result, namespace="stale_details")
     return result
 
-if __name__ == "__main__":
+async def get_flight_details_batch(flight_ids):
+    """
+    Resolve details for many flights at once.
+
+    Cached details are returned immediately; the rest are fetched concurrently,
+    bounded by the upstream client's concurrency limit. Failures are reported per
+    id instead of failing the batch.
+    """
+    results = {}
+    errors = {}
+    pending = []
+
+    for flight_id in dict.fromkeys(flight_ids):
+        cached_details = cache.get(flight_id, namespace="details")
+        if cached_details is not None:
+            results[flight_id] = cached_details
+        else:
+            pending.append(flight_id)
+
+    logger.debug("Batch of %d: %d cached, fetching %d concurrently", len(results) + len(pending), len(results), len(pending))
+    fetched = await asyncio.gather(*(get_flight_details_from_obj(flight_id) for flight_id in pending), return_exceptions=True)
+    for flight_id, details in zip(pending, fetched):
+        if isinstance(details, Exception):
+            logger.warning("Error fetching details for %s: %s", flight_id, details)
+            errors[flight_id] = str(details)
+        elif "error" in details:
+            errors[flight_id] = details["message"]
+        else:
+            results[flight_id] = details
+
+    return {"results": results, "errors": errors}
+
+prefetcher = DetailPrefetcher(fetch=get_flight_details_from_obj)
+
+async def _main():
     # Przykład: pobierz 10 lotów w okolicy Londynu
     lat, lon = 51.5072, -0.1276
     radius_km = 50
     limit = 10
 
     print(f"--- get_flights(lat={lat}, lon={lon}, radius_km={radius_km}, limit={limit}) ---")
-    flights_summary = get_flights(lat, lon, radius_km, limit)
+    flights_summary = await get_flights(lat, lon, radius_km, limit)
     print(f"Found {len(flights_summary)} flights:")
     for f in flights_summary:
         print({k: v for k, v in f.items() if k != "obj"})  # pokazuje dane do podglądu; pomijamy obiekt lotu
@@ -196,7 +389,12 @@ if __name__ == "__main__":
     if flights_summary:
         flight_id = flights_summary[0]['id']
         print(f"\n--- get_flight_details_from_obj for id: '{flight_id}' ---")
-        details = get_flight_details_from_obj(flight_id)
+        details = await get_flight_details_from_obj(flight_id)
         print(details)
     else:
         print("\n--- No flights found ---")
+    await upstream.client.aclose()
+
+if __name__ == "__main__":
+    log.configure()
+    asyncio.run(_main())
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ..utils import cache, log, positions
+from . import flightradar, snapshot
+
+# Zoom levels are those of web map tiles: at zoom z the world is 2**z tiles of
+# 256 px across. From this zoom on every aircraft is its own feature...
+MAP_FULL_DETAIL_ZOOM = int(os.getenv("MAP_FULL_DETAIL_ZOOM", "9"))
+# ...below it aircraft are merged on a grid of this many cells per map tile side
+# (64 px cells), and a cell holding more than one becomes a single cluster.
+MAP_CELLS_PER_TILE = 4
+# Viewports covering more snapshot tiles than this are refused; each one has to
+# be fetched from FlightRadar24 and a whole continent is better left to zoom in.
+MAP_MAX_TILES = int(os.getenv("MAP_MAX_TILES", "2000"))
+
+MEDIA_TYPE = "application/geo+json"
+
+logger = log.get_logger("maplayer")
+
+Bounds = Tuple[float, float, float, float]
+
+
+class ViewportTooLarge(ValueError):
+    """The viewport spans more snapshot tiles than MAP_MAX_TILES."""
+
+
+class Layer(NamedTuple):
+    # Encoded GeoJSON FeatureCollection.
+    body: bytes
+    version: str
+    fetched_at: float
+    updated_at: float
+    stale: bool
+
+
+def cell_size_deg(zoom: int) -> Optional[float]:
+    """Side of a clustering cell at the zoom level, or None when aircraft are shown one by one."""
+    if zoom >= MAP_FULL_DETAIL_ZOOM:
+        return None
+    return 360.0 / (2 ** zoom * MAP_CELLS_PER_TILE)
+
+
+def snap(south: float, west: float, north: float, east: float) -> Bounds:
+    """
+    The viewport widened to whole snapshot tiles, as (south, west, north, east).
+
+    Every viewport within the same tiles gets the same layer, so responses can
+    be cached per tiles and zoom level instead of per pixel of panning. A box
+    with west > east crosses the antimeridian.
+    """
+    size = snapshot.TILE_SIZE_DEG
+    row_min, col_min = snapshot.tile_key(south, west)
+    row_max, col_max = snapshot.tile_key(north, east)
+    south, north = max(row_min * size, -90.0), min((row_max + 1) * size, 90.0)
+    if east - west >= 360.0:
+        return south, -180.0, north, 180.0
+    return south, col_min * size, north, (col_max + 1) * size
+
+
+def _text(values: np.ndarray) -> List[Optional[str]]:
+    return [value.decode("utf-8", "replace") or None for value in values.tolist()]
+
+
+def _number(values: np.ndarray) -> List[Optional[int]]:
+    return [None if value == positions.MISSING else value for value in values.tolist()]
+
+
+def _aircraft(records: np.ndarray) -> List[dict]:
+    columns = zip(
+        records["longitude"].round(5).tolist(),
+        records["latitude"].round(5).tolist(),
+        _text(records["id"]),
+        _text(records["callsign"]),
+        _text(records["aircraft_code"]),
+        _number(records["altitude"]),
+        _number(records["ground_speed"]),
+        _number(records["heading"]),
+    )
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {
+                "cluster": False,
+                "id": flight_id,
+                "callsign": callsign,
+                "aircraft_code": aircraft_code,
+                "altitude_ft": altitude,
+                "speed_kts": speed,
+                "heading_deg": heading,
+            },
+        }
+        for lon, lat, flight_id, callsign, aircraft_code, altitude, speed, heading in columns
+    ]
+
+
+def _clusters(records: np.ndarray, cell_deg: float) -> List[dict]:
+    """One feature per occupied grid cell: the aircraft itself if alone, else a cluster at their mean position."""
+    cols_per_world = int(round(360.0 / cell_deg))
+    rows = np.floor((np.clip(records["latitude"], -90.0, 90.0) + 90.0) / cell_deg).astype(np.int64)
+    cols = np.floor(((records["longitude"] + 180.0) % 360.0) / cell_deg).astype(np.int64) % cols_per_world
+    _, first, inverse, counts = np.unique(rows * cols_per_world + cols, return_index=True, return_inverse=True, return_counts=True)
+    # The grid starts at the antimeridian, so no cell straddles it and longitudes average safely.
+    lats = np.bincount(inverse, weights=records["latitude"]) / counts
+    lons = np.bincount(inverse, weights=records["longitude"]) / counts
+
+    features = _aircraft(records[first[counts == 1]])
+    grouped = counts > 1
+    features.extend(
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {"cluster": True, "count": count},
+        }
+        for lon, lat, count in zip(
+            lons[grouped].round(5).tolist(), lats[grouped].round(5).tolist(), counts[grouped].tolist()
+        )
+    )
+    return features
+
+
+def features(records: np.ndarray, zoom: int) -> List[dict]:
+    """GeoJSON point features for the aircraft, clustered on the grid of the zoom level."""
+    cell_deg = cell_size_deg(zoom)
+    if cell_deg is None or not len(records):
+        return _aircraft(records)
+    return _clusters(records, cell_deg)
+
+
+async def viewport(south: float, west: float, north: float, east: float, zoom: int) -> Layer:
+    """The map layer for a viewport: every aircraft in the snapshot tiles it covers, at the zoom's level of detail."""
+    bounds = snap(south, west, north, east)
+    keys = snapshot.tiles_for_bbox(*bounds)
+    if len(keys) > MAP_MAX_TILES:
+        raise ViewportTooLarge(f"Viewport covers {len(keys)} tiles, more than {MAP_MAX_TILES}; zoom in")
+
+    records, results = await flightradar.snapshot.in_tiles(keys)
+    # Tiles only ever get newer, so the newest fetch time changes whenever any of them does.
+    newest = max(tile.fetched_at for tile in results)
+    key = (bounds, zoom, newest, results.updated_at, results.stale)
+    layer = cache.get(key, namespace="map")
+    if layer is not None:
+        return layer
+
+    layer_features = features(records, zoom)
+    collection = {
+        "type": "FeatureCollection",
+        "bbox": [bounds[1], bounds[0], bounds[3], bounds[2]],
+        "zoom": zoom,
+        "clustered": cell_size_deg(zoom) is not None,
+        "count": len(records),
+        "stale": results.stale,
+        "features": layer_features,
+    }
+    body = json.dumps(collection, separators=(",", ":")).encode()
+    layer = Layer(body, hashlib.sha1(body).hexdigest()[:16], results.fetched_at, results.updated_at, results.stale)
+    cache.set(key, layer, namespace="map")
+    logger.debug("Map layer for %s at zoom %d: %d aircraft as %d features", bounds, zoom, len(records), len(layer_features))
+    return layer
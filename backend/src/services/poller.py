@@ -0,0 +1,154 @@
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from ..utils import log
+from . import flightradar, snapshot
+from .scheduler import Priority, prioritized
+
+# Subscribed regions are refreshed from upstream at this cadence.
+POLL_INTERVAL_SECONDS = 5
+# Every aircraft in a subscribed region is streamed, so rank them with the fast
+# spherical distance instead of exact geodesics.
+POLL_DISTANCE_MODE = "haversine"
+# Deltas buffered for a slow client before it is resynced with a full snapshot.
+MAX_PENDING_DELTAS = 16
+
+logger = log.get_logger("poller")
+
+# A flight counts as moved when any of these fields change between polls.
+_TRACKED_FIELDS = ("lat", "lon", "altitude_ft", "speed_kts", "heading_deg")
+
+
+class Subscription:
+    """One client's view of a region and the delta queue feeding its stream."""
+
+    def __init__(self, lat: float, lon: float, radius_km: float):
+        self.lat = lat
+        self.lon = lon
+        self.radius_km = radius_km
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_DELTAS)
+        self.rows: Dict[str, dict] = {}
+        self.version = 0
+        # Its first poll, when it joined while the poll loop was already running.
+        self.first_poll: Optional[asyncio.Task] = None
+
+    def diff(self, rows: Dict[str, dict]) -> Optional[dict]:
+        """Compare the region's current flights with the last ones sent and return the delta."""
+        reset = not self.rows and self.version == 0
+        added = [row for flight_id, row in rows.items() if flight_id not in self.rows]
+        moved = [
+            row
+            for flight_id, row in rows.items()
+            if flight_id in self.rows
+            and any(row[field] != self.rows[flight_id][field] for field in _TRACKED_FIELDS)
+        ]
+        removed = [flight_id for flight_id in self.rows if flight_id not in rows]
+        self.rows = rows
+
+        if not (reset or added or moved or removed):
+            return None
+        self.version += 1
+        return {
+            "version": self.version,
+            "reset": reset,
+            "added": added,
+            "moved": moved,
+            "removed": removed,
+        }
+
+    def publish(self, delta: dict):
+        try:
+            self.queue.put_nowait(delta)
+        except asyncio.QueueFull:
+            # The client fell behind; drop what it hasn't read and resend everything.
+            logger.warning("Subscriber at (%s, %s) fell behind, resyncing", self.lat, self.lon)
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.rows = {}
+            self.version = 0
+
+
+class RegionPoller:
+    """
+    Background refresher for regions that have live subscribers.
+
+    Every cycle each subscribed region is read through the shared tile snapshot,
+    so regions that overlap share one upstream refresh, and each subscriber is
+    sent only the flights that were added, moved or removed since its last update.
+    The poll loop runs only while there are subscribers.
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL_SECONDS):
+        self.interval = interval
+        self._subscriptions: Set[Subscription] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, lat: float, lon: float, radius_km: float) -> Subscription:
+        subscription = Subscription(lat, lon, radius_km)
+        self._subscriptions.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        else:
+            # Don't make a new subscriber wait a full interval for its first snapshot.
+            subscription.first_poll = asyncio.create_task(self._poll(subscription))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+        if subscription.first_poll is not None:
+            subscription.first_poll.cancel()
+
+    async def stop(self):
+        for subscription in list(self._subscriptions):
+            self.unsubscribe(subscription)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _poll(self, subscription: Subscription):
+        # Dead reckoning keeps aircraft moving between refreshes, so then the region
+        # needs refreshing only as often as searches would refresh it.
+        max_age = self.interval
+        if snapshot.DEAD_RECKONING_HORIZON_SECONDS > 0:
+            max_age = max(self.interval, snapshot.TILE_TTL_SECONDS)
+        try:
+            # Interactive searches and detail lookups get upstream budget first.
+            with prioritized(Priority.BACKGROUND):
+                matches = await flightradar.snapshot.within(
+                    subscription.lat,
+                    subscription.lon,
+                    subscription.radius_km,
+                    mode=POLL_DISTANCE_MODE,
+                    max_age=max_age,
+                )
+        except Exception as e:
+            logger.warning("Error refreshing region (%s, %s): %s", subscription.lat, subscription.lon, e)
+            return
+
+        rows = {
+            flight.id: flightradar.summarize_flight(flight, distance_km)
+            for flight, distance_km in matches
+            if flight.id
+        }
+        delta = subscription.diff(rows)
+        if delta is not None:
+            subscription.publish(delta)
+
+    async def _run(self):
+        logger.info("Starting region poller")
+        while self._subscriptions:
+            subscriptions: List[Subscription] = list(self._subscriptions)
+            await asyncio.gather(*(self._poll(subscription) for subscription in subscriptions))
+            await asyncio.sleep(self.interval)
+        logger.info("No subscribers left, stopping region poller")
+
+
+poller = RegionPoller()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Iterable, List, Optional, Set
+
+from ..utils import cache, log, metrics
+from .scheduler import Priority, TokenBucket, prioritized
+
+# Details are prefetched for this many of the closest results of every search; 0 disables it.
+PREFETCH_TOP_K = int(os.getenv("DETAILS_PREFETCH_K", "5"))
+# Concurrent prefetches, and the upstream requests per second they may spend between them.
+PREFETCH_WORKERS = int(os.getenv("DETAILS_PREFETCH_WORKERS", "2"))
+PREFETCH_RATE_PER_SECOND = float(os.getenv("DETAILS_PREFETCH_RATE", "2"))
+PREFETCH_BURST = 10
+# Ids beyond this many waiting are dropped rather than queued behind stale searches.
+PREFETCH_QUEUE_SIZE = 100
+
+logger = log.get_logger("prefetch")
+
+
+class DetailPrefetcher:
+    """
+    Background warm-up of the details cache for flights a user is likely to open next.
+
+    Ids are queued after a search and fetched by a small pool of workers at
+    background priority, within their own request budget, so prefetching only
+    uses upstream capacity interactive requests leave idle. Ids already cached,
+    queued or being fetched are skipped, and a full queue drops new ids.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[object]],
+        top_k: int = PREFETCH_TOP_K,
+        workers: int = PREFETCH_WORKERS,
+        rate: float = PREFETCH_RATE_PER_SECOND,
+        queue_size: int = PREFETCH_QUEUE_SIZE,
+    ):
+        self._fetch = fetch
+        self.top_k = top_k
+        self.workers = workers
+        self.queue_size = queue_size
+        self._budget = TokenBucket(rate, PREFETCH_BURST)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Ids queued or being fetched.
+        self._pending: Set[str] = set()
+
+    def _start(self):
+        # Workers are bound to the loop they were started on; start afresh on a new one.
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._pending.clear()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info("Started %d detail prefetch worker(s) for the top %d results", self.workers, self.top_k)
+
+    def enqueue(self, flight_ids: Iterable[Optional[str]]):
+        """Queue details for the first top_k ids; returns immediately."""
+        if self.top_k <= 0 or self.workers <= 0:
+            return
+        self._start()
+        for flight_id in list(flight_ids)[:self.top_k]:
+            if not flight_id or flight_id in self._pending or cache.contains(flight_id, namespace="details"):
+                metrics.details_prefetch.labels("skipped").inc()
+                continue
+            try:
+                self._queue.put_nowait(flight_id)
+            except asyncio.QueueFull:
+                metrics.details_prefetch.labels("dropped").inc()
+                continue
+            self._pending.add(flight_id)
+            metrics.details_prefetch.labels("queued").inc()
+
+    async def _work(self):
+        while True:
+            flight_id = await self._queue.get()
+            try:
+                # A user may have opened it while it waited in the queue.
+                if cache.contains(flight_id, namespace="details"):
+                    metrics.details_prefetch.labels("skipped").inc()
+                    continue
+                while not self._budget.take():
+                    await asyncio.sleep(self._budget.wait_time())
+                with prioritized(Priority.BACKGROUND):
+                    details = await self._fetch(flight_id)
+                # Lookups report upstream failures in the result rather than raising.
+                failed = isinstance(details, dict) and "error" in details
+                metrics.details_prefetch.labels("failed" if failed else "fetched").inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.details_prefetch.labels("failed").inc()
+                logger.debug("Prefetching details for %s failed: %s", flight_id, e)
+            finally:
+                self._pending.discard(flight_id)
+                self._queue.task_done()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+        self._pending.clear()
@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+
+from ..utils import log, metrics
+
+logger = log.get_logger("scheduler")
+
+
+class Priority(IntEnum):
+    """Order in which queued upstream requests are let through; lower goes first."""
+
+    DETAILS = 0
+    SEARCH = 1
+    BACKGROUND = 2
+
+
+# Overrides the per-operation default for every upstream call made in this context.
+current_priority: contextvars.ContextVar[Optional[Priority]] = contextvars.ContextVar("upstream_priority", default=None)
+
+
+@contextmanager
+def prioritized(priority: Priority):
+    """Run the block's upstream calls at the given priority, e.g. BACKGROUND for polling."""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class Rejected(Exception):
+    """The scheduler refused a request instead of letting it wait any longer."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, in bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self) -> bool:
+        if math.isinf(self.rate):
+            return True
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Seconds until the next token is available."""
+        if math.isinf(self.rate):
+            return 0.0
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Stops calling upstream after a burst of consecutive failures.
+
+    Once `failure_threshold` requests in a row fail the circuit opens and every
+    request is rejected for `reset_seconds`. After that a single probe is let
+    through: if it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        state = self.state
+        metrics.upstream_circuit.state(state)
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        # A probe that never reported back (e.g. it was cancelled) doesn't block the next one.
+        now = time.monotonic()
+        if self._probe_started is None or now - self._probe_started >= self.reset_seconds:
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info("Upstream recovered, closing circuit")
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+        metrics.upstream_circuit.state(self.CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probe_started is not None or (self._opened_at is None and self._failures >= self.failure_threshold):
+            logger.warning("Opening upstream circuit for %.0fs after %d consecutive failure(s)", self.reset_seconds, self._failures)
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+            metrics.upstream_circuit.state(self.OPEN)
+
+
+class Scheduler:
+    """
+    Admission control for upstream requests.
+
+    A request needs a token from the rate budget and a free concurrency slot.
+    When either is short, requests queue and are let through in priority order
+    (then arrival order) as tokens refill and slots free up. A request that
+    waits longer than `queue_timeout` is rejected so callers can fall back to
+    cached data instead of holding their client.
+    """
+
+    def __init__(self, rate: float, burst: float, max_concurrency: int, queue_timeout: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        # The queue entry of each waiting task, so promote() can find it.
+        self._queued: Dict[asyncio.Task, Tuple[int, int, asyncio.Future]] = {}
+        self._arrivals = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, priority: Priority):
+        if not self._waiters and self._in_flight < self.max_concurrency and self.bucket.take():
+            self._in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._arrivals), future)
+        heapq.heappush(self._waiters, entry)
+        task = asyncio.current_task()
+        self._queued[task] = entry
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Rejected("queue_timeout", self.bucket.wait_time()) from None
+        except asyncio.CancelledError:
+            # Granted a slot in the same step the caller was cancelled; hand it on.
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self._queued.pop(task, None)
+
+    def promote(self, task: asyncio.Task, priority: Priority):
+        """Move the request `task` is queued with, if any, up to `priority`, keeping its place among equals."""
+        entry = self._queued.get(task)
+        if entry is None or priority >= entry[0]:
+            return
+        # The old entry stays in the heap and is dropped once its future is done.
+        entry = self._queued[task] = (priority, entry[1], entry[2])
+        heapq.heappush(self._waiters, entry)
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters and self._in_flight < self.max_concurrency:
+            future = self._waiters[0][2]
+            if future.done():
+                # Timed out or cancelled while queued.
+                heapq.heappop(self._waiters)
+                continue
+            if not self.bucket.take():
+                self._wake_in(self.bucket.wait_time())
+                return
+            heapq.heappop(self._waiters)
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _wake_in(self, delay: float):
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
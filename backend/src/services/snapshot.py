@@ -0,0 +1,483 @@
+import asyncio
+import math
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..utils import geo, log, metrics, positions, shared
+from ..utils.spatial import SpatialIndex
+from .scheduler import Priority, prioritized
+
+# Size of one snapshot tile in degrees. A 100 km search circle touches at most
+# a handful of 1° tiles, and a whole tile is cheap to fetch from FlightRadar24.
+TILE_SIZE_DEG = 1.0
+# Searches get a tile straight from the snapshot until it is this old; after that
+# it is still served while one background refresh brings it up to date...
+TILE_TTL_SECONDS = 20
+# ...until it is this old, when searches wait for the refresh instead.
+TILE_HARD_TTL_SECONDS = 60
+# When a refresh fails, tiles up to this old are still served, flagged as stale.
+STALE_MAX_AGE_SECONDS = 600
+
+# Between refreshes, aircraft are moved along their heading at their ground speed
+# from their last report, for at most this long; 0 serves reported positions.
+DEAD_RECKONING_HORIZON_SECONDS = float(os.getenv("DEAD_RECKONING_HORIZON", "60"))
+# Positions are projected to whole steps, so searches within a step agree and can be cached.
+DEAD_RECKONING_STEP_SECONDS = 1
+# Ground speeds stay below this, which bounds how far an aircraft can have moved.
+MAX_GROUND_SPEED_KM_S = 0.4
+
+# Stale tiles this many tiles apart or closer are fetched with one upstream call
+# over their bounding box; fetching the gap costs less than another request.
+TILE_GROUP_GAP = 4
+_GROUP_STEPS = range(-TILE_GROUP_GAP - 1, TILE_GROUP_GAP + 2)
+
+KM_PER_DEG_LAT = 111.32
+
+logger = log.get_logger("snapshot")
+
+TileKey = Tuple[int, int]
+
+
+class _Tile:
+    __slots__ = ("refreshing", "view", "fetched_at")
+
+    def __init__(self):
+        # Set while a search is fetching this tile; other searches wait on it.
+        self.refreshing: Optional[asyncio.Future] = None
+        # (flights, index) swapped as one object so readers never see a mismatched pair.
+        self.view: Tuple[positions.Positions, SpatialIndex] = (positions.Positions(positions.empty()), SpatialIndex([], []))
+        self.fetched_at = 0.0
+
+    def replace(self, records: np.ndarray, fetched_at: float):
+        # Index the record columns in place; flights are decoded only when returned.
+        self.view = (positions.Positions(records), SpatialIndex(records["latitude"], records["longitude"]))
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, now: float, max_age: float) -> bool:
+        return now - self.fetched_at < max_age
+
+
+class Results(list):
+    """
+    Search results plus the age of the tiles behind them: when the oldest was
+    fetched, when the newest was, and whether they outlived a failed refresh.
+    """
+
+    __slots__ = ("fetched_at", "updated_at", "stale")
+
+    def __init__(self, items=(), fetched_at: float = 0.0, updated_at: float = 0.0, stale: bool = False):
+        super().__init__(items)
+        self.fetched_at = fetched_at
+        self.updated_at = updated_at
+        self.stale = stale
+
+    def like(self, items) -> "Results":
+        """New results over other items, from the same tiles."""
+        return Results(items, self.fetched_at, self.updated_at, self.stale)
+
+
+def tile_key(lat: float, lon: float) -> TileKey:
+    """Return the (row, col) of the tile containing the given point."""
+    lon = (lon + 180.0) % 360.0 - 180.0
+    row = math.floor(min(max(lat, -90.0), 90.0 - 1e-9) / TILE_SIZE_DEG)
+    col = math.floor(lon / TILE_SIZE_DEG)
+    return row, col
+
+
+def tile_keys(lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """tile_key() over arrays of points: the rows and the columns of their tiles."""
+    lons = (lons + 180.0) % 360.0 - 180.0
+    rows = np.floor(np.clip(lats, -90.0, 90.0 - 1e-9) / TILE_SIZE_DEG).astype(np.int64)
+    cols = np.floor(lons / TILE_SIZE_DEG).astype(np.int64)
+    return rows, cols
+
+
+def _projection_time() -> Optional[float]:
+    """The step positions are dead-reckoned to, or None when it is disabled."""
+    if DEAD_RECKONING_HORIZON_SECONDS <= 0:
+        return None
+    return math.floor(time.time() / DEAD_RECKONING_STEP_SECONDS) * DEAD_RECKONING_STEP_SECONDS
+
+
+def _reach_km() -> float:
+    """How far dead reckoning can move an aircraft from where it was reported."""
+    return max(DEAD_RECKONING_HORIZON_SECONDS, 0.0) * MAX_GROUND_SPEED_KM_S
+
+
+def tiles_for_circle(lat: float, lon: float, radius_km: float) -> List[TileKey]:
+    """Return every tile intersecting the bounding box of a search circle."""
+    dlat = radius_km * (1.0 + geo.SPHERICAL_ERROR) / KM_PER_DEG_LAT
+    cos_lat = max(math.cos(math.radians(min(abs(lat) + dlat, 90.0))), 0.01)
+    dlon = min(dlat / cos_lat, 180.0)
+
+    row_min, _ = tile_key(max(lat - dlat, -90.0), lon)
+    row_max, _ = tile_key(min(lat + dlat, 90.0), lon)
+
+    cols_per_world = int(round(360.0 / TILE_SIZE_DEG))
+    first_col = math.floor((lon - dlon + 180.0) / TILE_SIZE_DEG)
+    last_col = math.floor((lon + dlon + 180.0) / TILE_SIZE_DEG)
+    cols = sorted({c % cols_per_world - cols_per_world // 2 for c in range(first_col, last_col + 1)})
+
+    return [(row, col) for row in range(row_min, row_max + 1) for col in cols]
+
+
+def tiles_for_bbox(south: float, west: float, north: float, east: float) -> List[TileKey]:
+    """Return every tile intersecting the box. A box with west > east crosses the antimeridian."""
+    row_min, col_min = tile_key(south, west)
+    row_max, col_max = tile_key(north, east)
+    cols_per_world = int(round(360.0 / TILE_SIZE_DEG))
+    if col_max < col_min or (col_max == col_min and west > east):
+        col_max += cols_per_world
+    half = cols_per_world // 2
+    cols = sorted({(col + half) % cols_per_world - half for col in range(col_min, col_max + 1)})
+    return [(row, col) for row in range(row_min, row_max + 1) for col in cols]
+
+
+def _tile_bounds(keys: List[TileKey]) -> str:
+    """
+    FlightRadar24 bounds string ("top,bottom,left,right") covering the tiles.
+
+    Tiles on both sides of the antimeridian would get a box spanning the whole
+    world the long way round; _tile_groups() never puts them together.
+    """
+    top = (max(row for row, _ in keys) + 1) * TILE_SIZE_DEG
+    bottom = min(row for row, _ in keys) * TILE_SIZE_DEG
+    left = min(col for _, col in keys) * TILE_SIZE_DEG
+    right = (max(col for _, col in keys) + 1) * TILE_SIZE_DEG
+    return f"{min(top, 90.0)},{max(bottom, -90.0)},{left},{right}"
+
+
+def _tile_groups(keys: List[TileKey]) -> List[List[TileKey]]:
+    """
+    Split tiles into groups fetched together: tiles up to TILE_GROUP_GAP tiles apart share a group.
+
+    Columns don't wrap around, so tiles either side of the antimeridian always
+    end up in separate groups.
+    """
+    remaining = set(keys)
+    groups = []
+    while remaining:
+        group, stack = [], [remaining.pop()]
+        while stack:
+            row, col = stack.pop()
+            group.append((row, col))
+            for neighbour in [(row + d_row, col + d_col) for d_row in _GROUP_STEPS for d_col in _GROUP_STEPS]:
+                if neighbour in remaining:
+                    remaining.remove(neighbour)
+                    stack.append(neighbour)
+        groups.append(sorted(group))
+    return groups
+
+
+def _unique_ids(records: np.ndarray) -> np.ndarray:
+    """The records less repeats of an aircraft, which overlapping bounding boxes both return."""
+    _, first = np.unique(records["id"], return_index=True)
+    return records[np.sort(first)]
+
+
+class TileSnapshot:
+    """
+    Shared per-tile snapshot of aircraft positions.
+
+    Every search reads from the tiles its circle covers. Stale tiles are refreshed
+    with a single upstream call and concurrent searches needing the same tiles
+    wait for that result instead of issuing their own request. Tiles past their
+    soft TTL are served as they are and refreshed in the background; only tiles
+    past the hard TTL, or never fetched, make a search wait.
+
+    With a shared TileStore the same holds across worker processes: a tile is
+    refreshed by the one worker holding its lock, and the others map the
+    records it wrote instead of fetching the tile themselves. on_refresh sees
+    the records a worker fetched, on_adopt those it took over from another.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[np.ndarray]],
+        on_refresh: Callable[[np.ndarray], None] = None,
+        store: Optional[shared.TileStore] = None,
+        on_adopt: Callable[[np.ndarray], None] = None,
+    ):
+        self._fetch = fetch
+        self._on_refresh = on_refresh
+        self._on_adopt = on_adopt
+        self._store = store
+        self._tiles: Dict[TileKey, _Tile] = {}
+        # Tiles with a background refresh scheduled, and the tasks running them.
+        self._revalidating: Set[TileKey] = set()
+        self._background: Set[asyncio.Task] = set()
+
+    def _tile(self, key: TileKey) -> _Tile:
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = self._tiles[key] = _Tile()
+        return tile
+
+    def clear(self):
+        """Drop every tile so the next search refetches from upstream."""
+        self._tiles.clear()
+        if self._store is not None:
+            self._store.clear()
+        self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.snapshot_tiles.set(len(self._tiles))
+        metrics.snapshot_aircraft.set(sum(len(tile.view[0]) for tile in list(self._tiles.values())))
+
+    async def _refresh(self, keys: List[TileKey], max_age: float):
+        # A search fetches only the stale tiles nobody else is fetching and waits
+        # for the rest, so it never holds one tile while blocked on another and
+        # overlapping searches don't queue up behind each other.
+        done = set()
+        while True:
+            now = time.time()
+            claimed, waiting = [], []
+            for key in keys:
+                tile = self._tile(key)
+                if key in done or tile.is_fresh(now, max_age) or self._adopt(key, tile, now, max_age):
+                    continue
+                if tile.refreshing is not None:
+                    waiting.append(tile.refreshing)
+                else:
+                    claimed.append(key)
+
+            if claimed:
+                done.update(await self._fetch_tiles(claimed, max_age))
+            elif waiting:
+                # A failed refresh leaves its tiles stale; the next pass claims them.
+                await asyncio.wait(waiting)
+            else:
+                return
+
+    def _adopt(self, key: TileKey, tile: _Tile, now: float, max_age: float) -> bool:
+        """Take over a newer copy of the tile written by another worker; True if it is fresh."""
+        if self._store is None:
+            return False
+        found = self._store.read(key)
+        if found is None or found[1] <= tile.fetched_at:
+            return False
+        tile.replace(*found)
+        if self._on_adopt is not None:
+            self._on_adopt(found[0])
+        return tile.is_fresh(now, max_age)
+
+    async def _fetch_tiles(self, keys: List[TileKey], max_age: float) -> List[TileKey]:
+        """Refresh the tiles from upstream and return the keys that were refreshed."""
+        tiles = {key: self._tile(key) for key in keys}
+        refreshing = asyncio.get_running_loop().create_future()
+        for tile in tiles.values():
+            tile.refreshing = refreshing
+        locked = []
+        try:
+            if self._store is not None:
+                # Fetch only the tiles no other worker is refreshing, and skip any
+                # that one finished between our freshness check and taking the lock.
+                locked = [key for key in keys if self._store.try_lock(key)]
+                now = time.time()
+                keys = [key for key in locked if not self._adopt(key, tiles[key], now, max_age)]
+                if not keys:
+                    if not locked:
+                        await asyncio.sleep(shared.LOCK_POLL_SECONDS)
+                    return []
+
+            # Tiles far apart are fetched separately rather than as one box spanning the distance.
+            groups = _tile_groups(keys)
+            for group in groups:
+                logger.debug("Fetching %d tile(s) with bounds: %s", len(group), _tile_bounds(group))
+            records = await asyncio.gather(*(self._fetch(_tile_bounds(group)) for group in groups))
+            records = records[0] if len(groups) == 1 else _unique_ids(np.concatenate(records))
+
+            found = positions.located(records)
+            if not found.all():
+                logger.debug("Skipped %d flight(s) without coordinates", len(records) - int(found.sum()))
+                records = records[found]
+            rows, cols = tile_keys(records["latitude"], records["longitude"])
+
+            fetched_at = time.time()
+            for key in keys:
+                tile_records = records[(rows == key[0]) & (cols == key[1])]
+                if self._store is not None:
+                    self._store.write(key, tile_records, fetched_at)
+                tiles[key].replace(tile_records, fetched_at)
+
+            self._update_gauges()
+            if self._on_refresh is not None:
+                self._on_refresh(records)
+            return keys
+        finally:
+            for key in locked:
+                self._store.unlock(key)
+            for tile in tiles.values():
+                tile.refreshing = None
+            refreshing.set_result(None)
+
+    def _revalidate(self, keys: List[TileKey]):
+        keys = [key for key in keys if key not in self._revalidating]
+        if not keys:
+            return
+        self._revalidating.update(keys)
+        # Nobody waits on this refresh, so it queues behind interactive upstream calls.
+        with prioritized(Priority.BACKGROUND):
+            task = asyncio.create_task(self._refresh_in_background(keys))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _refresh_in_background(self, keys: List[TileKey]):
+        try:
+            await self._refresh(keys, TILE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning("Background refresh of %d tile(s) failed: %s", len(keys), e)
+        finally:
+            self._revalidating.difference_update(keys)
+
+    async def _fresh(self, keys: List[TileKey], max_age: Optional[float] = None) -> bool:
+        """
+        Refresh the tiles if expired; True if a refresh failed and they are served stale.
+
+        Without an explicit max_age tiles are served stale-while-revalidate;
+        with one, any tile older than that is refreshed before returning.
+        """
+        if max_age is None:
+            max_age = max(TILE_HARD_TTL_SECONDS, TILE_TTL_SECONDS)
+            now = time.time()
+            servable = [key for key in keys if self._tile(key).is_fresh(now, max_age)]
+            self._revalidate([key for key in servable if not self._tiles[key].is_fresh(now, TILE_TTL_SECONDS)])
+        now = time.time()
+        if all(self._tile(key).is_fresh(now, max_age) for key in keys):
+            return False
+        try:
+            await self._refresh(keys, max_age)
+        except Exception as e:
+            oldest = min(self._tile(key).fetched_at for key in keys)
+            if time.time() - oldest > STALE_MAX_AGE_SECONDS:
+                raise
+            logger.warning("Refresh failed, serving tiles up to %.0fs old: %s", time.time() - oldest, e)
+            metrics.stale_responses.labels("search").inc()
+            return True
+        return False
+
+    def _results(self, keys: List[TileKey], stale: bool) -> Results:
+        tiles = [self._tile(key) for key in keys]
+        return Results(tiles, min(tile.fetched_at for tile in tiles), max(tile.fetched_at for tile in tiles), stale)
+
+    async def _fresh_tiles(self, lat: float, lon: float, radius_km: float, max_age: Optional[float] = None) -> Results:
+        """The tiles covering the circle, refreshed if expired, or served stale if the refresh fails."""
+        keys = tiles_for_circle(lat, lon, radius_km)
+        stale = await self._fresh(keys, max_age)
+        return self._results(keys, stale)
+
+    async def get_flights(self, lat: float, lon: float, radius_km: float) -> Results:
+        """Return every cached flight in the tiles covering the search circle."""
+        tiles = await self._fresh_tiles(lat, lon, radius_km)
+        flights = tiles.like(())
+        for tile in tiles:
+            flights.extend(tile.view[0])
+        return flights
+
+    async def in_tiles(self, keys: List[TileKey]) -> Tuple[np.ndarray, Results]:
+        """Copies of every record in the tiles, at their current positions, and the tiles behind them."""
+        stale = await self._fresh(keys)
+        tiles = self._results(keys, stale)
+        records = np.concatenate([tile.view[0].records for tile in tiles])
+        as_of = _projection_time()
+        if as_of is not None and len(records):
+            reported = np.concatenate([np.full(len(tile.view[0]), tile.fetched_at) for tile in tiles])
+            positions.dead_reckon(records, reported, as_of, DEAD_RECKONING_HORIZON_SECONDS)
+            tiles.updated_at = max(tiles.updated_at, as_of)
+        return records, tiles
+
+    def _gather(self, queries: List[Tuple[Results, float, float, float]]) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        Copies of the records that may be within range of any (tiles, lat, lon,
+        radius_km) query, at their current positions, and for each query the
+        indices of its candidates among them.
+
+        Aircraft in a tile several queries share are copied once. With dead
+        reckoning the circles are widened by how far an aircraft can have moved,
+        the candidates are projected to now, and the results are marked as
+        updated at the projection time. Only tiles covering the circles
+        themselves are searched: widening those too would fetch more from
+        upstream just to find aircraft near the edge a few seconds before their
+        next report would.
+        """
+        as_of = _projection_time()
+        reach_km = _reach_km() if as_of is not None else 0.0
+        found: List[List[Tuple[_Tile, np.ndarray]]] = []
+        rows_by_tile: Dict[_Tile, List[np.ndarray]] = {}
+        for tiles, lat, lon, radius_km in queries:
+            query_found = [(tile, tile.view[1].near(lat, lon, radius_km + reach_km)) for tile in tiles]
+            for tile, rows in query_found:
+                rows_by_tile.setdefault(tile, []).append(rows)
+            found.append(query_found)
+
+        records, reported, union, starts = [], [], {}, {}
+        start = 0
+        for tile, tile_rows in rows_by_tile.items():
+            rows = union[tile] = tile_rows[0] if len(tile_rows) == 1 else np.unique(np.concatenate(tile_rows))
+            starts[tile] = start
+            records.append(tile.view[0].records[rows])
+            reported.append(np.full(len(rows), tile.fetched_at))
+            start += len(rows)
+        records = np.concatenate(records) if records else positions.empty()
+        if as_of is not None and len(records):
+            positions.dead_reckon(records, np.concatenate(reported), as_of, DEAD_RECKONING_HORIZON_SECONDS)
+            for tiles, *_ in queries:
+                tiles.updated_at = max(tiles.updated_at, as_of)
+
+        indices = []
+        for query_found in found:
+            # A tile only one query touched kept that query's rows in order.
+            parts = [
+                starts[tile] + (np.arange(len(rows)) if union[tile] is rows else np.searchsorted(union[tile], rows))
+                for tile, rows in query_found
+            ]
+            indices.append(np.concatenate(parts) if parts else np.empty(0, dtype=np.intp))
+        return records, indices
+
+    async def nearest(self, lat: float, lon: float, radius_km: float, k: int, mode: str = "geodesic") -> Results:
+        """Return up to k (flight, distance_km) pairs within radius_km, nearest first."""
+        return (await self.nearest_many([(lat, lon, radius_km, k)], mode))[0]
+
+    async def nearest_many(self, queries: List[Tuple[float, float, float, int]], mode: str = "geodesic") -> List[Results]:
+        """
+        nearest() for each (lat, lon, radius_km, k) query, answered together.
+
+        The tiles under every circle are refreshed at once, touching tiles with
+        one upstream call between them, and their aircraft are gathered and
+        projected once for all the queries. A failed refresh flags every
+        query's results as stale.
+        """
+        # Candidates from every tile are ranked together so exact geodesics are
+        # only computed for the overall top k, not for each tile's own top k.
+        with metrics.timed(metrics.search_stage_duration, stage="refresh"):
+            keys = [tiles_for_circle(lat, lon, radius_km) for lat, lon, radius_km, _ in queries]
+            stale = await self._fresh(list(dict.fromkeys(key for query_keys in keys for key in query_keys)))
+            tiles = [self._results(query_keys, stale) for query_keys in keys]
+
+        with metrics.timed(metrics.search_stage_duration, stage="rank"):
+            records, candidates = self._gather(
+                [(query_tiles, lat, lon, radius_km) for query_tiles, (lat, lon, radius_km, _) in zip(tiles, queries)]
+            )
+            matches = []
+            for query_tiles, rows, (lat, lon, radius_km, k) in zip(tiles, candidates, queries):
+                indices, distances = geo.nearest(
+                    lat, lon, records["latitude"][rows], records["longitude"][rows], k, max_km=radius_km, mode=mode
+                )
+                # Only the k returned flights get a view; the candidates stay plain records.
+                matches.append(query_tiles.like(zip(positions.Positions(records[rows[indices]]), distances.tolist())))
+        return matches
+
+    async def within(
+        self, lat: float, lon: float, radius_km: float, mode: str = "geodesic", max_age: Optional[float] = None
+    ) -> Results:
+        """Return every (flight, distance_km) pair within radius_km, nearest first."""
+        tiles = await self._fresh_tiles(lat, lon, radius_km, max_age)
+        # A lone query's candidates are all the gathered records.
+        records, _ = self._gather([(tiles, lat, lon, radius_km)])
+        indices, distances = geo.nearest(
+            lat, lon, records["latitude"], records["longitude"], len(records), max_km=radius_km, mode=mode
+        )
+        return tiles.like(zip(positions.Positions(records[indices]), distances.tolist()))
@@ -0,0 +1,380 @@
+import asyncio
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..utils import geo, log, metrics, positions, shared
+
+# Recent positions kept per aircraft; 180 covers half an hour at a 10 s cadence.
+TRACK_POINTS = int(os.getenv("TRACK_POINTS", "180"))
+# Aircraft with a ring buffer at once. When all are taken, the ones gone longest are recycled.
+TRACK_MAX_AIRCRAFT = int(os.getenv("TRACK_MAX_AIRCRAFT", "10000"))
+# New points are written out as a segment file this often...
+TRACK_FLUSH_SECONDS = float(os.getenv("TRACK_FLUSH_SECONDS", "60"))
+# ...and segments are deleted once they are this old, which bounds the replay window.
+TRACK_RETENTION_SECONDS = float(os.getenv("TRACK_RETENTION_SECONDS", "3600"))
+# Segment files live next to the rest of the shared state, so every worker replays all of them.
+TRACK_DIR = os.getenv("TRACK_DIR") or (
+    os.path.join(shared.SHARED_DIR, "tracks") if shared.SHARED_DIR else os.path.join(tempfile.gettempdir(), "flight-tower-tracks")
+)
+
+# One observed position. Speed and heading fit in 16 bits; missing values are -1.
+POINT_DTYPE = np.dtype(
+    [
+        ("time", "<u4"),
+        ("lat", "<f4"),
+        ("lon", "<f4"),
+        ("altitude", "<i4"),
+        ("speed", "<i2"),
+        ("heading", "<i2"),
+    ]
+)
+# A point in a segment also names its aircraft.
+SEGMENT_DTYPE = np.dtype([("id", "S16")] + [(name, POINT_DTYPE[name]) for name in POINT_DTYPE.names])
+_MISSING = -1
+# Recycled at once when the ring buffers are full, so eviction isn't a scan per new aircraft.
+_EVICT_FRACTION = 0.05
+# Last-seen mark of aircraft in the batch being recorded, which are never recycled.
+_PINNED = np.iinfo(np.uint32).max
+
+_MAGIC = b"FTTRACK1\n"
+_ALIGN = 8
+_SUFFIX = ".seg"
+
+logger = log.get_logger("tracks")
+
+
+def _data_start(header_size: int) -> int:
+    start = len(_MAGIC) + 4 + header_size
+    return start + -start % _ALIGN
+
+
+def _write_segment(path: str, points: np.ndarray):
+    """Write points as one column per field behind a JSON header."""
+    header = {"count": len(points), "columns": {}}
+    offset = 0
+    for name in SEGMENT_DTYPE.names:
+        offset += -offset % _ALIGN
+        header["columns"][name] = {"dtype": SEGMENT_DTYPE[name].str, "offset": offset}
+        offset += len(points) * SEGMENT_DTYPE[name].itemsize
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    data_start = _data_start(len(header_bytes))
+
+    with open(path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for name in SEGMENT_DTYPE.names:
+            f.write(b"\0" * (data_start + header["columns"][name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(points[name]).tobytes())
+
+
+def _read_segment(path: str) -> Optional[Dict[str, np.ndarray]]:
+    """Map a segment's columns in place, or None if it has been deleted or isn't a segment."""
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    if buffer[:len(_MAGIC)] != _MAGIC:
+        return None
+    (header_size,) = struct.unpack_from("<I", buffer, len(_MAGIC))
+    start = len(_MAGIC) + 4
+    header = json.loads(buffer[start:start + header_size])
+    data_start = _data_start(header_size)
+    return {
+        name: np.frombuffer(buffer, dtype=column["dtype"], count=header["count"], offset=data_start + column["offset"])
+        for name, column in header["columns"].items()
+    }
+
+
+def _segment_window(name: str):
+    """(first, last) observation time encoded in a segment file name."""
+    first, last, _ = name[:-len(_SUFFIX)].split("-", 2)
+    return int(first), int(last)
+
+
+def _small(values: np.ndarray) -> np.ndarray:
+    return np.where(values == positions.MISSING, _MISSING, values).astype(np.int16)
+
+
+class TrackStore:
+    """
+    Recent positions of every aircraft seen, for trails and replays.
+
+    Each aircraft owns one row of fixed-size ring buffers, a column per field,
+    so appending a whole refresh is a handful of array writes and memory stays
+    constant however long the service runs. Points older than an aircraft's
+    last one are dropped, so overlapping refreshes don't repeat it.
+
+    Appended points are also queued and periodically written, off the event
+    loop, as an immutable segment file. Segments are memory-mapped to answer
+    region replays, restore the ring buffers after a restart and are deleted
+    once they fall out of the retention window.
+    """
+
+    def __init__(
+        self,
+        directory: str = TRACK_DIR,
+        points: int = TRACK_POINTS,
+        max_aircraft: int = TRACK_MAX_AIRCRAFT,
+        flush_interval: float = TRACK_FLUSH_SECONDS,
+        retention: float = TRACK_RETENTION_SECONDS,
+    ):
+        self.directory = directory
+        self.points = points
+        self.max_aircraft = max_aircraft
+        self.flush_interval = flush_interval
+        self.retention = retention
+        os.makedirs(directory, exist_ok=True)
+
+        self._columns = {name: np.zeros((max_aircraft, points), dtype=POINT_DTYPE[name]) for name in POINT_DTYPE.names}
+        self._heads = np.zeros(max_aircraft, dtype=np.int32)
+        self._counts = np.zeros(max_aircraft, dtype=np.int32)
+        self._last_seen = np.zeros(max_aircraft, dtype=np.uint32)
+        self._slots: Dict[bytes, int] = {}
+        self._ids: List[Optional[bytes]] = [None] * max_aircraft
+        self._free = list(range(max_aircraft - 1, -1, -1))
+
+        # Points not yet in a segment, and the batch being written; guarded by _lock
+        # because flushes and replays run in worker threads.
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: List[np.ndarray] = []
+        self._flushing: Optional[np.ndarray] = None
+        self._mapped: Dict[str, Dict[str, np.ndarray]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _evict(self):
+        candidates = np.flatnonzero(self._last_seen != _PINNED)
+        count = min(max(1, int(self.max_aircraft * _EVICT_FRACTION)), len(candidates))
+        oldest = candidates[np.argpartition(self._last_seen[candidates], count - 1)[:count]]
+        for slot in oldest.tolist():
+            del self._slots[self._ids[slot]]
+            self._ids[slot] = None
+            self._free.append(slot)
+        logger.debug("Track buffers full, recycled the %d aircraft gone longest", count)
+
+    def _slot(self, flight_id: bytes) -> int:
+        slot = self._slots.get(flight_id)
+        if slot is None:
+            if not self._free:
+                self._evict()
+            slot = self._free.pop()
+            self._slots[flight_id] = slot
+            self._ids[slot] = flight_id
+            self._heads[slot] = 0
+            self._counts[slot] = 0
+        self._last_seen[slot] = _PINNED
+        return slot
+
+    def _record(self, points: np.ndarray) -> np.ndarray:
+        """Write points into the ring buffers, each aircraft's in time order; returns the ones that were new."""
+        points = points[points["id"] != b""]
+        # A batch holds every aircraft at most once, except when restoring; there,
+        # write each aircraft's first point in one pass, its second in the next...
+        order = np.lexsort((points["time"], points["id"]))
+        ids = points["id"][order]
+        firsts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ranks = np.arange(len(ids)) - np.repeat(firsts, np.diff(np.r_[firsts, len(ids)]))
+        passes = [self._record_once(points[order[ranks == rank]]) for rank in range(int(ranks.max()) + 1 if len(ranks) else 0)]
+        return np.concatenate(passes) if passes else points
+
+    def _record_once(self, points: np.ndarray) -> np.ndarray:
+        if len(points) > self.max_aircraft:
+            logger.warning("Recording %d aircraft with track buffers for %d, dropping the rest", len(points), self.max_aircraft)
+            points = points[:self.max_aircraft]
+        slots = np.fromiter((self._slot(flight_id) for flight_id in points["id"].tolist()), dtype=np.int64, count=len(points))
+        self._last_seen[slots] = points["time"]
+        heads = self._heads[slots]
+        latest = self._columns["time"][slots, (heads - 1) % self.points]
+        new = (self._counts[slots] == 0) | (points["time"] > latest)
+        points, slots, heads = points[new], slots[new], heads[new]
+
+        for name in POINT_DTYPE.names:
+            self._columns[name][slots, heads] = points[name]
+        self._heads[slots] = (heads + 1) % self.points
+        self._counts[slots] = np.minimum(self._counts[slots] + 1, self.points)
+        metrics.tracked_aircraft.set(len(self._slots))
+        return points
+
+    def append(self, records: np.ndarray, seen_at: float, persist: bool = True):
+        """
+        Add the located aircraft in a batch of position records; returns immediately.
+
+        With persist=False the points only go into the ring buffers, for records
+        another worker fetched and writes to the shared segments itself.
+        """
+        records = records[positions.located(records)]
+        points = np.zeros(len(records), dtype=SEGMENT_DTYPE)
+        points["id"] = records["id"]
+        # The feed timestamps each position; fall back to when we received it.
+        points["time"] = np.where(records["time"] > 0, records["time"], int(seen_at))
+        points["lat"] = records["latitude"]
+        points["lon"] = records["longitude"]
+        points["altitude"] = records["altitude"]
+        points["speed"] = _small(records["ground_speed"])
+        points["heading"] = _small(records["heading"])
+
+        points = self._record(points)
+        if persist and len(points):
+            with self._lock:
+                self._pending.append(points)
+            self._start()
+
+    def track(self, flight_id: str) -> np.ndarray:
+        """The aircraft's buffered points, oldest first."""
+        slot = self._slots.get(flight_id.encode())
+        track = np.zeros(0 if slot is None else int(self._counts[slot]), dtype=POINT_DTYPE)
+        if slot is not None:
+            rows = (self._heads[slot] - len(track) + np.arange(len(track))) % self.points
+            for name in POINT_DTYPE.names:
+                track[name] = self._columns[name][slot, rows]
+        return track
+
+    def _segment_names(self) -> List[str]:
+        return sorted(
+            (name for name in os.listdir(self.directory) if name.endswith(_SUFFIX)),
+            key=_segment_window,
+        )
+
+    def _segment(self, name: str) -> Optional[Dict[str, np.ndarray]]:
+        columns = self._mapped.get(name)
+        if columns is None:
+            columns = _read_segment(os.path.join(self.directory, name))
+            if columns is not None:
+                self._mapped[name] = columns
+        return columns
+
+    def replay(self, lat: float, lon: float, radius_km: float, start: float, end: float) -> np.ndarray:
+        """Every point observed within radius_km between start and end, by aircraft then time."""
+        with self._lock:
+            # Taken together so a batch is never seen both queued and in its segment.
+            chunks = list(self._pending) + ([self._flushing] if self._flushing is not None else [])
+            windows = {name: _segment_window(name) for name in self._segment_names()}
+            names = [name for name, (first, last) in windows.items() if last >= start and first <= end]
+        chunks.extend(columns for columns in map(self._segment, names) if columns is not None)
+
+        found = []
+        for chunk in chunks:
+            times = chunk["time"]
+            candidates = np.flatnonzero((times >= start) & (times <= end))
+            distances = geo.haversine_km(lat, lon, chunk["lat"][candidates], chunk["lon"][candidates])
+            rows = candidates[distances <= radius_km]
+            points = np.zeros(len(rows), dtype=SEGMENT_DTYPE)
+            for name in SEGMENT_DTYPE.names:
+                points[name] = chunk[name][rows]
+            found.append(points)
+        points = np.concatenate(found) if found else np.zeros(0, dtype=SEGMENT_DTYPE)
+        return points[np.lexsort((points["time"], points["id"]))]
+
+    def flush(self):
+        """Write the queued points as a new segment and delete expired ones. Blocking."""
+        with self._flush_lock:
+            self._write_pending()
+            self._expire()
+
+    def _write_pending(self):
+        with self._lock:
+            if not self._pending:
+                return
+            points = self._flushing = np.concatenate(self._pending)
+            self._pending = []
+        name = f"{int(points['time'].min())}-{int(points['time'].max())}-{os.getpid()}{_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        try:
+            _write_segment(f"{path}.tmp", points)
+            with self._lock:
+                # Published and dequeued in one step, so replays see the batch exactly once.
+                os.replace(f"{path}.tmp", path)
+                self._flushing = None
+        except Exception:
+            with self._lock:
+                # Keep the batch queued for the next flush rather than losing it.
+                self._pending.insert(0, points)
+                self._flushing = None
+            raise
+        logger.debug("Wrote %d track points to %s", len(points), name)
+
+    def _expire(self):
+        expired_before = time.time() - self.retention
+        names = self._segment_names()
+        for name in names:
+            if _segment_window(name)[1] < expired_before:
+                self._mapped.pop(name, None)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+        for name in set(self._mapped) - set(names):
+            # Deleted by another worker.
+            del self._mapped[name]
+        metrics.track_segments.set(len(self._mapped))
+
+    def restore(self):
+        """Refill the ring buffers from the segments on disk, e.g. after a restart. Blocking."""
+        restored = 0
+        for name in self._segment_names():
+            columns = self._segment(name)
+            if columns is None:
+                continue
+            points = np.zeros(len(columns["id"]), dtype=SEGMENT_DTYPE)
+            for field in SEGMENT_DTYPE.names:
+                points[field] = columns[field]
+            restored += len(self._record(points[np.argsort(points["time"], kind="stable")]))
+        logger.info("Restored %d track points for %d aircraft from %s", restored, len(self._slots), self.directory)
+
+    def _start(self):
+        # The flusher is bound to the loop it was started on; start afresh on a new one.
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and not self._task.done():
+            return
+        self._loop = loop
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.warning("Flushing track points failed: %s", e)
+
+    async def stop(self):
+        """Stop the flusher and write out whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._loop = None
+        await asyncio.to_thread(self.flush)
+
+
+def as_rows(points: np.ndarray) -> List[dict]:
+    """Track points as API payloads."""
+    return [
+        {
+            "time": point_time,
+            "lat": round(lat, 5),
+            "lon": round(lon, 5),
+            "altitude_ft": None if altitude == positions.MISSING else altitude,
+            "speed_kts": None if speed == _MISSING else speed,
+            "heading_deg": None if heading == _MISSING else heading,
+        }
+        for point_time, lat, lon, altitude, speed, heading in zip(
+            points["time"].tolist(),
+            points["lat"].tolist(),
+            points["lon"].tolist(),
+            points["altitude"].tolist(),
+            points["speed"].tolist(),
+            points["heading"].tolist(),
+        )
+    ]
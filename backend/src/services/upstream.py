@@ -0,0 +1,173 @@
+import asyncio
+import dataclasses
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+import httpx
+import numpy as np
+from FlightRadar24 import FlightRadar24API
+from FlightRadar24.api import FlightTrackerConfig
+from FlightRadar24.core import Core
+
+from ..utils import log, metrics, positions
+from .scheduler import CircuitBreaker, Priority, Rejected, Scheduler, current_priority
+
+TIMEOUT_SECONDS = 10
+# Upstream calls in flight at once across the whole worker.
+MAX_CONCURRENCY = 32
+# Request budget per worker: a sustained rate with room for short bursts.
+RATE_LIMIT_PER_SECOND = float(os.getenv("UPSTREAM_RATE_LIMIT", "20"))
+RATE_LIMIT_BURST = 40
+# Longest a request waits for budget before callers fall back to cached data.
+QUEUE_TIMEOUT_SECONDS = 5
+# Consecutive failed requests that open the circuit, and how long it stays open.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+RETRIES = 2
+BACKOFF_BASE_SECONDS = 0.25
+
+logger = log.get_logger("upstream")
+
+# 520 is what Cloudflare returns when FlightRadar24 throttles us.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504, 520}
+
+
+# Priority of each operation unless the caller runs under scheduler.prioritized().
+OPERATION_PRIORITIES = {
+    "get_flight_details": Priority.DETAILS,
+    "get_flights": Priority.SEARCH,
+}
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class UpstreamNotFound(UpstreamError):
+    """FlightRadar24 answered 404: it has nothing under the requested id."""
+
+
+class UpstreamUnavailable(UpstreamError):
+    """Refused without calling upstream: the circuit is open or the rate budget is exhausted."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamClient:
+    """
+    Async access to the FlightRadar24 endpoints used by the backend.
+
+    Requests share one keep-alive connection pool and go through a scheduler
+    that enforces the rate budget and concurrency limit, letting detail lookups
+    ahead of searches and background refreshes. Transport errors and throttling
+    responses are retried with jittered exponential backoff, and a circuit
+    breaker fails requests fast while upstream keeps failing.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None, rate_limit: float = RATE_LIMIT_PER_SECOND):
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.scheduler = Scheduler(rate_limit, RATE_LIMIT_BURST, MAX_CONCURRENCY, QUEUE_TIMEOUT_SECONDS)
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+        self._flight_tracker_config = FlightTrackerConfig()
+        self._bounds_helper = FlightRadar24API()
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=Core.json_headers,
+                timeout=TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def _slot(self, operation: str):
+        """Get past the circuit breaker and scheduler, tracking how many requests are busy and queued."""
+        if not self.breaker.allow():
+            metrics.upstream_rejected.labels(operation, "circuit_open").inc()
+            raise UpstreamUnavailable("FlightRadar24 circuit is open", self.breaker.retry_after())
+
+        priority = current_priority.get()
+        if priority is None:
+            priority = OPERATION_PRIORITIES.get(operation, Priority.SEARCH)
+        metrics.upstream_waiting.inc()
+        try:
+            await self.scheduler.acquire(priority)
+        except Rejected as e:
+            metrics.upstream_rejected.labels(operation, e.reason).inc()
+            raise UpstreamUnavailable("FlightRadar24 request budget exhausted", e.retry_after) from None
+        finally:
+            metrics.upstream_waiting.dec()
+        metrics.upstream_in_flight.inc()
+        try:
+            yield
+        finally:
+            metrics.upstream_in_flight.dec()
+            self.scheduler.release()
+
+    async def _get_json(self, url: str, params: Optional[Dict[str, Any]] = None, operation: str = "other") -> Any:
+        for attempt in range(RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                async with self._slot(operation):
+                    response = await self._http().get(url, params=params)
+                metrics.upstream_request_duration.labels(operation).observe(time.perf_counter() - started)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    # Any answer that isn't throttling or a server error means upstream is up.
+                    self.breaker.record_success()
+                    response.raise_for_status()
+                    return response.json()
+                self.breaker.record_failure()
+                metrics.upstream_errors.labels(operation, str(response.status_code)).inc()
+                error = UpstreamError(f"FlightRadar24 responded with status {response.status_code}")
+            except httpx.TransportError as e:
+                metrics.upstream_request_duration.labels(operation).observe(time.perf_counter() - started)
+                self.breaker.record_failure()
+                metrics.upstream_errors.labels(operation, "transport").inc()
+                error = UpstreamError(f"FlightRadar24 request failed: {e!r}")
+            except httpx.HTTPStatusError as e:
+                metrics.upstream_errors.labels(operation, str(e.response.status_code)).inc()
+                if e.response.status_code == 404:
+                    raise UpstreamNotFound(f"FlightRadar24 has no {operation} result for {url}") from e
+                raise UpstreamError(f"FlightRadar24 responded with status {e.response.status_code}") from e
+
+            if attempt == RETRIES:
+                raise error
+            metrics.upstream_retries.labels(operation).inc()
+            delay = BACKOFF_BASE_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning("%s, retrying in %.2fs", error, delay)
+            await asyncio.sleep(delay)
+
+    def get_bounds_by_point(self, lat: float, lon: float, radius_m: float) -> str:
+        """FlightRadar24 bounds string around a point. Pure computation, no request."""
+        return self._bounds_helper.get_bounds_by_point(lat, lon, radius_m)
+
+    async def get_flights(self, bounds: str) -> np.ndarray:
+        """Aircraft inside the bounds, as position records (see positions.POSITION_DTYPE)."""
+        params = dataclasses.asdict(self._flight_tracker_config)
+        params["bounds"] = bounds
+        content = await self._get_json(Core.real_time_flight_tracker_data_url, params, operation="get_flights")
+        return positions.from_feed(content)
+
+    async def get_flight_details(self, flight_id: str) -> Dict[str, Any]:
+        return await self._get_json(Core.flight_data_url.format(flight_id), operation="get_flight_details")
+
+
+client = UpstreamClient()
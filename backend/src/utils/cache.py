@@ -1,14 +1,284 @@
+import sys
+import threading
 import time
-from typing import Any, Dict, Optional
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
 
-_cache: Dict[str, Any] = {}
-_cache_expiry: Dict[str, float] = {}
+from . import shared
 
-def get(key: str) -> Optional[Any]:
-    if key in _cache and time.time() < _cache_expiry[key]:
-        return _cache[key]
-    return None
+# Default TTL (seconds) for every namespace. Callers may still pass an explicit ttl.
+NAMESPACE_TTLS: Dict[str, int] = {
+    "details": 300,
+    "positions": 3600,
+    "missing": 30,
+    # Last good details, served when upstream is failing and "details" has expired.
+    "stale_details": 3600,
+    "wire_versions": 120,
+    # Encoded map layers; keyed by the tiles' fetch times, so this only bounds how long unused ones linger.
+    "map": 60,
+}
+DEFAULT_TTL = 300
 
-def set(key: str, value: Any, ttl: int):
-    _cache[key] = value
-    _cache_expiry[key] = time.time() + ttl
+# Namespaces holding plain JSON values that every worker process can reuse when
+# SHARED_STATE_DIR is set.
+SHARED_NAMESPACES = frozenset({"details", "stale_details", "positions", "missing"})
+
+MAX_ENTRIES = 50_000
+MAX_BYTES = 64 * 1024 * 1024
+# Namespaces bounded apart from the rest, as (max entries, max bytes). Every poll
+# refreshes the position of each flight in view, which in a shared LRU would
+# push out the details that are far dearer to fetch again.
+NAMESPACE_LIMITS: Dict[str, Tuple[int, int]] = {
+    "positions": (100_000, 16 * 1024 * 1024),
+}
+# Expired entries are swept at most this often, on the write path.
+SWEEP_INTERVAL_SECONDS = 30
+
+
+def _estimate_size(value: Any) -> int:
+    """Cheap, shallow-plus-one-level size estimate of a cached value in bytes."""
+    size = sys.getsizeof(value)
+    children = getattr(value, "__dict__", None)
+    if children is not None:
+        size += sys.getsizeof(children)
+        values = children.values()
+    elif isinstance(value, dict):
+        values = value.values()
+    elif isinstance(value, (list, tuple)):
+        values = value
+    else:
+        return size
+    return size + sum(sys.getsizeof(v) for v in values)
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Any, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class _Pool:
+    """One LRU order with its own entry and byte limits."""
+
+    __slots__ = ("entries", "bytes", "max_entries", "max_bytes")
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.entries: "OrderedDict[Tuple[str, Hashable], _Entry]" = OrderedDict()
+        self.bytes = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+
+class _Stats:
+    __slots__ = ("hits", "misses", "evictions", "expirations")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe TTL cache with LRU eviction.
+
+    Entries live in namespaces, each with its own default TTL. The cache is capped
+    both by entry count and by an estimated byte budget; the least recently used
+    entries are evicted first. Namespaces given their own limits are evicted only
+    against those, and never displace entries of other namespaces. Expired entries
+    are dropped on access and by a periodic sweep amortized over writes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = MAX_ENTRIES,
+        max_bytes: int = MAX_BYTES,
+        namespace_ttls: Optional[Dict[str, int]] = None,
+        sweep_interval: float = SWEEP_INTERVAL_SECONDS,
+        namespace_limits: Optional[Dict[str, Tuple[int, int]]] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.namespace_ttls = dict(namespace_ttls or {})
+        self.sweep_interval = sweep_interval
+
+        self._default = _Pool(max_entries, max_bytes)
+        self._pools: Dict[str, _Pool] = {
+            namespace: _Pool(*limits) for namespace, limits in (namespace_limits or {}).items()
+        }
+        self._stats: Dict[str, _Stats] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _ns_stats(self, namespace: str) -> _Stats:
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = _Stats()
+        return stats
+
+    def _pool(self, namespace: str) -> _Pool:
+        return self._pools.get(namespace, self._default)
+
+    def _all_pools(self):
+        return (self._default, *self._pools.values())
+
+    def _remove(self, pool: _Pool, full_key: Tuple[str, Hashable]) -> _Entry:
+        entry = pool.entries.pop(full_key)
+        pool.bytes -= entry.size
+        return entry
+
+    def get(self, key: Hashable, namespace: str = "default") -> Optional[Any]:
+        full_key = (namespace, key)
+        with self._lock:
+            stats = self._ns_stats(namespace)
+            pool = self._pool(namespace)
+            entry = pool.entries.get(full_key)
+            if entry is None:
+                stats.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(pool, full_key)
+                stats.expirations += 1
+                stats.misses += 1
+                return None
+            pool.entries.move_to_end(full_key)
+            stats.hits += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, namespace: str = "default"):
+        if ttl is None:
+            ttl = self.namespace_ttls.get(namespace, DEFAULT_TTL)
+        full_key = (namespace, key)
+        size = _estimate_size(value)
+        now = time.monotonic()
+        with self._lock:
+            pool = self._pool(namespace)
+            if full_key in pool.entries:
+                self._remove(pool, full_key)
+            pool.entries[full_key] = _Entry(value, now + ttl, size)
+            pool.bytes += size
+
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+            self._evict(pool)
+
+    def contains(self, key: Hashable, namespace: str = "default") -> bool:
+        """True if a live entry exists; unlike get(), not counted as a hit or miss."""
+        with self._lock:
+            entry = self._pool(namespace).entries.get((namespace, key))
+            return entry is not None and entry.expires_at > time.monotonic()
+
+    def delete(self, key: Hashable, namespace: str = "default"):
+        with self._lock:
+            pool = self._pool(namespace)
+            if (namespace, key) in pool.entries:
+                self._remove(pool, (namespace, key))
+
+    def clear(self):
+        with self._lock:
+            for pool in self._all_pools():
+                pool.entries.clear()
+                pool.bytes = 0
+
+    def _sweep(self, now: float):
+        for pool in self._all_pools():
+            expired = [k for k, entry in pool.entries.items() if entry.expires_at <= now]
+            for full_key in expired:
+                self._remove(pool, full_key)
+                self._ns_stats(full_key[0]).expirations += 1
+        self._last_sweep = now
+
+    def _evict(self, pool: _Pool):
+        while pool.entries and (len(pool.entries) > pool.max_entries or pool.bytes > pool.max_bytes):
+            full_key, entry = pool.entries.popitem(last=False)
+            pool.bytes -= entry.size
+            self._ns_stats(full_key[0]).evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of cache occupancy and per-namespace hit/miss/eviction counters."""
+        with self._lock:
+            pools = self._all_pools()
+            entries_by_ns: Dict[str, int] = {}
+            for pool in pools:
+                for namespace, _ in pool.entries:
+                    entries_by_ns[namespace] = entries_by_ns.get(namespace, 0) + 1
+
+            namespaces = {}
+            for namespace in self._stats.keys() | entries_by_ns.keys():
+                counters = self._ns_stats(namespace).as_dict()
+                lookups = counters["hits"] + counters["misses"]
+                counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0.0
+                counters["entries"] = entries_by_ns.get(namespace, 0)
+                namespaces[namespace] = counters
+
+            # Totals over the shared budget and every namespace's own.
+            return {
+                "entries": sum(len(pool.entries) for pool in pools),
+                "bytes": sum(pool.bytes for pool in pools),
+                "max_entries": sum(pool.max_entries for pool in pools),
+                "max_bytes": sum(pool.max_bytes for pool in pools),
+                "namespaces": namespaces,
+            }
+
+
+_cache = TTLCache(namespace_ttls=NAMESPACE_TTLS, namespace_limits=NAMESPACE_LIMITS)
+# Second level behind _cache for SHARED_NAMESPACES, shared by all workers (None when disabled).
+_shared = shared.key_value_store()
+
+
+def _is_shared(namespace: str) -> bool:
+    return _shared is not None and namespace in SHARED_NAMESPACES
+
+
+def get(key: Hashable, namespace: str = "flights") -> Optional[Any]:
+    value = _cache.get(key, namespace)
+    if value is None and _is_shared(namespace):
+        found = _shared.get(namespace, key)
+        if found is not None:
+            # Another worker stored it; keep a local copy for as long as it has left.
+            value, remaining = found
+            _cache.set(key, value, remaining, namespace)
+    return value
+
+
+def contains(key: Hashable, namespace: str = "flights") -> bool:
+    """Local presence check for skipping work, without touching hit/miss stats."""
+    return _cache.contains(key, namespace)
+
+
+def set(key: Hashable, value: Any, ttl: Optional[float] = None, namespace: str = "flights"):
+    set_many([(key, value)], ttl, namespace)
+
+
+def set_many(items: Iterable[Tuple[Hashable, Any]], ttl: Optional[float] = None, namespace: str = "flights"):
+    """Store several entries in one namespace, with a single shared-store write."""
+    if ttl is None:
+        ttl = NAMESPACE_TTLS.get(namespace, DEFAULT_TTL)
+    items = list(items)
+    for key, value in items:
+        _cache.set(key, value, ttl, namespace)
+    if _is_shared(namespace):
+        _shared.set_many(namespace, items, ttl)
+
+
+def delete(key: Hashable, namespace: str = "flights"):
+    _cache.delete(key, namespace)
+    if _is_shared(namespace):
+        _shared.delete(namespace, key)
+
+
+def clear():
+    _cache.clear()
+    if _shared is not None:
+        _shared.clear()
+
+
+def stats() -> Dict[str, Any]:
+    return _cache.stats()
@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, NamedTuple, Optional
+
+# Generated from the countryinfo dataset, see generate() below:
+#   uv run --group data python -m src.utils.countries
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "countries.json")
+
+UNKNOWN_FLAG = "🏴‍☠️"
+
+# Names FlightRadar24 uses that aren't among the dataset's spellings.
+_EXTRA_ALIASES = {
+    "CZ": ["Czech Republic", "Czechia"],
+    "GB": ["United Kingdom", "Great Britain"],
+    "KR": ["South Korea", "Korea"],
+    "KP": ["North Korea"],
+    "RU": ["Russia"],
+    "US": ["United States", "USA"],
+    "VN": ["Vietnam"],
+    "MK": ["Macedonia", "North Macedonia"],
+    "CI": ["Ivory Coast"],
+    "TR": ["Turkey", "Turkiye"],
+    "CD": ["Democratic Republic Of The Congo", "Congo (Kinshasa)"],
+    "CG": ["Congo (Brazzaville)"],
+}
+
+# Preferred display name where the dataset lists a code under several names.
+_CANONICAL_NAMES = {
+    "MM": "Myanmar",
+    "VA": "Vatican City",
+}
+
+
+class Country(NamedTuple):
+    name: str
+    alpha2: str
+    alpha3: str
+    region: Optional[str]
+    flag: str
+
+
+def normalize(name: str) -> str:
+    """Case-, accent- and punctuation-insensitive form of a country name."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(ch for ch in name if not unicodedata.combining(ch))
+    return re.sub(r"[^0-9a-z]+", " ", name.casefold()).strip()
+
+
+def flag_emoji(alpha2: str) -> str:
+    """Regional-indicator flag for an ISO 3166-1 alpha-2 code."""
+    return "".join(chr(0x1F1E6 + ord(ch) - ord("A")) for ch in alpha2.upper())
+
+
+class CountryTable:
+    """Country names, aliases and ISO codes resolved through flat dict lookups."""
+
+    def __init__(self, rows):
+        self.countries = []
+        self._by_name: Dict[str, Country] = {}
+        self._by_code: Dict[str, Country] = {}
+        for alpha2, alpha3, name, region, aliases in rows:
+            country = Country(name, alpha2, alpha3, region, flag_emoji(alpha2))
+            self.countries.append(country)
+            self._by_code[alpha2] = self._by_code[alpha3] = country
+            for alias in [name, *aliases, *_EXTRA_ALIASES.get(alpha2, ())]:
+                # The first country to claim a spelling keeps it.
+                self._by_name.setdefault(normalize(alias), country)
+
+    def __len__(self) -> int:
+        return len(self.countries)
+
+    def lookup(self, name_or_code: Optional[str]) -> Optional[Country]:
+        """Resolve a country name, alias or ISO alpha-2/alpha-3 code."""
+        if not name_or_code:
+            return None
+        country = self._by_code.get(name_or_code.strip().upper())
+        if country is None:
+            country = self._by_name.get(normalize(name_or_code))
+        return country
+
+
+def load(path: str = DATA_PATH) -> CountryTable:
+    with open(path, encoding="utf-8") as f:
+        return CountryTable(json.load(f))
+
+
+_table: Optional[CountryTable] = None
+
+
+def table() -> CountryTable:
+    global _table
+    if _table is None:
+        _table = load()
+    return _table
+
+
+def lookup(name_or_code: Optional[str]) -> Optional[Country]:
+    return table().lookup(name_or_code)
+
+
+def get_flag(name_or_code: Optional[str]) -> str:
+    country = lookup(name_or_code)
+    return country.flag if country is not None else UNKNOWN_FLAG
+
+
+def generate(path: str = DATA_PATH):
+    """Rebuild the bundled table from the countryinfo package (development only, needs the "data" dependency group)."""
+    from countryinfo.countryinfo import load_countries
+
+    by_code: Dict[str, list] = {}
+    for info in sorted(load_countries()["countries"].values(), key=lambda info: info["name"]):
+        iso = info.get("ISO") or {}
+        if not iso.get("alpha2") or not iso.get("alpha3"):
+            continue
+        # Two- and three-letter spellings are ISO codes, which are indexed separately.
+        aliases = {
+            alias
+            for alias in [info["name"], info.get("nativeName"), *(info.get("altSpellings") or [])]
+            if alias and len(alias) > 3
+        }
+        # Some codes appear under several names (e.g. Burma/Myanmar); merge them into one row.
+        row = by_code.setdefault(iso["alpha2"], [iso["alpha2"], iso["alpha3"], info["name"], info.get("region") or None, aliases])
+        row[4] |= aliases
+
+    rows = []
+    for alpha2, row in sorted(by_code.items()):
+        row[2] = _CANONICAL_NAMES.get(alpha2, row[2])
+        row[4] = sorted(row[4] - {row[2]})
+        rows.append(row)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, separators=(",", ":"))
+        f.write("\n")
+    print(f"[countries] Wrote {len(rows)} countries to {path}")
+
+
+if __name__ == "__main__":
+    generate()
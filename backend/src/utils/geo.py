@@ -1,4 +1,125 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
 from geopy.distance import geodesic
 
-def get_distance(lat1, lon1, lat2, lon2):
-    return geodesic((lat1, lon1), (lat2, lon2)).km
+EARTH_RADIUS_KM = 6371.0088
+# Spherical (haversine) distances differ from WGS-84 geodesics by well under
+# this ratio, so it bounds how far the fast prefilter can mis-rank points.
+SPHERICAL_ERROR = 0.006
+
+MODES = ("equirectangular", "haversine", "geodesic")
+
+
+def _as_arrays(lats: Sequence[float], lons: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    return np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+
+
+def equirectangular_km(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Flat-earth approximation. Cheapest, accurate to ~0.1% at search radii."""
+    lats, lons = _as_arrays(lats, lons)
+    phi = np.radians(lat)
+    dlon = np.radians((lons - lon + 180.0) % 360.0 - 180.0)
+    x = dlon * np.cos((np.radians(lats) + phi) / 2.0)
+    y = np.radians(lats) - phi
+    return EARTH_RADIUS_KM * np.hypot(x, y)
+
+
+def haversine_km(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Great-circle distance on a sphere from one point to many."""
+    lats, lons = _as_arrays(lats, lons)
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlam = np.radians(lons - lon)
+    a = np.sin(dphi / 2.0) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def geodesic_km(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Exact WGS-84 geodesic distance. Iterative per point, use on small inputs."""
+    lats, lons = _as_arrays(lats, lons)
+    origin = (lat, lon)
+    return np.fromiter(
+        (geodesic(origin, (a, b)).km for a, b in zip(lats.tolist(), lons.tolist())),
+        dtype=np.float64,
+        count=len(lats),
+    )
+
+
+_DISTANCE_FUNCS = {
+    "equirectangular": equirectangular_km,
+    "haversine": haversine_km,
+    "geodesic": geodesic_km,
+}
+
+
+def distances_km(lat: float, lon: float, lats, lons, mode: str = "haversine") -> np.ndarray:
+    """Distances in km from (lat, lon) to every point, in one vectorized pass."""
+    try:
+        func = _DISTANCE_FUNCS[mode]
+    except KeyError:
+        raise ValueError(f"Unknown distance mode '{mode}', expected one of {MODES}")
+    return func(lat, lon, lats, lons)
+
+
+def nearest(
+    lat: float,
+    lon: float,
+    lats,
+    lons,
+    k: int,
+    max_km: Optional[float] = None,
+    mode: str = "geodesic",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return (indices, distances_km) of the k points closest to (lat, lon), nearest first.
+
+    Candidates are ranked with a vectorized haversine pass and a partial top-k
+    selection; with mode="geodesic" only the surviving candidates are re-measured
+    exactly, widened by the spherical error bound so no true top-k point is lost.
+    """
+    lats, lons = _as_arrays(lats, lons)
+    if k <= 0 or lats.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+    fast_mode = "haversine" if mode == "geodesic" else mode
+    # A point's geodesic can be SPHERICAL_ERROR shorter than its haversine distance
+    # while the kth candidate's is as much longer, so both bounds widen by the ratio.
+    slack = (1.0 + SPHERICAL_ERROR) / (1.0 - SPHERICAL_ERROR) if mode == "geodesic" else 1.0
+
+    distances = distances_km(lat, lon, lats, lons, fast_mode)
+    candidates = np.arange(lats.size)
+    if max_km is not None:
+        candidates = candidates[distances <= max_km * slack]
+    if candidates.size > k:
+        kth = np.partition(distances[candidates], k - 1)[k - 1]
+        candidates = candidates[distances[candidates] <= kth * slack]
+
+    if mode == "geodesic":
+        candidate_distances = geodesic_km(lat, lon, lats[candidates], lons[candidates])
+    else:
+        candidate_distances = distances[candidates]
+
+    if max_km is not None:
+        within = candidate_distances <= max_km
+        candidates, candidate_distances = candidates[within], candidate_distances[within]
+
+    order = np.argsort(candidate_distances, kind="stable")[:k]
+    return candidates[order], candidate_distances[order]
+
+
+def destination(lats, lons, bearings_deg, distances_km) -> Tuple[np.ndarray, np.ndarray]:
+    """Where each point ends up travelling along the great circle at its bearing for its distance."""
+    lats, lons = _as_arrays(lats, lons)
+    phi1 = np.radians(lats)
+    theta = np.radians(bearings_deg)
+    delta = np.asarray(distances_km, dtype=np.float64) / EARTH_RADIUS_KM
+    sin_phi2 = np.sin(phi1) * np.cos(delta) + np.cos(phi1) * np.sin(delta) * np.cos(theta)
+    phi2 = np.arcsin(np.clip(sin_phi2, -1.0, 1.0))
+    dlam = np.arctan2(np.sin(theta) * np.sin(delta) * np.cos(phi1), np.cos(delta) - np.sin(phi1) * sin_phi2)
+    return np.degrees(phi2), (lons + np.degrees(dlam) + 180.0) % 360.0 - 180.0
+
+
+def get_distance(lat1, lon1, lat2, lon2, mode: str = "geodesic"):
+    return float(distances_km(lat1, lon1, [lat2], [lon2], mode)[0])
@@ -0,0 +1,251 @@
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import sys
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import log
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+# Built by generate() below from a DB-IP "IP to City Lite" or "IP to Country Lite"
+# CSV (https://db-ip.com/db/lite.php, CC BY 4.0, a new one each month), e.g.
+#   python -m src.utils.geoip dbip-city-lite-2025-09.csv
+# It is not bundled; without it every lookup misses and /geo/ip reports the
+# location as unknown.
+DB_PATH = os.getenv("GEOIP_DB_PATH", os.path.join(DATA_DIR, "ip_ranges.bin"))
+
+# Peers allowed to tell us the client address through X-Forwarded-For: the
+# frontend proxy and load balancers on loopback or private networks.
+TRUSTED_PROXIES = tuple(
+    ipaddress.ip_network(network.strip())
+    for network in os.getenv("TRUSTED_PROXIES", "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16").split(",")
+    if network.strip()
+)
+
+_MAGIC = b"FTGEO1\n"
+_ALIGN = 8
+# IPv4 ranges are stored as IPv4-mapped IPv6 (::ffff:a.b.c.d) so one table holds both.
+_IPV4_MAPPED = b"\0" * 10 + b"\xff\xff"
+
+logger = log.get_logger("geoip")
+
+
+class Location(NamedTuple):
+    lat: float
+    lon: float
+    country_code: str
+    city: str
+
+
+def _data_start(header_size: int) -> int:
+    start = len(_MAGIC) + 4 + header_size
+    return start + -start % _ALIGN
+
+
+def _key(address) -> bytes:
+    """16-byte big-endian key; byte order is numeric order for both families."""
+    if address.version == 4:
+        return _IPV4_MAPPED + address.packed
+    return address.packed
+
+
+def _parse(value: str):
+    """An address from a peer or X-Forwarded-For entry, which may carry a port or brackets."""
+    value = value.strip()
+    if value.startswith("["):
+        value = value[1:value.find("]")]
+    elif value.count(":") == 1:
+        value = value.split(":")[0]
+    try:
+        return ipaddress.ip_address(value)
+    except ValueError:
+        return None
+
+
+def _is_trusted(address) -> bool:
+    return any(address in network for network in TRUSTED_PROXIES if network.version == address.version)
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str]) -> Optional[str]:
+    """
+    The caller's address.
+
+    That is the connecting peer, unless the peer is one of our proxies: then it
+    is the nearest X-Forwarded-For hop that isn't, since entries further left
+    were written by the client and can't be trusted.
+    """
+    address = _parse(peer) if peer else None
+    if address is None:
+        return None
+    if not forwarded_for or not _is_trusted(address):
+        return str(address)
+    for hop in reversed(forwarded_for.split(",")):
+        hop_address = _parse(hop)
+        if hop_address is None:
+            break
+        address = hop_address
+        if not _is_trusted(address):
+            break
+    return str(address)
+
+
+class RangeTable:
+    """
+    Read-only IP range table over the mapped database file.
+
+    Ranges are sorted by start address and don't overlap, so an address is
+    found with one binary search over the start column. Each range points at a
+    row of the location table, which holds every distinct city only once.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not an IP range table")
+        (header_size,) = struct.unpack_from("<I", self._mmap, len(_MAGIC))
+        start = len(_MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_size])
+        data_start = _data_start(header_size)
+        columns = {
+            name: np.frombuffer(self._mmap, dtype=column["dtype"], count=column["count"], offset=data_start + column["offset"])
+            for name, column in header["columns"].items()
+        }
+        self.source = header.get("source")
+        self._starts = columns["starts"]
+        self._ends = columns["ends"]
+        self._locations = columns["location"]
+        self._lat = columns["lat"]
+        self._lon = columns["lon"]
+        self._country = columns["country"]
+        self._city_offsets = columns["city.offsets"]
+        self._city_blob = columns["city.blob"]
+
+    def __len__(self) -> int:
+        return self._starts.size
+
+    def lookup(self, ip: str) -> Optional[Location]:
+        address = _parse(ip)
+        if address is None:
+            return None
+        key = np.array(_key(address), dtype="S16")
+        row = int(np.searchsorted(self._starts, key, side="right")) - 1
+        if row < 0 or self._ends[row:row + 1][0] < key:
+            return None
+        location = int(self._locations[row])
+        city = self._city_blob[self._city_offsets[location]:self._city_offsets[location + 1]].tobytes().decode("utf-8")
+        return Location(
+            round(float(self._lat[location]), 4),
+            round(float(self._lon[location]), 4),
+            self._country[location].decode("ascii"),
+            city,
+        )
+
+
+_table: Optional[RangeTable] = None
+_loaded = False
+
+
+def table() -> Optional[RangeTable]:
+    global _table, _loaded
+    if not _loaded:
+        _loaded = True
+        try:
+            _table = RangeTable()
+            logger.info("Loaded %d IP ranges from %s", len(_table), DB_PATH)
+        except FileNotFoundError:
+            logger.warning("No IP range table at %s; build one with `python -m src.utils.geoip <dbip.csv>`", DB_PATH)
+    return _table
+
+
+# Clients come back, and many share a NAT or carrier address.
+@lru_cache(maxsize=65536)
+def lookup(ip: str) -> Optional[Location]:
+    ranges = table()
+    return ranges.lookup(ip) if ranges is not None else None
+
+
+def _country_centroids() -> Dict[str, Tuple[float, float]]:
+    from countryinfo.countryinfo import load_countries
+
+    centroids = {}
+    for info in load_countries()["countries"].values():
+        alpha2 = (info.get("ISO") or {}).get("alpha2")
+        if alpha2 and len(info.get("latlng") or ()) == 2:
+            centroids[alpha2] = tuple(info["latlng"])
+    return centroids
+
+
+def generate(csv_path: str, path: str = DB_PATH):
+    """
+    Build the table from a DB-IP Lite CSV (development only).
+
+    City rows (start, end, continent, country, region, city, lat, lon) keep their
+    coordinates; country rows (start, end, country) are placed at the country's
+    centroid, taken from countryinfo in the "data" dependency group. Adjacent
+    ranges with the same location are merged.
+    """
+    centroids = None
+    locations: Dict[Tuple, int] = {}
+    ranges: List[Tuple[bytes, bytes, int]] = []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) >= 8:
+                country, city, lat, lon = row[3], row[5], float(row[6]), float(row[7])
+            else:
+                centroids = centroids or _country_centroids()
+                country, city = row[2], ""
+                if country not in centroids:
+                    continue
+                lat, lon = centroids[country]
+            if len(country) != 2 or country == "ZZ":
+                continue
+            location = locations.setdefault((round(lat, 4), round(lon, 4), country.upper(), city), len(locations))
+            start, end = _key(ipaddress.ip_address(row[0])), _key(ipaddress.ip_address(row[1]))
+            if ranges and ranges[-1][2] == location and int.from_bytes(ranges[-1][1], "big") + 1 == int.from_bytes(start, "big"):
+                ranges[-1] = (ranges[-1][0], end, location)
+            else:
+                ranges.append((start, end, location))
+    ranges.sort()
+
+    cities = [key[3].encode("utf-8") for key in locations]
+    columns = {
+        "starts": np.array([r[0] for r in ranges], dtype="S16"),
+        "ends": np.array([r[1] for r in ranges], dtype="S16"),
+        "location": np.array([r[2] for r in ranges], dtype=np.uint32),
+        "lat": np.array([key[0] for key in locations], dtype=np.float32),
+        "lon": np.array([key[1] for key in locations], dtype=np.float32),
+        "country": np.array([key[2].encode("ascii") for key in locations], dtype="S2"),
+        "city.offsets": np.cumsum([0] + [len(city) for city in cities], dtype=np.uint32),
+        "city.blob": np.frombuffer(b"".join(cities), dtype=np.uint8),
+    }
+
+    header = {"source": os.path.basename(csv_path), "columns": {}}
+    chunks = []
+    offset = 0
+    for name, column in columns.items():
+        offset += -offset % _ALIGN
+        header["columns"][name] = {"dtype": column.dtype.str, "count": column.size, "offset": offset}
+        chunks.append((offset, column.tobytes()))
+        offset += column.nbytes
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    data_start = _data_start(len(header_bytes))
+    with open(path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for chunk_offset, data in chunks:
+            f.write(b"\0" * (data_start + chunk_offset - f.tell()))
+            f.write(data)
+    print(f"[geoip] Wrote {len(ranges)} ranges and {len(locations)} locations to {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    generate(*sys.argv[1:])
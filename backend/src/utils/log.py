@@ -0,0 +1,162 @@
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import uuid
+from typing import Optional
+
+# LOG_LEVEL picks the threshold; DEBUG turns on per-step request tracing.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" writes one object per line for log shippers, "text" is easier to read locally.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+REQUEST_ID_HEADER = "x-request-id"
+
+ROOT_LOGGER = "flight_tower"
+
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else came in through `extra=`.
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback while their objects are still live, but
+        # keep the traceback separate from the message so the formatter can place it.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with `extra=` fields as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def configure(level: Optional[str] = None, fmt: Optional[str] = None):
+    """
+    Route application logs through a queue to a background writer thread.
+
+    Callers only put the record on an in-memory queue, so a slow stdout never
+    blocks the event loop. Safe to call again to change the level or format.
+    """
+    global _listener
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level or LOG_LEVEL)
+    root.propagate = False
+
+    fmt = fmt or LOG_FORMAT
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(
+        "%(asctime)s %(levelname)s [%(name)s] [%(request_id)s] %(message)s"
+    )
+
+    if _listener is not None:
+        for handler in _listener.handlers:
+            handler.setFormatter(formatter)
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    # The request id lives in a contextvar, so it has to be read on the calling side.
+    queue_handler.addFilter(_RequestIdFilter())
+    root.handlers = [queue_handler]
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def queue_depth() -> int:
+    """Records accepted but not yet written by the background writer."""
+    return _listener.queue.qsize() if _listener is not None else 0
+
+
+def shutdown():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that tags every request with an id and logs its outcome.
+
+    The id is taken from an incoming X-Request-ID header or generated, made
+    available to all code handling the request through `request_id`, and
+    echoed back in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = get_logger("http")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(REQUEST_ID_HEADER.encode())
+        rid = incoming.decode("latin-1")[:64] if incoming else uuid.uuid4().hex[:16]
+        token = request_id.set(rid)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER.encode(), rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.logger.info(
+                "%s %s %s %.1fms",
+                scope["method"],
+                scope["path"],
+                status,
+                duration_ms,
+                extra={"status": status, "duration_ms": duration_ms},
+            )
+            request_id.reset(token)
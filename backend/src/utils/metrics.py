@@ -0,0 +1,179 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Enum, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from . import cache
+
+# Buckets in seconds, from cache-hit fast paths up to upstream timeouts.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RESULT_COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+http_request_duration = Histogram(
+    "flight_tower_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+    buckets=LATENCY_BUCKETS,
+)
+upstream_request_duration = Histogram(
+    "flight_tower_upstream_request_duration_seconds",
+    "FlightRadar24 request latency per attempt, including time queued for a connection slot.",
+    ("operation",),
+    buckets=LATENCY_BUCKETS,
+)
+upstream_errors = Counter(
+    "flight_tower_upstream_errors_total",
+    "Failed FlightRadar24 attempts by reason (HTTP status or 'transport').",
+    ("operation", "reason"),
+)
+upstream_retries = Counter(
+    "flight_tower_upstream_retries_total",
+    "FlightRadar24 requests retried after a failed attempt.",
+    ("operation",),
+)
+upstream_in_flight = Gauge(
+    "flight_tower_upstream_in_flight",
+    "FlightRadar24 requests currently holding a concurrency slot.",
+)
+upstream_waiting = Gauge(
+    "flight_tower_upstream_waiting",
+    "FlightRadar24 requests queued for a rate budget token or concurrency slot.",
+)
+upstream_rejected = Counter(
+    "flight_tower_upstream_rejected_total",
+    "FlightRadar24 requests refused locally by reason ('circuit_open' or 'queue_timeout').",
+    ("operation", "reason"),
+)
+upstream_circuit = Enum(
+    "flight_tower_upstream_circuit",
+    "State of the FlightRadar24 circuit breaker.",
+    states=["closed", "half_open", "open"],
+)
+stale_responses = Counter(
+    "flight_tower_stale_responses_total",
+    "Responses served from data older than its TTL because upstream failed.",
+    ("kind",),
+)
+search_stage_duration = Histogram(
+    "flight_tower_search_stage_duration_seconds",
+    "Time spent in each stage of a search: tile refresh, distance ranking, enrichment, encoding.",
+    ("stage",),
+    buckets=LATENCY_BUCKETS,
+)
+search_results = Histogram(
+    "flight_tower_search_results",
+    "Aircraft returned per search.",
+    buckets=RESULT_COUNT_BUCKETS,
+)
+details_prefetch = Counter(
+    "flight_tower_details_prefetch_total",
+    "Speculative detail prefetches by outcome (queued, skipped, dropped, fetched, failed).",
+    ("outcome",),
+)
+snapshot_aircraft = Gauge(
+    "flight_tower_snapshot_aircraft",
+    "Aircraft held in the tile snapshot.",
+)
+snapshot_tiles = Gauge(
+    "flight_tower_snapshot_tiles",
+    "Tiles held in the tile snapshot.",
+)
+tracked_aircraft = Gauge(
+    "flight_tower_tracked_aircraft",
+    "Aircraft with a track ring buffer.",
+)
+track_segments = Gauge(
+    "flight_tower_track_segments",
+    "Track segment files within the retention window.",
+)
+threadpool_busy = Gauge(
+    "flight_tower_threadpool_busy",
+    "Worker threads in use for sync endpoints and blocking calls.",
+)
+threadpool_size = Gauge(
+    "flight_tower_threadpool_size",
+    "Worker thread limit for sync endpoints and blocking calls.",
+)
+threadpool_waiting = Gauge(
+    "flight_tower_threadpool_waiting",
+    "Tasks waiting for a worker thread.",
+)
+log_queue_depth = Gauge(
+    "flight_tower_log_queue_depth",
+    "Log records waiting for the background writer.",
+)
+stream_subscribers = Gauge(
+    "flight_tower_stream_subscribers",
+    "Open /flights/stream subscriptions.",
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the block on a histogram, with labels if it has any."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - started)
+
+
+class _CacheCollector:
+    """Exports the TTL cache's own counters at scrape time instead of double-counting them."""
+
+    def collect(self):
+        stats = cache.stats()
+        hits = CounterMetricFamily("flight_tower_cache_hits", "Cache hits by namespace.", labels=("namespace",))
+        misses = CounterMetricFamily("flight_tower_cache_misses", "Cache misses by namespace.", labels=("namespace",))
+        evictions = CounterMetricFamily("flight_tower_cache_evictions", "LRU evictions by namespace.", labels=("namespace",))
+        expirations = CounterMetricFamily("flight_tower_cache_expirations", "TTL expirations by namespace.", labels=("namespace",))
+        ratio = GaugeMetricFamily("flight_tower_cache_hit_ratio", "Lifetime hit ratio by namespace.", labels=("namespace",))
+        entries = GaugeMetricFamily("flight_tower_cache_entries", "Live entries by namespace.", labels=("namespace",))
+        for namespace, counters in sorted(stats["namespaces"].items()):
+            hits.add_metric((namespace,), counters["hits"])
+            misses.add_metric((namespace,), counters["misses"])
+            evictions.add_metric((namespace,), counters["evictions"])
+            expirations.add_metric((namespace,), counters["expirations"])
+            ratio.add_metric((namespace,), counters["hit_ratio"])
+            entries.add_metric((namespace,), counters["entries"])
+        yield from (hits, misses, evictions, expirations, ratio, entries)
+        yield GaugeMetricFamily("flight_tower_cache_bytes", "Estimated size of cached values.", value=stats["bytes"])
+        yield GaugeMetricFamily("flight_tower_cache_max_bytes", "Cache byte budget.", value=stats["max_bytes"])
+
+
+REGISTRY.register(_CacheCollector())
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency labelled by the matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Label by template, not raw path, so flight ids don't explode the series count.
+            route = scope.get("route")
+            http_request_duration.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
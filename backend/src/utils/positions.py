@@ -0,0 +1,176 @@
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import numpy as np
+
+from . import geo
+
+# One fixed-width record per aircraft. Text fields are stored without the "N/A"
+# placeholder and numbers missing upstream hold MISSING; both read back as "N/A"
+# so a record behaves like the FlightRadar24 Flight it stands in for.
+POSITION_DTYPE = np.dtype(
+    [
+        ("latitude", "<f8"),
+        ("longitude", "<f8"),
+        ("time", "<i8"),
+        ("altitude", "<i4"),
+        ("ground_speed", "<i4"),
+        ("vertical_speed", "<i4"),
+        ("heading", "<i4"),
+        ("on_ground", "<i4"),
+        ("id", "S16"),
+        ("callsign", "S16"),
+        ("registration", "S16"),
+        ("aircraft_code", "S8"),
+        ("origin_airport_iata", "S4"),
+        ("destination_airport_iata", "S4"),
+        ("airline_iata", "S4"),
+        ("airline_icao", "S4"),
+    ],
+    align=True,
+)
+_NUMBER_FIELDS = ("time", "altitude", "ground_speed", "vertical_speed", "heading", "on_ground")
+_TEXT_FIELDS = tuple(name for name in POSITION_DTYPE.names if POSITION_DTYPE[name].kind == "S")
+MISSING = np.iinfo(np.int32).min
+_NOT_AVAILABLE = "N/A"
+
+# Where each field sits in a row of the FlightRadar24 live feed (the layout the
+# FlightRadar24 Flight constructor reads). The airline IATA code is the first
+# two characters of the flight number in column 13.
+_FEED_COLUMNS: Dict[str, int] = {
+    "latitude": 1,
+    "longitude": 2,
+    "heading": 3,
+    "altitude": 4,
+    "ground_speed": 5,
+    "aircraft_code": 8,
+    "registration": 9,
+    "time": 10,
+    "origin_airport_iata": 11,
+    "destination_airport_iata": 12,
+    "on_ground": 14,
+    "vertical_speed": 15,
+    "callsign": 16,
+    "airline_icao": 18,
+}
+_FLIGHT_NUMBER_COLUMN = 13
+
+KM_PER_KNOT_SECOND = 1.852 / 3600
+
+
+def _number(value) -> int:
+    return MISSING if value is None or value == "" or value == _NOT_AVAILABLE else int(value)
+
+
+def _coordinate(value) -> float:
+    return np.nan if value is None or value == "" else float(value)
+
+
+def _text(value) -> bytes:
+    return b"" if value is None or value == _NOT_AVAILABLE else str(value).encode("utf-8")
+
+
+def _column(row: List[Any], column: int):
+    return row[column] if column < len(row) else None
+
+
+def from_feed(content: Dict[str, Any]) -> np.ndarray:
+    """
+    Pack a FlightRadar24 live feed response straight into position records.
+
+    The feed maps flight ids to rows and mixes in metadata keys such as
+    "full_count" and "version", which are skipped.
+    """
+    rows = [(flight_id, row) for flight_id, row in content.items() if flight_id[:1].isnumeric()]
+    records = np.zeros(len(rows), dtype=POSITION_DTYPE)
+    # Over-long values are cut to the column width; ids and codes never are.
+    records["id"] = [_text(flight_id) for flight_id, _ in rows]
+    for name, column in _FEED_COLUMNS.items():
+        if name in ("latitude", "longitude"):
+            convert = _coordinate
+        elif name in _NUMBER_FIELDS:
+            convert = _number
+        else:
+            convert = _text
+        records[name] = [convert(_column(row, column)) for _, row in rows]
+    records["airline_iata"] = [_text((_column(row, _FLIGHT_NUMBER_COLUMN) or "")[:2]) for _, row in rows]
+    return records
+
+
+def located(records: np.ndarray) -> np.ndarray:
+    """Mask of the records with a usable position; the feed sends 0 for unknown coordinates."""
+    lats, lons = records["latitude"], records["longitude"]
+    return np.isfinite(lats) & np.isfinite(lons) & (lats != 0) & (lons != 0)
+
+
+def dead_reckon(records: np.ndarray, reported_fallback: np.ndarray, as_of: float, horizon: float):
+    """
+    Move records, in place, to where their last reported speed and heading put them at as_of.
+
+    Aircraft are projected along the great circle from the time of their report,
+    or reported_fallback where the feed had none, for at most `horizon` seconds.
+    Aircraft on the ground or without a speed or heading stay where they were.
+    """
+    speeds, headings = records["ground_speed"], records["heading"]
+    moving = (speeds != MISSING) & (speeds > 0) & (headings != MISSING) & (records["on_ground"] != 1)
+    reported = np.where(records["time"] > 0, records["time"], reported_fallback)
+    elapsed = np.clip(as_of - reported, 0.0, horizon)
+    distances = np.where(moving, speeds * elapsed * KM_PER_KNOT_SECOND, 0.0)
+    lats, lons = geo.destination(records["latitude"], records["longitude"], np.where(moving, headings, 0), distances)
+    moved = distances > 0
+    records["latitude"] = np.where(moved, lats, records["latitude"])
+    records["longitude"] = np.where(moved, lons, records["longitude"])
+
+
+# Airline, airport and aircraft codes repeat across thousands of aircraft, so
+# every distinct value is decoded once and the same str object is handed out.
+@lru_cache(maxsize=16384)
+def _decode(value: bytes) -> str:
+    return value.decode("utf-8", "replace") or _NOT_AVAILABLE
+
+
+class PositionView:
+    """Read-only, Flight-like view of one record; nothing is decoded until accessed."""
+
+    __slots__ = ("_records", "_row")
+
+    def __init__(self, records: np.ndarray, row: int):
+        self._records = records
+        self._row = row
+
+    def __getattr__(self, name: str):
+        if name not in POSITION_DTYPE.fields:
+            raise AttributeError(name)
+        value = self._records[self._row][name]
+        if name in _TEXT_FIELDS:
+            return _decode(value)
+        if name in _NUMBER_FIELDS:
+            return _NOT_AVAILABLE if value == MISSING else int(value)
+        return float(value)
+
+    def __repr__(self) -> str:
+        return f"<PositionView {self.id} {self.callsign} ({self.latitude}, {self.longitude})>"
+
+
+class Positions:
+    """Sequence of PositionViews over a record array, as a tile's flight list."""
+
+    __slots__ = ("records",)
+
+    def __init__(self, records: np.ndarray):
+        self.records = records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, row: int) -> PositionView:
+        if not -len(self.records) <= row < len(self.records):
+            raise IndexError(row)
+        return PositionView(self.records, row % len(self.records))
+
+    def __iter__(self):
+        return (PositionView(self.records, row) for row in range(len(self.records)))
+
+
+def empty() -> np.ndarray:
+    return np.zeros(0, dtype=POSITION_DTYPE)
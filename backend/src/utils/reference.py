@@ -0,0 +1,260 @@
+import csv
+import json
+import mmap
+import os
+import struct
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+# Generated by generate() below from airportsdata and the CSVs next to it:
+#   uv run --group data python -m src.utils.reference
+INDEX_PATH = os.path.join(DATA_DIR, "reference.bin")
+
+_MAGIC = b"FTREF1\n"
+_ALIGN = 8
+
+# Code columns per table, each with its own sorted lookup order.
+_KEYS = {
+    "airports": ("iata", "icao"),
+    "airlines": ("icao", "iata"),
+    "aircraft_types": ("icao",),
+}
+
+
+def _data_start(header_size: int) -> int:
+    """Offset of the column data: magic, header length, header, padded to alignment."""
+    start = len(_MAGIC) + 4 + header_size
+    return start + -start % _ALIGN
+
+
+class Airport(NamedTuple):
+    iata: str
+    icao: str
+    name: str
+    city: str
+    country_code: str
+    lat: float
+    lon: float
+    timezone: str
+
+
+class Airline(NamedTuple):
+    icao: str
+    iata: str
+    name: str
+
+
+class AircraftType(NamedTuple):
+    icao: str
+    name: str
+
+
+class _Table:
+    """
+    Read-only column store over the mapped index file.
+
+    Fixed-width columns are numpy views into the mapping; text columns are a
+    UTF-8 blob plus row offsets. Codes are found with a binary search over a
+    pre-sorted copy of the code column, so nothing is parsed per lookup.
+    """
+
+    def __init__(self, buffer, spec: dict, data_start: int):
+        self.rows = spec["rows"]
+        self._columns = {
+            name: np.frombuffer(buffer, dtype=column["dtype"], count=column["count"], offset=data_start + column["offset"])
+            for name, column in spec["columns"].items()
+        }
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def text(self, name: str, row: int) -> str:
+        offsets = self._columns[f"{name}.offsets"]
+        blob = self._columns[f"{name}.blob"]
+        return blob[offsets[row]:offsets[row + 1]].tobytes().decode("utf-8")
+
+    def code(self, name: str, row: int) -> str:
+        return self._columns[name][row].decode("ascii")
+
+    def value(self, name: str, row: int):
+        return self._columns[name][row].item()
+
+    def find(self, key: str, code: str) -> Optional[int]:
+        """Row index of the code in the given key column, or None."""
+        sorted_codes = self._columns[f"{key}.sorted"]
+        order = self._columns[f"{key}.order"]
+        try:
+            code = code.strip().upper().encode("ascii")
+        except UnicodeEncodeError:
+            return None
+        if not code or len(code) > sorted_codes.dtype.itemsize:
+            return None
+        needle = np.array(code, dtype=sorted_codes.dtype)
+        position = int(np.searchsorted(sorted_codes, needle))
+        if position < sorted_codes.size and sorted_codes[position] == needle:
+            return int(order[position])
+        return None
+
+
+class ReferenceIndex:
+    """Airports, airlines and aircraft types from the bundled index file."""
+
+    def __init__(self, path: str = INDEX_PATH):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a reference index")
+        (header_size,) = struct.unpack_from("<I", self._mmap, len(_MAGIC))
+        start = len(_MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_size])
+        data_start = _data_start(header_size)
+        self.airports = _Table(self._mmap, header["airports"], data_start)
+        self.airlines = _Table(self._mmap, header["airlines"], data_start)
+        self.aircraft_types = _Table(self._mmap, header["aircraft_types"], data_start)
+
+    def airport(self, code: Optional[str]) -> Optional[Airport]:
+        """Look up an airport by IATA (3 letters) or ICAO (4 letters) code."""
+        if not code:
+            return None
+        row = self.airports.find("iata" if len(code.strip()) == 3 else "icao", code)
+        if row is None:
+            return None
+        t = self.airports
+        return Airport(
+            t.code("iata", row), t.code("icao", row), t.text("name", row), t.text("city", row),
+            t.code("country", row), t.value("lat", row), t.value("lon", row), t.text("tz", row),
+        )
+
+    def airline(self, code: Optional[str]) -> Optional[Airline]:
+        """Look up an airline by ICAO (3 letters) or IATA (2 characters) code."""
+        if not code:
+            return None
+        row = self.airlines.find("icao" if len(code.strip()) == 3 else "iata", code)
+        if row is None:
+            return None
+        t = self.airlines
+        return Airline(t.code("icao", row), t.code("iata", row), t.text("name", row))
+
+    def aircraft_type(self, code: Optional[str]) -> Optional[AircraftType]:
+        """Look up an aircraft type by ICAO type designator (e.g. "B738")."""
+        if not code:
+            return None
+        row = self.aircraft_types.find("icao", code)
+        if row is None:
+            return None
+        return AircraftType(self.aircraft_types.code("icao", row), self.aircraft_types.text("name", row))
+
+
+_index: Optional[ReferenceIndex] = None
+
+
+def index() -> ReferenceIndex:
+    global _index
+    if _index is None:
+        _index = ReferenceIndex()
+    return _index
+
+
+# Search results repeat the same handful of airports and types, so the decoded
+# records are memoized on top of the mapped arrays.
+@lru_cache(maxsize=4096)
+def airport(code: Optional[str]) -> Optional[Airport]:
+    return index().airport(code)
+
+
+@lru_cache(maxsize=1024)
+def airline(code: Optional[str]) -> Optional[Airline]:
+    return index().airline(code)
+
+
+@lru_cache(maxsize=1024)
+def aircraft_type(code: Optional[str]) -> Optional[AircraftType]:
+    return index().aircraft_type(code)
+
+
+def _columns(rows, codes: Dict[str, int], texts, floats=()) -> Dict[str, np.ndarray]:
+    """Turn rows into fixed-width code, UTF-8 text and float columns."""
+    columns: Dict[str, np.ndarray] = {}
+    for name, width in codes.items():
+        columns[name] = np.array([row[name].upper().encode("ascii") for row in rows], dtype=f"S{width}")
+    for name in texts:
+        encoded = [row[name].encode("utf-8") for row in rows]
+        columns[f"{name}.offsets"] = np.cumsum([0] + [len(value) for value in encoded], dtype=np.int32)
+        columns[f"{name}.blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    for name in floats:
+        columns[name] = np.array([row[name] for row in rows], dtype=np.float64)
+    return columns
+
+
+def _add_keys(columns: Dict[str, np.ndarray], keys):
+    for key in keys:
+        codes = columns[key]
+        # Rows without this code sort first as b"" and are never matched.
+        order = np.argsort(codes, kind="stable").astype(np.int32)
+        columns[f"{key}.order"] = order
+        columns[f"{key}.sorted"] = codes[order]
+
+
+def _read_csv(name: str):
+    with open(os.path.join(DATA_DIR, name), newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def generate(path: str = INDEX_PATH):
+    """Rebuild the index from airportsdata and the bundled CSVs (development only, needs the "data" dependency group)."""
+    import airportsdata
+
+    airports = [
+        {
+            "iata": iata,
+            "icao": info["icao"],
+            "name": info["name"],
+            "city": info["city"],
+            "country": info["country"],
+            "lat": info["lat"],
+            "lon": info["lon"],
+            "tz": info["tz"],
+        }
+        for iata, info in sorted(airportsdata.load("IATA").items())
+    ]
+    airlines = _read_csv("airlines.csv")
+    aircraft_types = _read_csv("aircraft_types.csv")
+
+    tables = {
+        "airports": _columns(airports, {"iata": 3, "icao": 4, "country": 2}, ("name", "city", "tz"), ("lat", "lon")),
+        "airlines": _columns(airlines, {"icao": 3, "iata": 2}, ("name",)),
+        "aircraft_types": _columns(aircraft_types, {"icao": 4}, ("name",)),
+    }
+    rows = {"airports": len(airports), "airlines": len(airlines), "aircraft_types": len(aircraft_types)}
+    for table, columns in tables.items():
+        _add_keys(columns, _KEYS[table])
+
+    # Columns are laid out back to back after the header, each aligned for its dtype;
+    # offsets in the header are relative to the start of the data.
+    header = {table: {"rows": rows[table], "columns": {}} for table in tables}
+    chunks = []
+    offset = 0
+    for table, columns in tables.items():
+        for name, column in columns.items():
+            offset += -offset % _ALIGN
+            header[table]["columns"][name] = {"dtype": column.dtype.str, "count": column.size, "offset": offset}
+            chunks.append((offset, column.tobytes()))
+            offset += column.nbytes
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    data_start = _data_start(len(header_bytes))
+    with open(path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for chunk_offset, data in chunks:
+            f.write(b"\0" * (data_start + chunk_offset - f.tell()))
+            f.write(data)
+    print(f"[reference] Wrote {rows} to {path} ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    generate()
@@ -0,0 +1,221 @@
+import fcntl
+import json
+import mmap
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+
+from . import log, positions
+
+# Directory shared by every worker process, e.g. /dev/shm/flight-tower. When unset
+# each process keeps its own snapshot and cache, as with a single worker.
+SHARED_DIR = os.getenv("SHARED_STATE_DIR")
+
+# How often a worker checks whether another worker has finished refreshing a tile.
+LOCK_POLL_SECONDS = 0.05
+# Longest a cache read waits on a locked database, or on another thread's read,
+# before counting as a miss; reads run on the event loop.
+READ_TIMEOUT_SECONDS = 0.02
+
+# Tile file: magic, fetch time, record count and record size, then the records.
+_MAGIC = b"FTSNAP1\n"
+_HEADER = struct.Struct("<8sdII")
+_HEADER_SIZE = 64
+
+logger = log.get_logger("shared")
+
+
+class TileStore:
+    """
+    Snapshot tiles as fixed-layout files in a directory shared by worker processes.
+
+    A tile is written once by whichever worker holds its lock and replaced
+    atomically, so readers map the newest file and use its records in place
+    without copying or parsing. A reader that still maps an older file keeps a
+    consistent view of it until it moves on.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Mapped records per tile, keyed by the file identity they were mapped from.
+        self._mapped: Dict[Hashable, Tuple[Tuple[int, int], np.ndarray, float]] = {}
+        self._locks: Dict[Hashable, int] = {}
+
+    def _path(self, key: Tuple[int, int], suffix: str) -> str:
+        row, col = key
+        return os.path.join(self.directory, f"{row}_{col}{suffix}")
+
+    def read(self, key: Tuple[int, int]) -> Optional[Tuple[np.ndarray, float]]:
+        """Return the tile's mapped records and fetch time, or None if no worker has written it."""
+        path = self._path(key, ".bin")
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        mapped = self._mapped.get(key)
+        if mapped is not None and mapped[0] == identity:
+            return mapped[1], mapped[2]
+
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        magic, fetched_at, count, itemsize = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC or itemsize != positions.POSITION_DTYPE.itemsize:
+            return None
+        # The array keeps the mapping alive for as long as anyone holds the records.
+        records = np.frombuffer(buffer, dtype=positions.POSITION_DTYPE, count=count, offset=_HEADER_SIZE)
+        self._mapped[key] = (identity, records, fetched_at)
+        return records, fetched_at
+
+    def write(self, key: Tuple[int, int], records: np.ndarray, fetched_at: float):
+        path = self._path(key, ".bin")
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, fetched_at, len(records), positions.POSITION_DTYPE.itemsize).ljust(_HEADER_SIZE, b"\0"))
+            f.write(records.tobytes())
+        os.replace(temp, path)
+
+    def try_lock(self, key: Tuple[int, int]) -> bool:
+        """Take the tile's refresh lock without waiting; the OS drops it if the worker dies."""
+        fd = os.open(self._path(key, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._locks[key] = fd
+        return True
+
+    def unlock(self, key: Tuple[int, int]):
+        fd = self._locks.pop(key, None)
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def clear(self):
+        """Delete every tile so all workers refetch from upstream."""
+        self._mapped.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+class KeyValueStore:
+    """
+    JSON values with per-entry expiry in an SQLite file shared by worker processes.
+
+    WAL mode lets every worker read while one writes. Lookups are single-row
+    primary key reads served from the OS page cache, so they run inline with a
+    short busy timeout; a lookup that would wait longer, for the database or
+    for another thread's lookup, is treated as a miss.
+    Writes are queued to a background thread that commits whatever has piled
+    up in one transaction, so callers never wait on the database lock.
+    """
+
+    PURGE_INTERVAL_SECONDS = 60
+
+    def __init__(self, path: str):
+        self._conn = self._connect(path, READ_TIMEOUT_SECONDS)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        self._lock = threading.Lock()
+        self._writer_conn = self._connect(path, 5)
+        self._writes: "queue.Queue[Tuple[str, Iterable[tuple]]]" = queue.Queue()
+        self._last_purge = time.time()
+        threading.Thread(target=self._write_loop, name="shared-cache-writer", daemon=True).start()
+
+    @staticmethod
+    def _connect(path: str, timeout: float) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Return (value, seconds left to live), or None if absent, expired or the database is busy."""
+        if not self._lock.acquire(timeout=READ_TIMEOUT_SECONDS):
+            logger.debug("Shared cache read of %s/%s skipped: connection busy", namespace, key)
+            return None
+        try:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?", (namespace, str(key))
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            logger.debug("Shared cache read of %s/%s skipped: %s", namespace, key, e)
+            return None
+        finally:
+            self._lock.release()
+        if row is None:
+            return None
+        remaining = row[1] - time.time()
+        if remaining <= 0:
+            return None
+        return json.loads(row[0]), remaining
+
+    def set_many(self, namespace: str, items: Iterable[Tuple[Hashable, Any]], ttl: float):
+        items = list(items)
+        if not items:
+            return
+        expires_at = time.time() + ttl
+        # Encoded by the writer thread as it inserts them.
+        rows = ((namespace, str(key), json.dumps(value), expires_at) for key, value in items)
+        self._writes.put(("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows))
+
+    def delete(self, namespace: str, key: Hashable):
+        self._writes.put(("DELETE FROM entries WHERE namespace = ? AND key = ?", [(namespace, str(key))]))
+
+    def clear(self):
+        """Delete every entry, once the writes queued before it have landed."""
+        self._writes.put(("DELETE FROM entries", [()]))
+        self._writes.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                # One transaction per batch, so a whole refresh of positions costs one commit.
+                with self._writer_conn:
+                    self._writer_conn.execute("BEGIN")
+                    for statement, rows in batch:
+                        self._writer_conn.executemany(statement, rows)
+                    now = time.time()
+                    if now - self._last_purge >= self.PURGE_INTERVAL_SECONDS:
+                        self._writer_conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+                        self._last_purge = now
+            except sqlite3.Error as e:
+                logger.warning("Dropped %d shared cache write(s): %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+
+def tile_store() -> Optional[TileStore]:
+    return TileStore(os.path.join(SHARED_DIR, "tiles")) if SHARED_DIR else None
+
+
+def key_value_store() -> Optional[KeyValueStore]:
+    if not SHARED_DIR:
+        return None
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    return KeyValueStore(os.path.join(SHARED_DIR, "cache.sqlite3"))
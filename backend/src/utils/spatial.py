@@ -0,0 +1,134 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from . import geo
+
+# Grid cell size in degrees. At mid latitudes one cell is ~11 x 7 km, so a
+# 100 km search touches a few hundred mostly-empty cells at most.
+CELL_SIZE_DEG = 0.1
+
+KM_PER_DEG_LAT = 111.32
+
+
+class SpatialIndex:
+    """
+    Immutable lat/lon grid index over a set of points.
+
+    Points are bucketed into fixed-size cells and sorted by cell key, so every
+    run of cells along a grid row is one contiguous slice found with a binary
+    search. Radius, k-nearest and bounding-box queries only measure the points
+    in the cells they touch.
+    """
+
+    def __init__(self, lats, lons, cell_size_deg: float = CELL_SIZE_DEG):
+        self.cell_size_deg = cell_size_deg
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self._rows = int(math.ceil(180.0 / cell_size_deg))
+        self._cols = int(math.ceil(360.0 / cell_size_deg))
+
+        keys = self._row(self.lats) * self._cols + self._col(self.lons)
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+
+    def __len__(self) -> int:
+        return self.lats.size
+
+    def _row(self, lats):
+        rows = np.floor((np.asarray(lats) + 90.0) / self.cell_size_deg).astype(np.int64)
+        return np.clip(rows, 0, self._rows - 1)
+
+    def _col(self, lons):
+        lons = (np.asarray(lons) + 180.0) % 360.0
+        return np.floor(lons / self.cell_size_deg).astype(np.int64) % self._cols
+
+    def _row_slice(self, row: int, first_col: int, last_col: int) -> np.ndarray:
+        start = np.searchsorted(self._keys, row * self._cols + first_col, side="left")
+        stop = np.searchsorted(self._keys, row * self._cols + last_col, side="right")
+        return self._order[start:stop]
+
+    def _candidates(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Indices of the points in every cell overlapping the box (west > east wraps)."""
+        if len(self) == 0 or south > north:
+            return np.empty(0, dtype=np.intp)
+
+        first_row, last_row = (int(r) for r in self._row([south, north]))
+        if east - west >= 360.0:
+            col_ranges = [(0, self._cols - 1)]
+        else:
+            first_col, last_col = (int(c) for c in self._col([west, east]))
+            if first_col <= last_col and west <= east:
+                col_ranges = [(first_col, last_col)]
+            else:
+                col_ranges = [(first_col, self._cols - 1), (0, last_col)]
+
+        slices = [
+            self._row_slice(row, first_col, last_col)
+            for row in range(first_row, last_row + 1)
+            for first_col, last_col in col_ranges
+        ]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.intp)
+
+    def _circle_box(self, lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+        # Padded by the spherical error bound so exact geodesic queries never miss points.
+        dlat = radius_km * (1.0 + geo.SPHERICAL_ERROR) / KM_PER_DEG_LAT
+        south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        widest = max(abs(south), abs(north))
+        if widest >= 89.9:
+            return south, -180.0, north, 180.0
+        dlon = dlat / math.cos(math.radians(widest))
+        if dlon >= 180.0:
+            return south, -180.0, north, 180.0
+        return south, lon - dlon, north, lon + dlon
+
+    def near(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Indices of the points in the cells around a search circle, a superset of within()."""
+        return self._candidates(*self._circle_box(lat, lon, radius_km))
+
+    def bbox(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Indices of the points inside the box. A box with west > east crosses the antimeridian."""
+        candidates = self._candidates(south, west, north, east)
+        lats, lons = self.lats[candidates], self.lons[candidates]
+        in_lat = (lats >= south) & (lats <= north)
+        if west <= east:
+            in_lon = (lons >= west) & (lons <= east)
+        else:
+            in_lon = (lons >= west) | (lons <= east)
+        return candidates[in_lat & in_lon]
+
+    def within(self, lat: float, lon: float, radius_km: float, mode: str = "geodesic") -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, distances_km) of every point within radius_km, nearest first."""
+        return self.nearest(lat, lon, len(self), max_km=radius_km, mode=mode)
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int,
+        max_km: Optional[float] = None,
+        mode: str = "geodesic",
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, distances_km) of the k points closest to (lat, lon), optionally capped at max_km."""
+        if k <= 0 or len(self) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+        if max_km is not None:
+            return self._nearest_in(lat, lon, k, max_km, mode)
+
+        # Unbounded k-nearest: grow the search circle until it holds k points.
+        # Anything outside the circle is farther than everything inside it.
+        radius_km = 2.0 * self.cell_size_deg * KM_PER_DEG_LAT
+        while True:
+            indices, distances = self._nearest_in(lat, lon, k, radius_km, mode)
+            if indices.size >= k or radius_km >= math.pi * geo.EARTH_RADIUS_KM:
+                return indices, distances
+            radius_km *= 2.0
+
+    def _nearest_in(self, lat, lon, k, max_km, mode):
+        candidates = self.near(lat, lon, max_km)
+        positions, distances = geo.nearest(
+            lat, lon, self.lats[candidates], self.lons[candidates], k, max_km=max_km, mode=mode
+        )
+        return candidates[positions], distances
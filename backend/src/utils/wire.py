@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+
+import brotli
+
+from . import cache
+
+COMPACT_MEDIA_TYPE = "application/vnd.flighttower.compact+json"
+
+# FlightSummary fields, in column order.
+FIELDS = (
+    "id",
+    "callsign",
+    "lat",
+    "lon",
+    "distance_km",
+    "altitude_ft",
+    "speed_kts",
+    "origin_airport_name",
+    "origin_airport_iata",
+    "destination_airport_name",
+    "destination_airport_iata",
+    "heading_deg",
+    "origin_country",
+    "origin_country_code",
+    "origin_country_flag",
+    "destination_country",
+    "destination_country_code",
+    "destination_country_flag",
+    "airline_name",
+    "aircraft_code",
+    "aircraft_type",
+)
+# Columns whose values repeat across aircraft and are sent as indices into a string table.
+DICTIONARY_FIELDS = frozenset((
+    "origin_airport_name",
+    "origin_airport_iata",
+    "destination_airport_name",
+    "destination_airport_iata",
+    "origin_country",
+    "origin_country_code",
+    "origin_country_flag",
+    "destination_country",
+    "destination_country_code",
+    "destination_country_flag",
+    "airline_name",
+    "aircraft_code",
+    "aircraft_type",
+))
+
+# Responses smaller than this aren't worth compressing.
+MIN_COMPRESS_BYTES = 1000
+
+
+def wants_compact(response_format: Optional[str], accept: Optional[str]) -> bool:
+    """True if the client asked for the compact encoding by query param or Accept header."""
+    return response_format == "compact" or (accept is not None and COMPACT_MEDIA_TYPE in accept)
+
+
+def _row(flight: dict) -> Tuple:
+    return tuple(flight.get(field) for field in FIELDS)
+
+
+def snapshot_version(flights: List[dict]) -> str:
+    """Stable identifier of a result set, used as the base for later delta requests."""
+    digest = hashlib.sha1(json.dumps([_row(f) for f in flights], separators=(",", ":")).encode())
+    return digest.hexdigest()[:16]
+
+
+def _columnar(flights: List[dict]) -> dict:
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+    columns = {}
+    for field in FIELDS:
+        values = [flight.get(field) for flight in flights]
+        if field in DICTIONARY_FIELDS:
+            encoded = []
+            for value in values:
+                if value is None:
+                    encoded.append(None)
+                    continue
+                string_id = string_ids.get(value)
+                if string_id is None:
+                    string_id = string_ids[value] = len(strings)
+                    strings.append(value)
+                encoded.append(string_id)
+            values = encoded
+        columns[field] = values
+    return {"columns": list(FIELDS), "strings": strings, "rows": len(flights), "data": columns}
+
+
+def encode_compact(flights: List[dict], since: Optional[str] = None, version: Optional[str] = None) -> dict:
+    """
+    Columnar encoding of a search result.
+
+    Every response carries a version. A client that sends back the version it
+    already holds as `since` receives only the rows that changed plus the ids that
+    disappeared; if that version is unknown or expired it gets the full result.
+    Pass `version` if the caller already computed snapshot_version(flights).
+    """
+    version = version or snapshot_version(flights)
+    rows = {flight["id"]: _row(flight) for flight in flights if flight.get("id") is not None}
+    base = cache.get(since, namespace="wire_versions") if since else None
+    cache.set(version, rows, namespace="wire_versions")
+
+    if base is None:
+        payload = _columnar(flights)
+        payload["delta"] = False
+    else:
+        changed = [flight for flight in flights if base.get(flight.get("id")) != _row(flight)]
+        payload = _columnar(changed)
+        payload["delta"] = True
+        payload["base"] = since
+        payload["removed"] = [flight_id for flight_id in base if flight_id not in rows]
+
+    payload["format"] = "columnar"
+    payload["version"] = version
+    payload["count"] = len(flights)
+    return payload
+
+
+def encode_body(payload: dict, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Serialize a payload and compress it with brotli or gzip if the client accepts it."""
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    if len(body) < MIN_COMPRESS_BYTES or not accept_encoding:
+        return body, None
+
+    accepted = {token.split(";")[0].strip() for token in accept_encoding.lower().split(",")}
+    if "br" in accepted:
+        return brotli.compress(body, quality=5), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
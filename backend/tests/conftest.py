@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Set before the services are imported: tests must not share tiles or cache
+# entries with a real deployment's worker processes, nor write track segments
+# into, or restore them from, its directory.
+os.environ.pop("SHARED_STATE_DIR", None)
+os.environ.setdefault("TRACK_DIR", tempfile.mkdtemp(prefix="flight-tower-tracks-"))
@@ -0,0 +1,75 @@
+from src.utils import cache
+from src.utils.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_their_namespace_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    entries = TTLCache(namespace_ttls={"details": 30})
+    entries.set("a", 1, namespace="details")
+    entries.set("a", 2, ttl=60, namespace="flights")
+
+    clock.now += 30
+    assert entries.get("a", namespace="details") is None
+    assert entries.get("a", namespace="flights") == 2
+
+    stats = entries.stats()["namespaces"]
+    assert (stats["details"]["misses"], stats["details"]["expirations"]) == (1, 1)
+    assert stats["flights"]["hit_ratio"] == 1.0
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    entries = TTLCache(max_entries=3)
+    for key in "abc":
+        entries.set(key, key)
+    entries.get("a")
+    entries.set("d", "d")
+
+    assert [key for key in "abcd" if entries.get(key) is not None] == ["a", "c", "d"]
+    assert entries.stats()["namespaces"]["default"]["evictions"] == 1
+
+
+def test_byte_budget_bounds_the_cache():
+    value = "x" * 1000
+    entries = TTLCache(max_bytes=5 * cache._estimate_size(value))
+    for key in range(10):
+        entries.set(key, value)
+
+    stats = entries.stats()
+    assert stats["entries"] == 5
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert entries.get(9) == value and entries.get(4) is None
+
+
+def test_replacing_and_deleting_keep_the_byte_count():
+    entries = TTLCache()
+    entries.set("a", "x" * 100)
+    entries.set("a", "x" * 10)
+    entries.delete("a")
+
+    assert entries.stats()["bytes"] == 0
+
+
+def test_a_namespace_with_its_own_limits_cannot_evict_the_rest():
+    value = "x" * 1000
+    entries = TTLCache(max_entries=3, namespace_limits={"positions": (2, 10 * cache._estimate_size(value))})
+    for key in "abc":
+        entries.set(key, value, namespace="details")
+    for key in range(10):
+        entries.set(key, value, namespace="positions")
+
+    assert all(entries.get(key, namespace="details") == value for key in "abc")
+    assert [key for key in range(10) if entries.get(key, namespace="positions")] == [8, 9]
+
+    stats = entries.stats()
+    assert (stats["entries"], stats["max_entries"]) == (5, 5)
+    assert stats["namespaces"]["positions"]["evictions"] == 8
+    assert stats["namespaces"]["details"]["evictions"] == 0
@@ -0,0 +1,46 @@
+import pytest
+
+from src.utils import countries
+
+
+@pytest.mark.parametrize("spelling", ["Poland", "poland", "  POLAND ", "PL", "pol", "Polska"])
+def test_lookup_by_name_alias_or_code(spelling):
+    country = countries.lookup(spelling)
+    assert country is not None
+    assert (country.name, country.alpha2, country.alpha3) == ("Poland", "PL", "POL")
+
+
+@pytest.mark.parametrize("name, alpha2", [
+    ("United Kingdom", "GB"),
+    ("Czech Republic", "CZ"),
+    ("Côte d'Ivoire", "CI"),
+    ("Ivory Coast", "CI"),
+    ("South Korea", "KR"),
+    ("Democratic Republic Of The Congo", "CD"),
+])
+def test_flightradar_spellings_resolve(name, alpha2):
+    assert countries.lookup(name).alpha2 == alpha2
+
+
+def test_flags():
+    assert countries.flag_emoji("pl") == "🇵🇱"
+    assert countries.get_flag("Germany") == "🇩🇪"
+    assert countries.get_flag("Atlantis") == countries.UNKNOWN_FLAG
+    assert countries.get_flag(None) == countries.UNKNOWN_FLAG
+
+
+def test_unknown_or_empty_names():
+    assert countries.lookup("") is None
+    assert countries.lookup(None) is None
+    assert countries.lookup("Atlantis") is None
+
+
+def test_table_from_rows():
+    table = countries.CountryTable([
+        ["AA", "AAA", "Alpha", "Europe", ["Alphaland"]],
+        ["BB", "BBB", "Beta", None, ["Alphaland"]],
+    ])
+    assert len(table) == 2
+    # The first country to claim a spelling keeps it.
+    assert table.lookup("alphaland").alpha2 == "AA"
+    assert table.lookup("BBB").region is None
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from src.utils import geo
+
+WARSAW = (52.2297, 21.0122)
+KRAKOW = (50.0647, 19.9450)
+
+
+@pytest.fixture(scope="module")
+def points():
+    rnd = np.random.default_rng(1)
+    return rnd.uniform(48.0, 56.0, 5000), rnd.uniform(14.0, 28.0, 5000)
+
+
+def test_get_distance_modes_agree_on_a_known_distance():
+    assert geo.get_distance(*WARSAW, *KRAKOW) == pytest.approx(252.4, abs=0.5)
+    for mode in ("haversine", "equirectangular"):
+        assert geo.get_distance(*WARSAW, *KRAKOW, mode=mode) == pytest.approx(252.4, rel=0.01)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        geo.distances_km(0.0, 0.0, [1.0], [1.0], mode="manhattan")
+
+
+@pytest.mark.parametrize("mode", geo.MODES)
+def test_nearest_matches_a_full_sort(points, mode):
+    lats, lons = points
+    indices, distances = geo.nearest(*WARSAW, lats, lons, 25, mode=mode)
+
+    expected = np.argsort(geo.distances_km(*WARSAW, lats, lons, mode), kind="stable")[:25]
+    assert indices.tolist() == expected.tolist()
+    assert np.all(np.diff(distances) >= 0)
+
+
+def test_nearest_ranks_by_geodesic_where_haversine_disagrees():
+    # On the equator a degree of longitude is longer on the ellipsoid than on the
+    # sphere and a degree of latitude shorter: east is nearer by haversine, north by geodesic.
+    lats, lons = [0.0, 1.0064], [1.0, 0.0]
+    assert np.argmin(geo.haversine_km(0.0, 0.0, lats, lons)) == 0
+
+    indices, distances = geo.nearest(0.0, 0.0, lats, lons, 1)
+    assert indices.tolist() == [1]
+    assert distances[0] == pytest.approx(geo.geodesic_km(0.0, 0.0, lats[1:], lons[1:])[0])
+
+
+def test_nearest_stops_at_max_km(points):
+    lats, lons = points
+    indices, distances = geo.nearest(*WARSAW, lats, lons, len(lats), max_km=50.0)
+
+    exact = geo.geodesic_km(*WARSAW, lats, lons)
+    assert sorted(indices.tolist()) == np.flatnonzero(exact <= 50.0).tolist()
+    assert distances.max() <= 50.0
+
+
+def test_nearest_with_nothing_to_rank():
+    for lats, lons, k in (([], [], 5), ([52.0], [21.0], 0)):
+        indices, distances = geo.nearest(*WARSAW, lats, lons, k)
+        assert indices.size == 0 and distances.size == 0
+
+
+def test_destination_travels_along_the_great_circle():
+    lats, lons = geo.destination([0.0, 10.0], [179.9, 0.0], [90.0, 0.0], [111.0, 500.0])
+    # Eastward across the antimeridian, and due north.
+    assert lats[0] == pytest.approx(0.0, abs=1e-9)
+    assert lons[0] == pytest.approx(-179.1, abs=0.01)
+    assert geo.haversine_km(10.0, 0.0, lats[1:], lons[1:])[0] == pytest.approx(500.0)
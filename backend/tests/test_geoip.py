@@ -0,0 +1,68 @@
+import ipaddress
+
+import pytest
+
+from src.utils import geoip
+
+# DB-IP city lite rows: start, end, continent, country, region, city, lat, lon.
+CITY_CSV = """\
+1.0.0.0,1.0.0.255,OC,AU,Queensland,South Brisbane,-27.4767,153.017
+5.172.0.0,5.172.127.255,EU,PL,Mazovia,Warsaw,52.2298,21.0118
+5.172.128.0,5.172.255.255,EU,PL,Mazovia,Warsaw,52.2298,21.0118
+5.173.0.0,5.173.255.255,EU,PL,Lesser Poland,Krakow,50.0614,19.9366
+2a01:110::,2a01:110:ffff:ffff:ffff:ffff:ffff:ffff,EU,GB,England,London,51.5085,-0.12574
+"""
+
+
+@pytest.fixture(scope="module")
+def ranges(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("geoip")
+    source = directory / "dbip-city-lite.csv"
+    source.write_text(CITY_CSV)
+    geoip.generate(str(source), str(directory / "ip_ranges.bin"))
+    return geoip.RangeTable(str(directory / "ip_ranges.bin"))
+
+
+def test_addresses_resolve_to_their_range(ranges):
+    assert ranges.lookup("5.172.200.1") == geoip.Location(52.2298, 21.0118, "PL", "Warsaw")
+    assert ranges.lookup("5.173.0.0").city == "Krakow"
+    assert ranges.lookup("1.0.0.255").country_code == "AU"
+    assert ranges.lookup("2a01:110::1").city == "London"
+
+
+@pytest.mark.parametrize("ip", ["0.255.255.255", "1.0.1.0", "5.174.0.1", "2a01:111::1", "::1", "not an ip"])
+def test_addresses_outside_every_range_miss(ranges, ip):
+    assert ranges.lookup(ip) is None
+
+
+def test_adjacent_ranges_of_one_place_are_merged(ranges):
+    assert len(ranges) == 4
+    assert ranges.source == "dbip-city-lite.csv"
+
+
+@pytest.mark.parametrize("peer, forwarded_for, expected", [
+    # A public peer is the client, whatever it claims to be forwarding for.
+    ("203.0.113.7", "198.51.100.1", "203.0.113.7"),
+    ("203.0.113.7:51234", None, "203.0.113.7"),
+    ("[2001:db8::7]:443", "198.51.100.1", "2001:db8::7"),
+    # Behind our proxy, the nearest hop that isn't one of ours.
+    ("127.0.0.1", "198.51.100.1", "198.51.100.1"),
+    ("10.0.0.5", "198.51.100.66, 198.51.100.1, 192.168.1.10", "198.51.100.1"),
+    ("::1", "[2001:db8::1]:8080", "2001:db8::1"),
+    # Only our own hops in the header: the furthest one is the best we know.
+    ("127.0.0.1", "10.1.1.1, 192.168.0.2", "10.1.1.1"),
+    # Garbage in the header stops the walk at the last address we could trust.
+    ("127.0.0.1", "198.51.100.1, junk", "127.0.0.1"),
+    ("127.0.0.1", None, "127.0.0.1"),
+    (None, "198.51.100.1", None),
+    ("not an ip", None, None),
+])
+def test_client_ip(peer, forwarded_for, expected):
+    assert geoip.client_ip(peer, forwarded_for) == expected
+
+
+def test_only_configured_proxies_are_trusted(monkeypatch):
+    monkeypatch.setattr(geoip, "TRUSTED_PROXIES", (ipaddress.ip_network("203.0.113.0/24"),))
+
+    assert geoip.client_ip("203.0.113.7", "198.51.100.1") == "198.51.100.1"
+    assert geoip.client_ip("127.0.0.1", "198.51.100.1") == "127.0.0.1"
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from src.services import maplayer
+from src.utils import positions
+
+
+def records(lats, lons):
+    result = np.zeros(len(lats), dtype=positions.POSITION_DTYPE)
+    result["latitude"] = lats
+    result["longitude"] = lons
+    result["id"] = [f"{i:08x}".encode() for i in range(len(lats))]
+    result["altitude"] = positions.MISSING
+    result["ground_speed"] = 400
+    result["heading"] = positions.MISSING
+    return result
+
+
+def test_snap_widens_the_viewport_to_whole_tiles():
+    assert maplayer.snap(49.6, 14.2, 54.9, 24.1) == (49.0, 14.0, 55.0, 25.0)
+    # Panning within the same tiles keeps the same layer.
+    assert maplayer.snap(49.1, 14.9, 54.2, 24.8) == maplayer.snap(49.6, 14.2, 54.9, 24.1)
+
+
+def test_snap_keeps_a_viewport_across_the_antimeridian_wrapped():
+    south, west, north, east = maplayer.snap(-10.5, 170.5, 10.5, -170.5)
+    assert (south, north) == (-11.0, 11.0)
+    assert west > east
+    assert (west, east) == (170.0, -170.0)
+
+
+def test_snap_of_the_whole_world():
+    assert maplayer.snap(-89.5, -540.0, 89.5, 540.0) == (-90.0, -180.0, 90.0, 180.0)
+
+
+def test_cell_size_follows_the_zoom_level():
+    assert maplayer.cell_size_deg(maplayer.MAP_FULL_DETAIL_ZOOM) is None
+    assert maplayer.cell_size_deg(2) == pytest.approx(2 * maplayer.cell_size_deg(3))
+
+
+def test_clusters_merge_aircraft_sharing_a_cell():
+    cell = 1.0
+    found = records([50.2, 50.4, 50.6, 52.5], [20.1, 20.3, 20.5, 22.5])
+    features = maplayer._clusters(found, cell)
+
+    clusters = [f for f in features if f["properties"]["cluster"]]
+    aircraft = [f for f in features if not f["properties"]["cluster"]]
+    assert len(clusters) == 1
+    assert clusters[0]["properties"]["count"] == 3
+    assert clusters[0]["geometry"]["coordinates"] == pytest.approx([20.3, 50.4])
+    assert len(aircraft) == 1
+    assert aircraft[0]["properties"]["id"] == "00000003"
+    assert aircraft[0]["properties"]["speed_kts"] == 400
+    assert aircraft[0]["properties"]["altitude_ft"] is None
+
+
+def test_no_cluster_spans_the_antimeridian():
+    features = maplayer._clusters(records([0.5, 0.5], [179.9, -179.9]), 1.0)
+    assert [f["properties"]["cluster"] for f in features] == [False, False]
+
+
+def test_features_are_one_per_aircraft_at_full_detail():
+    found = records([50.2, 50.21], [20.1, 20.11])
+    assert len(maplayer.features(found, maplayer.MAP_FULL_DETAIL_ZOOM)) == 2
+    assert len(maplayer.features(found, 3)) == 1
+    assert maplayer.features(found[:0], 3) == []
@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.services import flightradar, poller
+
+
+def row(flight_id, lat=52.0, altitude_ft=35000):
+    return {"id": flight_id, "lat": lat, "lon": 21.0, "altitude_ft": altitude_ft, "speed_kts": 450, "heading_deg": 90}
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """The region's flights by id, as the poller will read them from the snapshot."""
+    rows = {}
+
+    async def within(lat, lon, radius_km, mode, max_age):
+        return [(SimpleNamespace(id=flight_id, row=dict(summary)), 1.0) for flight_id, summary in rows.items()]
+
+    monkeypatch.setattr(flightradar.snapshot, "within", within)
+    monkeypatch.setattr(flightradar, "summarize_flight", lambda flight, distance_km: flight.row)
+    return rows
+
+
+def test_first_delta_resets_the_client():
+    subscription = poller.Subscription(52.0, 21.0, 50)
+    delta = subscription.diff({"a": row("a")})
+
+    assert delta == {"version": 1, "reset": True, "added": [row("a")], "moved": [], "removed": []}
+
+
+def test_later_deltas_carry_only_what_changed():
+    subscription = poller.Subscription(52.0, 21.0, 50)
+    subscription.diff({"a": row("a"), "b": row("b")})
+
+    delta = subscription.diff({"a": row("a", altitude_ft=36000), "c": row("c")})
+    assert delta["version"] == 2
+    assert delta["reset"] is False
+    assert delta["added"] == [row("c")]
+    assert delta["moved"] == [row("a", altitude_ft=36000)]
+    assert delta["removed"] == ["b"]
+
+    assert subscription.diff({"a": row("a", altitude_ft=36000), "c": row("c")}) is None
+
+
+def test_a_client_that_falls_behind_is_resynced():
+    subscription = poller.Subscription(52.0, 21.0, 50)
+    for i in range(poller.MAX_PENDING_DELTAS):
+        subscription.publish(subscription.diff({str(i): row(str(i))}))
+    subscription.publish(subscription.diff({}))
+
+    assert subscription.queue.empty()
+    assert subscription.diff({"a": row("a")})["reset"] is True
+
+
+def test_subscribers_are_sent_deltas_until_they_leave(feed):
+    async def scenario():
+        regions = poller.RegionPoller(interval=0.01)
+        feed.update(a=row("a"), b=row("b"))
+        subscription = regions.subscribe(52.0, 21.0, 50)
+        first = await asyncio.wait_for(subscription.queue.get(), 1)
+
+        feed["a"] = row("a", lat=52.1)
+        del feed["b"]
+        second = await asyncio.wait_for(subscription.queue.get(), 1)
+
+        regions.unsubscribe(subscription)
+        await asyncio.sleep(0.05)
+        stopped = regions._task.done()
+        await regions.stop()
+        return first, second, stopped
+
+    first, second, stopped = asyncio.run(scenario())
+    assert first["reset"] is True
+    assert sorted(r["id"] for r in first["added"]) == ["a", "b"]
+    assert second["moved"] == [row("a", lat=52.1)]
+    assert second["removed"] == ["b"]
+    # The poll loop ends with its last subscriber.
+    assert stopped
+
+
+def test_a_new_subscriber_gets_a_snapshot_right_away(feed):
+    async def scenario():
+        regions = poller.RegionPoller(interval=60)
+        feed["a"] = row("a")
+        regions.subscribe(52.0, 21.0, 50)
+        late = regions.subscribe(50.0, 19.0, 50)
+        delta = await asyncio.wait_for(late.queue.get(), 1)
+        await regions.stop()
+        return delta
+
+    assert asyncio.run(scenario())["added"] == [row("a")]
+
+
+def test_leaving_subscribers_first_poll_is_cancelled(monkeypatch):
+    async def within(lat, lon, radius_km, mode, max_age):
+        # Upstream never answers.
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(flightradar.snapshot, "within", within)
+
+    async def scenario():
+        regions = poller.RegionPoller(interval=60)
+        regions.subscribe(52.0, 21.0, 50)
+        leaving = regions.subscribe(50.0, 19.0, 50)
+        staying = regions.subscribe(48.0, 17.0, 50)
+        await asyncio.sleep(0)
+
+        regions.unsubscribe(leaving)
+        await asyncio.sleep(0)
+        after_leaving = leaving.first_poll.cancelled(), staying.first_poll.done()
+        await regions.stop()
+        await asyncio.sleep(0)
+        return after_leaving, staying.first_poll.cancelled(), regions.subscriber_count
+
+    assert asyncio.run(scenario()) == ((True, False), True, 0)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from src.utils import geo, positions
+
+NOW = 1_700_000_000.0
+
+
+def records(**columns):
+    count = len(next(iter(columns.values())))
+    result = np.zeros(count, dtype=positions.POSITION_DTYPE)
+    result["time"] = NOW - 60
+    result["on_ground"] = 0
+    for name, values in columns.items():
+        result[name] = values
+    return result
+
+
+def test_from_feed_skips_metadata_and_fills_missing_values():
+    feed = {
+        "full_count": 2,
+        "version": 4,
+        "2f1a3b4c": ["48AE21", 52.1, 20.9, 270, 3500, 180, "", "", "B738", "SP-LWA", 1700000000, "WAW", "LHR", "LO281", 0, -640, "LOT281", 0, "LOT"],
+        "2f1a3b4d": ["48AE22", 50.0, 19.8, None, "", None],
+    }
+    found = positions.from_feed(feed)
+
+    assert found["id"].tolist() == [b"2f1a3b4c", b"2f1a3b4d"]
+    assert found["callsign"][0] == b"LOT281"
+    assert found["airline_iata"][0] == b"LO"
+    assert found["callsign"][1] == b""
+    # Missing values read back as FlightRadar24's placeholder.
+    first, second = positions.Positions(found)
+    assert (first.altitude, second.altitude) == (3500, "N/A")
+    assert second.heading == "N/A"
+    assert second.callsign == "N/A"
+
+
+def test_dead_reckon_moves_aircraft_along_their_heading():
+    found = records(latitude=[0.0], longitude=[10.0], ground_speed=[480], heading=[90])
+    positions.dead_reckon(found, np.array([0.0]), NOW, horizon=300)
+
+    # 480 kts for the minute since the report.
+    travelled = geo.haversine_km(0.0, 10.0, found["latitude"], found["longitude"])[0]
+    assert travelled == pytest.approx(480 * 60 * positions.KM_PER_KNOT_SECOND)
+    assert found["longitude"][0] > 10.0
+    assert found["latitude"][0] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_dead_reckon_is_capped_at_the_horizon():
+    found = records(latitude=[0.0], longitude=[10.0], ground_speed=[480], heading=[0])
+    positions.dead_reckon(found, np.array([0.0]), NOW + 3600, horizon=120)
+
+    travelled = geo.haversine_km(0.0, 10.0, found["latitude"], found["longitude"])[0]
+    assert travelled == pytest.approx(480 * 120 * positions.KM_PER_KNOT_SECOND)
+
+
+def test_dead_reckon_uses_the_fallback_time_without_a_report_time():
+    found = records(latitude=[0.0], longitude=[10.0], ground_speed=[480], heading=[0], time=[0])
+    positions.dead_reckon(found, np.array([NOW - 30]), NOW, horizon=300)
+
+    travelled = geo.haversine_km(0.0, 10.0, found["latitude"], found["longitude"])[0]
+    assert travelled == pytest.approx(480 * 30 * positions.KM_PER_KNOT_SECOND)
+
+
+def test_dead_reckon_leaves_aircraft_it_cannot_project():
+    found = records(
+        latitude=[1.0, 2.0, 3.0, 4.0],
+        longitude=[1.0, 2.0, 3.0, 4.0],
+        ground_speed=[20, positions.MISSING, 300, 0],
+        heading=[90, 90, positions.MISSING, 90],
+        on_ground=[1, 0, 0, 0],
+    )
+    positions.dead_reckon(found, np.zeros(4), NOW, horizon=300)
+
+    assert found["latitude"].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert found["longitude"].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_located_drops_zero_and_missing_coordinates():
+    found = records(latitude=[52.0, 0.0, np.nan], longitude=[21.0, 0.0, 21.0])
+    assert positions.located(found).tolist() == [True, False, False]
+
+
+def test_views_read_records_like_flights():
+    found = positions.Positions(records(latitude=[52.0, 50.0], longitude=[21.0, 19.9], id=[b"1a", b"1b"]))
+
+    assert [view.id for view in found] == ["1a", "1b"]
+    assert found[-1].latitude == 50.0
+    assert found[0].registration == "N/A"
+    with pytest.raises(IndexError):
+        found[2]
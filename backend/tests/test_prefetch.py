@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from src.services import flightradar
+from src.services.prefetch import DetailPrefetcher
+from src.services.scheduler import Priority, current_priority, prioritized
+from src.utils import cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cache.clear()
+
+
+class Lookups:
+    """Fake details lookup recording each id and the priority it ran at."""
+
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+
+    async def __call__(self, flight_id):
+        self.calls.append((flight_id, current_priority.get()))
+        await asyncio.sleep(0)
+        if flight_id in self.fail:
+            raise RuntimeError("upstream down")
+        return {"airline": "LOT"}
+
+
+async def prefetched(prefetcher, *batches):
+    for batch in batches:
+        prefetcher.enqueue(batch)
+    await prefetcher._queue.join()
+    await prefetcher.stop()
+
+
+def test_top_results_are_fetched_in_the_background():
+    lookups = Lookups()
+    prefetcher = DetailPrefetcher(lookups, top_k=3, workers=2, rate=100)
+    asyncio.run(prefetched(prefetcher, ["a", "b", "c", "d"]))
+
+    assert sorted(lookups.calls) == [(flight_id, Priority.BACKGROUND) for flight_id in "abc"]
+
+
+def test_cached_queued_and_missing_ids_are_skipped():
+    lookups = Lookups()
+    cache.set("a", {"airline": "LOT"}, namespace="details")
+    prefetcher = DetailPrefetcher(lookups, top_k=5, workers=1, rate=100)
+    asyncio.run(prefetched(prefetcher, ["a", None, "b", "b", ""], ["b", "c"]))
+
+    assert sorted(flight_id for flight_id, _ in lookups.calls) == ["b", "c"]
+
+
+def test_a_full_queue_drops_new_ids():
+    lookups = Lookups()
+    prefetcher = DetailPrefetcher(lookups, top_k=10, workers=1, rate=100, queue_size=2)
+    asyncio.run(prefetched(prefetcher, ["a", "b", "c", "d"]))
+
+    assert [flight_id for flight_id, _ in lookups.calls] == ["a", "b"]
+
+
+def test_a_failed_lookup_does_not_stop_the_workers():
+    lookups = Lookups(fail={"a"})
+    prefetcher = DetailPrefetcher(lookups, top_k=5, workers=1, rate=100)
+    asyncio.run(prefetched(prefetcher, ["a", "b"]))
+
+    assert [flight_id for flight_id, _ in lookups.calls] == ["a", "b"]
+
+
+def test_disabled_prefetcher_starts_nothing():
+    lookups = Lookups()
+    prefetcher = DetailPrefetcher(lookups, top_k=0)
+
+    async def scenario():
+        prefetcher.enqueue(["a"])
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert lookups.calls == [] and prefetcher._queue is None
+
+
+def test_concurrent_lookups_of_one_flight_share_a_fetch(monkeypatch):
+    loads = []
+
+    async def load(flight_id):
+        loads.append(flight_id)
+        await asyncio.sleep(0.01)
+        return {"airline": "LOT"}
+
+    monkeypatch.setattr(flightradar, "_load_flight_details", load)
+
+    async def scenario():
+        return await asyncio.gather(*(flightradar.get_flight_details_from_obj("a") for _ in range(3)))
+
+    assert asyncio.run(scenario()) == [{"airline": "LOT"}] * 3
+    assert loads == ["a"]
+
+
+def test_joining_a_background_lookup_raises_its_priority(monkeypatch):
+    priorities = []
+    started = asyncio.Event()
+
+    async def load(flight_id):
+        priorities.append(current_priority.get())
+        started.set()
+        await asyncio.sleep(0.01)
+        priorities.append(current_priority.get())
+        return {"airline": "LOT"}
+
+    monkeypatch.setattr(flightradar, "_load_flight_details", load)
+
+    async def scenario():
+        with prioritized(Priority.BACKGROUND):
+            prefetch = asyncio.ensure_future(flightradar.get_flight_details_from_obj("a"))
+        await started.wait()
+        with prioritized(Priority.SEARCH):
+            joined = await flightradar.get_flight_details_from_obj("a")
+        return joined, await prefetch
+
+    assert asyncio.run(scenario()) == ({"airline": "LOT"}, {"airline": "LOT"})
+    assert priorities == [Priority.BACKGROUND, Priority.SEARCH]
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.services import flightradar
+from src.utils import reference
+
+
+@pytest.mark.parametrize("code", ["WAW", "waw", " EPWA", "epwa"])
+def test_airport_by_iata_or_icao(code):
+    airport = reference.airport(code)
+    assert (airport.iata, airport.icao, airport.country_code) == ("WAW", "EPWA", "PL")
+    assert airport.lat == pytest.approx(52.17, abs=0.05)
+
+
+def test_airline_and_aircraft_type():
+    assert reference.airline("LOT").iata == "LO"
+    assert reference.airline("LO").icao == "LOT"
+    assert reference.aircraft_type("b738").icao == "B738"
+
+
+@pytest.mark.parametrize("code", [None, "", "ZZZ", "ŁÓD", "TOOLONGCODE"])
+def test_unknown_codes_are_none(code):
+    assert reference.airport(code) is None
+    assert reference.airline(code) is None
+    assert reference.aircraft_type(code) is None
+
+
+def flight(**fields):
+    values = dict(
+        id="2f1a3b4c", callsign="LOT281", latitude=52.1, longitude=20.9, altitude=3500,
+        ground_speed=180, heading=270, origin_airport_iata="WAW", destination_airport_iata="LHR",
+        airline_icao="LOT", airline_iata="LO", aircraft_code="B738",
+    )
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+def test_summary_is_enriched_from_the_index():
+    summary = flightradar.summarize_flight(flight(), 12.5)
+
+    assert summary["distance_km"] == 12.5
+    assert summary["origin_airport_iata"] == "WAW"
+    assert summary["origin_country_code"] == "PL"
+    assert summary["destination_country"] == "United Kingdom"
+    assert summary["airline_name"] == reference.airline("LOT").name
+    assert summary["aircraft_type"] == reference.aircraft_type("B738").name
+
+
+@pytest.mark.parametrize("missing", ["", "N/A"])
+def test_summary_of_unknown_codes(missing):
+    codes = dict.fromkeys(["destination_airport_iata", "airline_icao", "airline_iata", "aircraft_code"], missing)
+    summary = flightradar.summarize_flight(flight(**codes), 1.0)
+
+    assert summary["destination_airport_iata"] is None
+    assert summary["destination_airport_name"] is None
+    assert summary["destination_country_flag"] is None
+    assert summary["airline_name"] is None
+    assert summary["aircraft_code"] is None
+
+
+def test_summary_of_a_flight_missing_values():
+    # How position records read back values the feed didn't have.
+    summary = flightradar.summarize_flight(flight(callsign="N/A", altitude="N/A", ground_speed="N/A", heading="N/A"), 1.0)
+
+    assert [summary[field] for field in ("callsign", "altitude_ft", "speed_kts", "heading_deg")] == [None] * 4
+    assert summary["origin_airport_iata"] == "WAW"
@@ -0,0 +1,220 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.main import app
+from bench import replay
+from src.services import flightradar, snapshot, upstream
+from src.utils import cache, geo, geoip
+
+CENTER = (50.0, 10.0)
+
+
+@pytest.fixture(scope="module")
+def fixture():
+    return replay.synthetic_fixture(flights=3000, center=CENTER, spread_deg=4.0)
+
+
+@pytest.fixture(scope="module")
+def client(fixture):
+    # One app lifespan for the module: shutting down stops the log writer.
+    original = upstream.client
+    replay.install(fixture, latency=0)
+    try:
+        with pytest.MonkeyPatch.context() as patch:
+            # Aircraft stay where the feed put them, so results and their ETags
+            # don't change when the clock crosses a dead reckoning step.
+            patch.setattr(snapshot, "DEAD_RECKONING_HORIZON_SECONDS", 0)
+            with TestClient(app) as client:
+                yield client
+    finally:
+        upstream.client = original
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(client):
+    cache.clear()
+    flightradar.snapshot.clear()
+
+
+def search(client, headers=None, **params):
+    params = {"lat": CENTER[0], "lon": CENTER[1], "radius_km": 50, "limit": 20, **params}
+    return client.get("/flights/search", params=params, headers=headers)
+
+
+def test_search_returns_the_nearest_flights_in_range(client, fixture):
+    response = search(client)
+    assert response.status_code == 200
+    flights = response.json()["flights"]
+
+    distances = [flight["distance_km"] for flight in flights]
+    assert len(flights) == 20
+    assert distances == sorted(distances)
+    assert max(distances) <= 50.0
+    # Nothing in the feed is closer than the nearest result.
+    feed = fixture["feed"]
+    lats = [row[1] for row in feed.values()]
+    lons = [row[2] for row in feed.values()]
+    closest = geo.nearest(*CENTER, lats, lons, 1)[1][0]
+    assert distances[0] == pytest.approx(closest, abs=0.01)
+
+
+def test_repeated_searches_share_one_upstream_fetch(client):
+    calls = upstream.client._transport.calls
+    before = calls["get_flights"]
+    for _ in range(3):
+        assert search(client).status_code == 200
+    assert calls["get_flights"] - before == 1
+
+
+def test_search_revalidates_with_etag(client):
+    first = search(client)
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"].startswith("public, max-age=")
+    assert first.headers["vary"] == "Accept, Accept-Encoding"
+
+    second = search(client, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+
+    posted = client.post("/flights/search", json={"lat": CENTER[0], "lon": CENTER[1], "radius_km": 50, "limit": 20})
+    assert posted.json() == first.json()
+    assert "cache-control" not in posted.headers
+
+
+def test_compact_search_sends_deltas(client):
+    full = search(client, format="compact").json()
+    assert full["format"] == "columnar"
+    assert full["delta"] is False
+
+    delta = search(client, format="compact", since=full["version"]).json()
+    assert delta["delta"] is True
+    assert delta["rows"] == 0
+    assert delta["removed"] == []
+
+
+def test_batch_search_answers_every_query(client):
+    queries = [
+        {"lat": CENTER[0], "lon": CENTER[1], "radius_km": 30, "limit": 5},
+        {"lat": CENTER[0] + 1.0, "lon": CENTER[1] - 1.0, "radius_km": 20, "limit": 3},
+    ]
+    response = client.post("/flights/search:batch", json={"queries": queries})
+    assert response.status_code == 200
+
+    results = response.json()["results"]
+    assert [result["count"] for result in results] == [5, 3]
+    single = search(client, radius_km=30, limit=5).json()["flights"]
+    assert [flight["id"] for flight in results[0]["flights"]] == [flight["id"] for flight in single]
+
+
+def test_details_of_a_known_flight(client, fixture):
+    flight_id = next(iter(fixture["details"]))
+    details = client.get(f"/flights/{flight_id}").json()
+
+    assert details["airline"] == "Test Airways"
+    assert details["route"]["from"].endswith(f"({fixture['feed'][flight_id][11]})")
+
+
+def test_batch_details_answers_each_id(client, fixture):
+    ids = list(fixture["details"])[:3]
+    response = client.post("/flights/details:batch", json={"ids": ids + ids[:1]})
+    assert response.status_code == 200
+
+    batch = response.json()
+    assert sorted(batch["results"]) == sorted(ids)
+    assert batch["errors"] == {}
+    assert all(details["airline"] == "Test Airways" for details in batch["results"].values())
+
+
+def test_unknown_flight_is_not_found_and_remembered(client):
+    calls = upstream.client._transport.calls
+    before = calls["get_flight_details"]
+
+    for _ in range(2):
+        response = client.get("/flights/ffffffff")
+        assert response.status_code == 404
+        assert response.json()["detail"].startswith("The requested flight could not be found")
+    assert calls["get_flight_details"] - before == 1
+
+    # A batch reports it among the errors instead.
+    batch = client.post("/flights/details:batch", json={"ids": ["ffffffff"]}).json()
+    assert batch == {"results": {}, "errors": {"ffffffff": response.json()["detail"]}}
+
+
+def scrape(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+
+
+def count(samples, name, **labels):
+    """Sum of the samples of a metric whose labels include the given ones."""
+    return sum(value for (sample, sample_labels), value in samples.items()
+               if sample == name and labels.items() <= dict(sample_labels).items())
+
+
+def test_metrics_count_requests_and_upstream_calls(client):
+    before = scrape(client)
+    assert search(client).status_code == 200
+    after = scrape(client)
+
+    requests = "flight_tower_http_request_duration_seconds_count"
+    assert count(after, requests, route="/flights/search", status="200") - count(before, requests, route="/flights/search", status="200") == 1
+    upstream_calls = "flight_tower_upstream_request_duration_seconds_count"
+    assert count(after, upstream_calls, operation="get_flights") - count(before, upstream_calls, operation="get_flights") == 1
+    assert count(after, "flight_tower_search_results_count") - count(before, "flight_tower_search_results_count") == 1
+    assert any(name == "flight_tower_cache_entries" for name, _ in after)
+    assert count(after, "flight_tower_stream_subscribers") == 0
+
+
+def test_search_is_refused_while_upstream_is_down(client):
+    breaker = upstream.client.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    try:
+        response = search(client)
+    finally:
+        breaker.record_success()
+
+    assert response.status_code == 503
+    assert 1 <= int(response.headers["retry-after"]) <= breaker.reset_seconds
+
+
+def test_map_layer_is_geojson(client):
+    params = {"south": 49.2, "west": 9.2, "north": 50.8, "east": 10.8, "zoom": 6}
+    response = client.get("/flights/map", params=params)
+    assert response.status_code == 200
+    layer = response.json()
+
+    assert layer["type"] == "FeatureCollection"
+    assert layer["clustered"] is True
+    assert layer["bbox"] == [9.0, 49.0, 11.0, 51.0]
+    counted = sum(f["properties"].get("count", 1) for f in layer["features"])
+    assert counted == layer["count"] > 0
+
+    cached = client.get("/flights/map", params=params, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+
+def locate(forwarded_for):
+    # As seen behind the frontend proxy; /geo/ip needs no app lifespan.
+    return TestClient(app, client=("127.0.0.1", 50000)).get("/geo/ip", headers={"X-Forwarded-For": forwarded_for})
+
+
+def test_ip_location_is_reported_unknown_when_not_covered(monkeypatch):
+    ranges = {"198.51.100.1": geoip.Location(52.2298, 21.0118, "PL", "Warsaw")}
+    monkeypatch.setattr(geoip, "lookup", ranges.get)
+
+    assert locate("198.51.100.1").json() == {
+        "lat": 52.2298,
+        "lon": 21.0118,
+        "source": "ip",
+        "country_code": "PL",
+        "city": "Warsaw",
+    }
+    # Not in the table, or no table at all: no made-up coordinates.
+    assert locate("203.0.113.9").json() == {"source": None}
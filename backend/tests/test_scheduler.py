@@ -0,0 +1,179 @@
+import asyncio
+
+import pytest
+
+from src.services import scheduler
+from src.services.scheduler import CircuitBreaker, Priority, Rejected, Scheduler, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Only for the synchronous tests: the event loop keeps its own clock.
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+    clock.now += 0.25
+    assert not bucket.take()
+    clock.now += 0.25
+    assert bucket.take()
+
+    # Idle time refills no more than the burst.
+    clock.now += 60
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+
+
+def test_unlimited_bucket():
+    bucket = TokenBucket(rate=float("inf"), burst=1)
+    assert all(bucket.take() for _ in range(100))
+    assert bucket.wait_time() == 0.0
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.retry_after() == pytest.approx(20)
+
+
+def test_half_open_breaker_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed probe opens the circuit for another full period.
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 29
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_probe_that_never_reports_back_does_not_block_the_next(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+async def admitted_in_order(limiter, requests):
+    """Queue (name, priority) requests behind one holding the only slot and return the order they get in."""
+    order = []
+
+    async def request(name, priority):
+        await limiter.acquire(priority)
+        order.append(name)
+        limiter.release()
+
+    await limiter.acquire(Priority.DETAILS)
+    tasks = [asyncio.create_task(request(name, priority)) for name, priority in requests]
+    await asyncio.sleep(0)
+    limiter.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_queued_requests_go_by_priority_then_arrival():
+    limiter = Scheduler(rate=float("inf"), burst=1, max_concurrency=1, queue_timeout=1)
+    requests = [
+        ("poll", Priority.BACKGROUND),
+        ("search 1", Priority.SEARCH),
+        ("details", Priority.DETAILS),
+        ("search 2", Priority.SEARCH),
+    ]
+
+    assert asyncio.run(admitted_in_order(limiter, requests)) == ["details", "search 1", "search 2", "poll"]
+
+
+def test_promoted_request_moves_ahead_of_less_urgent_ones():
+    limiter = Scheduler(rate=float("inf"), burst=1, max_concurrency=1, queue_timeout=1)
+
+    async def scenario():
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+            limiter.release()
+
+        await limiter.acquire(Priority.DETAILS)
+        tasks = {
+            name: asyncio.create_task(request(name, priority))
+            for name, priority in [("poll 1", Priority.BACKGROUND), ("search", Priority.SEARCH), ("poll 2", Priority.BACKGROUND)]
+        }
+        await asyncio.sleep(0)
+        limiter.promote(tasks["poll 2"], Priority.DETAILS)
+        # Never demoted.
+        limiter.promote(tasks["search"], Priority.BACKGROUND)
+        limiter.release()
+        await asyncio.gather(*tasks.values())
+        return order
+
+    assert asyncio.run(scenario()) == ["poll 2", "search", "poll 1"]
+
+
+def test_requests_wait_for_the_rate_budget():
+    limiter = Scheduler(rate=50, burst=1, max_concurrency=10, queue_timeout=1)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(3):
+            await limiter.acquire(Priority.SEARCH)
+            limiter.release()
+        return loop.time() - started
+
+    # The first goes straight through, the other two wait 20 ms each.
+    assert asyncio.run(scenario()) >= 0.035
+
+
+def test_request_queued_too_long_is_rejected():
+    limiter = Scheduler(rate=float("inf"), burst=1, max_concurrency=1, queue_timeout=0.05)
+
+    async def scenario():
+        await limiter.acquire(Priority.DETAILS)
+        with pytest.raises(Rejected) as rejected:
+            await limiter.acquire(Priority.DETAILS)
+        limiter.release()
+        # The rejected request gave up its place.
+        await asyncio.wait_for(limiter.acquire(Priority.SEARCH), 1)
+        return rejected.value
+
+    assert asyncio.run(scenario()).reason == "queue_timeout"
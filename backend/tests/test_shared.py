@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+
+from src.services import snapshot
+from src.utils import positions, shared
+
+
+def records(*flights):
+    """Position records for (id, lat, lon) flights, as a tile fetch parses them from the feed."""
+    return positions.from_feed({flight_id: ["48AE21", lat, lon, 90, 35000, 450] for flight_id, lat, lon in flights})
+
+
+@pytest.fixture
+def tiles(tmp_path):
+    return shared.TileStore(str(tmp_path / "tiles"))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return shared.KeyValueStore(str(tmp_path / "cache.sqlite3"))
+
+
+def written(store):
+    """Wait for the store's writer thread to commit what has been queued."""
+    store._writes.join()
+    return store
+
+
+def test_a_written_tile_is_read_by_every_worker(tmp_path, tiles):
+    assert tiles.read((52, 21)) is None
+    tiles.write((52, 21), records(("1a", 52.2, 21.0)), 1000.0)
+
+    other = shared.TileStore(str(tmp_path / "tiles"))
+    found, fetched_at = other.read((52, 21))
+    assert fetched_at == 1000.0
+    assert found["id"].tolist() == [b"1a"]
+
+    tiles.write((52, 21), records(("1a", 52.2, 21.0), ("1b", 52.3, 21.5)), 1010.0)
+    found, fetched_at = other.read((52, 21))
+    assert (len(found), fetched_at) == (2, 1010.0)
+
+    other.clear()
+    assert tiles.read((52, 21)) is None
+
+
+def test_one_worker_at_a_time_holds_a_tile_lock(tmp_path, tiles):
+    other = shared.TileStore(str(tmp_path / "tiles"))
+
+    assert tiles.try_lock((52, 21))
+    assert not other.try_lock((52, 21))
+    assert other.try_lock((52, 22))
+    tiles.unlock((52, 21))
+    assert other.try_lock((52, 21))
+
+
+def test_workers_share_one_upstream_fetch_per_tile(tmp_path):
+    calls = []
+
+    async def fetch(bounds):
+        calls.append(bounds)
+        return records(("1a", 52.2, 21.2), ("1b", 52.4, 21.6))
+
+    refreshed, adopted = [], []
+    first = snapshot.TileSnapshot(fetch, on_refresh=refreshed.append, store=shared.TileStore(str(tmp_path / "tiles")))
+    second = snapshot.TileSnapshot(fetch, on_adopt=adopted.append, store=shared.TileStore(str(tmp_path / "tiles")))
+
+    async def search(worker):
+        return [(match.id, distance) for match, distance in await worker.nearest(52.2, 21.2, 10, 5)]
+
+    assert asyncio.run(search(first)) == [("1a", 0.0)]
+    assert asyncio.run(search(second)) == [("1a", 0.0)]
+    assert len(calls) == 1
+    # Each worker sees the tile's records once: the first as it fetched them, the second as it took them over.
+    assert [batch["id"].tolist() for batch in refreshed] == [[b"1a", b"1b"]]
+    assert [batch["id"].tolist() for batch in adopted] == [[b"1a", b"1b"]]
+
+
+def test_shared_entries_expire(tmp_path, store):
+    store.set_many("details", [("a", {"airline": "LOT"}), (1, [1, 2])], ttl=60)
+    written(store)
+
+    value, remaining = store.get("details", "a")
+    assert value == {"airline": "LOT"}
+    assert 59 < remaining <= 60
+    # Keys are stored as text and values as JSON.
+    assert store.get("details", "1")[0] == [1, 2]
+    assert store.get("positions", "a") is None
+
+    store.set_many("details", [("b", "gone")], ttl=-1)
+    written(store)
+    assert store.get("details", "b") is None
+
+
+def test_other_workers_see_writes_and_deletes(tmp_path, store):
+    other = shared.KeyValueStore(str(tmp_path / "cache.sqlite3"))
+    store.set_many("missing", [("a", True), ("b", True)], ttl=30)
+    written(store)
+    assert other.get("missing", "a")[0] is True
+
+    other.delete("missing", "a")
+    written(other)
+    assert store.get("missing", "a") is None
+    other.clear()
+    assert store.get("missing", "b") is None
+
+
+def test_a_busy_connection_reads_as_a_miss(store):
+    store.set_many("details", [("a", 1)], ttl=60)
+    written(store)
+
+    # Another thread's lookup holds the connection.
+    with store._lock:
+        started = time.monotonic()
+        assert store.get("details", "a") is None
+        assert time.monotonic() - started < 0.5
+    assert store.get("details", "a")[0] == 1
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from src.services import snapshot
+from src.utils import positions
+
+
+def records(*flights):
+    """Position records for (id, lat, lon) flights, as a tile fetch parses them from the feed."""
+    return positions.from_feed({flight_id: ["48AE21", lat, lon, 90, 35000, 450] for flight_id, lat, lon in flights})
+
+
+def bounds(keys):
+    return sorted(tuple(float(v) for v in snapshot._tile_bounds(group).split(",")) for group in snapshot._tile_groups(keys))
+
+
+def test_tiles_for_circle_cover_the_circle():
+    keys = snapshot.tiles_for_circle(52.2, 21.0, 100)
+    assert (52, 21) in keys
+    assert {row for row, _ in keys} == {51, 52, 53}
+    assert {col for _, col in keys} == {19, 20, 21, 22}
+
+
+@pytest.mark.parametrize("lon", [179.9, -179.9, 180.0])
+def test_no_fetch_spans_the_world_across_the_antimeridian(lon):
+    keys = snapshot.tiles_for_circle(10.0, lon, 100)
+    assert {-180, 179} <= {col for _, col in keys}
+
+    for top, bottom, left, right in bounds(keys):
+        assert right - left <= 5.0
+        assert (top, bottom) == (11.0, 9.0)
+
+
+def test_map_viewport_across_the_antimeridian_is_fetched_from_both_sides():
+    keys = snapshot.tiles_for_bbox(10.0, 170.0, 12.0, -170.0)
+    assert bounds(keys) == [(13.0, 10.0, -180.0, -169.0), (13.0, 10.0, 170.0, 180.0)]
+
+
+def test_nearby_tiles_share_one_fetch_and_distant_ones_do_not():
+    near = [(50, 10), (50, 12), (51, 11)]
+    assert bounds(near) == [(52.0, 50.0, 10.0, 13.0)]
+
+    far = [(50, 10), (50, 10 + snapshot.TILE_GROUP_GAP + 2)]
+    assert len(snapshot._tile_groups(far)) == 2
+
+
+def test_concurrent_searches_share_one_upstream_fetch():
+    calls = []
+
+    async def fetch(bounds):
+        calls.append(bounds)
+        await asyncio.sleep(0.05)
+        return records(("1a", 52.2, 21.0), ("1b", 40.0, -3.0), ("1c", "", ""))
+
+    tiles = snapshot.TileSnapshot(fetch)
+
+    async def searches():
+        return await asyncio.gather(*(tiles.get_flights(52.2, 21.0, 50) for _ in range(8)))
+
+    results = asyncio.run(searches())
+    assert len(calls) == 1
+    # Flights outside the fetched tiles or without a position are not kept.
+    assert all([match.id for match in found] == ["1a"] for found in results)
+
+
+def test_stale_tiles_are_served_while_fetched_again(monkeypatch):
+    calls = []
+
+    async def fetch(bounds):
+        calls.append(bounds)
+        return records(("1a", 52.2, 21.0))
+
+    tiles = snapshot.TileSnapshot(fetch)
+
+    async def search():
+        found = await tiles.get_flights(52.2, 21.0, 50)
+        calls_when_answered = len(calls)
+        # Let a background refresh finish.
+        await asyncio.sleep(0.01)
+        return [match.id for match in found], calls_when_answered
+
+    assert asyncio.run(search()) == (["1a"], 1)
+    assert asyncio.run(search()) == (["1a"], 1)
+    assert len(calls) == 1
+
+    monkeypatch.setattr(snapshot, "TILE_TTL_SECONDS", 0)
+    assert asyncio.run(search()) == (["1a"], 1)
+    assert len(calls) == 2
+
+    # Past the hard TTL the search waits for the fetch.
+    monkeypatch.setattr(snapshot, "TILE_HARD_TTL_SECONDS", 0)
+    assert asyncio.run(search()) == (["1a"], 3)
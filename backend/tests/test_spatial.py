@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from src.utils import geo
+from src.utils.spatial import SpatialIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    rnd = np.random.default_rng(2)
+    lats = np.concatenate([rnd.uniform(45.0, 55.0, 4000), rnd.uniform(-10.0, 10.0, 1000)])
+    # A band straddling the antimeridian.
+    lons = np.concatenate([rnd.uniform(10.0, 25.0, 4000), rnd.uniform(175.0, 185.0, 1000)])
+    return SpatialIndex(lats, (lons + 180.0) % 360.0 - 180.0)
+
+
+@pytest.mark.parametrize("lat, lon", [(50.0, 17.0), (0.0, 179.95), (0.0, -179.95)])
+def test_within_finds_exactly_the_points_in_the_circle(index, lat, lon):
+    indices, distances = index.within(lat, lon, 80.0)
+
+    exact = geo.geodesic_km(lat, lon, index.lats, index.lons)
+    assert sorted(indices.tolist()) == np.flatnonzero(exact <= 80.0).tolist()
+    assert np.allclose(distances, exact[indices])
+    assert np.all(np.diff(distances) >= 0)
+
+
+def test_near_is_a_superset_of_within(index):
+    within, _ = index.within(50.0, 17.0, 60.0)
+    assert set(within.tolist()) <= set(index.near(50.0, 17.0, 60.0).tolist())
+
+
+@pytest.mark.parametrize("max_km", [None, 30.0])
+def test_nearest_matches_a_full_scan(index, max_km):
+    indices, distances = index.nearest(50.0, 17.0, 15, max_km=max_km)
+    expected, expected_distances = geo.nearest(50.0, 17.0, index.lats, index.lons, 15, max_km=max_km)
+
+    assert indices.tolist() == expected.tolist()
+    assert np.allclose(distances, expected_distances)
+
+
+def test_unbounded_nearest_widens_until_it_has_k_points():
+    index = SpatialIndex([10.0, -20.0, 60.0], [10.0, 100.0, -120.0])
+    indices, _ = index.nearest(0.0, 0.0, 3)
+    assert indices.tolist() == [0, 1, 2]
+
+
+def test_bbox_across_the_antimeridian(index):
+    found = index.bbox(-5.0, 178.0, 5.0, -178.0)
+
+    lats, lons = index.lats, index.lons
+    expected = np.flatnonzero((lats >= -5.0) & (lats <= 5.0) & ((lons >= 178.0) | (lons <= -178.0)))
+    assert sorted(found.tolist()) == expected.tolist()
+    assert len(found) > 0
+
+
+def test_empty_index():
+    index = SpatialIndex([], [])
+    assert len(index) == 0
+    assert index.within(0.0, 0.0, 100.0)[0].size == 0
+    assert index.nearest(0.0, 0.0, 5)[0].size == 0
+    assert index.bbox(-1.0, -1.0, 1.0, 1.0).size == 0
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+
+from src.services.tracks import POINT_DTYPE, TrackStore, as_rows
+from src.utils import positions
+
+# Recent, since flushing deletes segments past their retention.
+NOW = int(time.time()) - 600
+
+
+def batch(*points):
+    """Position records for (id, time, lat, lon) points, at most one per aircraft."""
+    return positions.from_feed({
+        flight_id: ["48AE21", lat, lon, 90, 35000, 450, "", "", "B738", "SP-LWA", seen]
+        for flight_id, seen, lat, lon in points
+    })
+
+
+def append(store, *batches):
+    async def run():
+        for records in batches:
+            store.append(records, NOW)
+
+    # Appending starts the flusher on the running loop.
+    asyncio.run(run())
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TrackStore(str(tmp_path), points=4, max_aircraft=20, flush_interval=3600, retention=3600)
+
+
+def test_the_ring_keeps_the_latest_points_in_order(store):
+    append(store, *(batch(("1a", NOW + i, 52.0 + i / 100, 21.0)) for i in range(6)))
+
+    track = store.track("1a")
+    assert track["time"].tolist() == [NOW + 2, NOW + 3, NOW + 4, NOW + 5]
+    assert track["lat"][-1] == pytest.approx(52.05)
+    assert store.track("1b").size == 0
+
+
+def test_points_no_newer_than_the_last_are_dropped(store):
+    append(store, batch(("1a", NOW + 10, 52.0, 21.0)), batch(("1a", NOW + 10, 52.1, 21.0)), batch(("1a", NOW + 5, 52.2, 21.0)))
+
+    assert store.track("1a")["time"].tolist() == [NOW + 10]
+
+
+def test_unlocated_aircraft_are_not_recorded(store):
+    append(store, batch(("1a", NOW, 0, 0), ("1b", NOW, 52.0, 21.0)))
+
+    assert store.track("1a").size == 0
+    assert store.track("1b").size == 1
+
+
+def test_full_buffers_recycle_the_aircraft_gone_longest(store):
+    append(store, batch(*((f"1{i:02d}", NOW + i, 52.0, 21.0) for i in range(20))))
+    append(store, batch(("2new", NOW + 100, 52.0, 21.0), ("101", NOW + 101, 52.0, 21.0)))
+
+    # One aircraft in twenty is recycled: the one seen first.
+    assert store.track("100").size == 0
+    assert store.track("101").size == 2
+    assert store.track("2new").size == 1
+
+
+def test_points_are_flushed_to_segments_and_replayed(tmp_path, store):
+    append(
+        store,
+        batch(("1a", NOW, 52.0, 21.0), ("1b", NOW, 40.0, -3.0)),
+        batch(("1a", NOW + 60, 52.1, 21.1)),
+    )
+    pending = store.replay(52.0, 21.0, 50, NOW, NOW + 60)
+    store.flush()
+
+    assert [name.endswith(".seg") for name in os.listdir(tmp_path)] == [True]
+    replayed = store.replay(52.0, 21.0, 50, NOW, NOW + 60)
+    assert replayed.tolist() == pending.tolist()
+    assert replayed["id"].tolist() == [b"1a", b"1a"]
+    assert replayed["time"].tolist() == [NOW, NOW + 60]
+    assert store.replay(52.0, 21.0, 50, NOW + 1, NOW + 59).size == 0
+
+
+def test_points_recorded_elsewhere_are_not_persisted(tmp_path, store):
+    store.append(batch(("1a", NOW, 52.0, 21.0)), NOW, persist=False)
+    store.flush()
+
+    assert store.track("1a").size == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_a_restarted_store_restores_its_tracks(tmp_path, store):
+    append(store, batch(("1a", NOW, 52.0, 21.0)), batch(("1a", NOW + 60, 52.1, 21.1)))
+    store.flush()
+
+    restarted = TrackStore(str(tmp_path), points=4, max_aircraft=20)
+    restarted.restore()
+    assert restarted.track("1a").tolist() == store.track("1a").tolist()
+
+
+def test_segments_past_retention_are_deleted(tmp_path):
+    store = TrackStore(str(tmp_path), points=4, max_aircraft=20, retention=60)
+    append(store, batch(("1a", NOW, 52.0, 21.0)))
+    store.flush()
+
+    assert os.listdir(tmp_path) == []
+    assert store.track("1a").size == 1
+
+
+def test_missing_values_are_served_as_null():
+    points = np.array([(NOW, 52.123456, 21.0, positions.MISSING, -1, -1)], dtype=POINT_DTYPE)
+
+    assert as_rows(points) == [
+        {"time": NOW, "lat": 52.12346, "lon": 21.0, "altitude_ft": None, "speed_kts": None, "heading_deg": None},
+    ]
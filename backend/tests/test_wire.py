@@ -0,0 +1,112 @@
+import gzip
+import json
+
+import brotli
+import pytest
+
+from src.utils import cache, wire
+
+
+def flight(flight_id, lat=52.0, origin="WAW", destination="London Heathrow"):
+    return {
+        "id": flight_id,
+        "callsign": f"LOT{flight_id}",
+        "lat": lat,
+        "lon": 21.0,
+        "distance_km": 1.5,
+        "altitude_ft": 35000,
+        "speed_kts": 450,
+        "origin_airport_iata": origin,
+        "destination_airport_name": destination,
+        "heading_deg": None,
+    }
+
+
+def decode(payload):
+    """The flights a compact payload describes, as dicts of the non-null fields."""
+    data, strings = payload["data"], payload["strings"]
+    rows = []
+    for i in range(payload["rows"]):
+        row = {}
+        for field in payload["columns"]:
+            value = data[field][i]
+            if value is not None and field in wire.DICTIONARY_FIELDS:
+                value = strings[value]
+            if value is not None:
+                row[field] = value
+        rows.append(row)
+    return rows
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cache.clear()
+
+
+def test_wants_compact():
+    assert wire.wants_compact("compact", None)
+    assert wire.wants_compact(None, f"{wire.COMPACT_MEDIA_TYPE}, application/json")
+    assert not wire.wants_compact(None, "application/json")
+    assert not wire.wants_compact(None, None)
+
+
+def test_compact_encoding_round_trips():
+    flights = [flight("1"), flight("2", destination="London Stansted"), flight("3", origin="KRK")]
+    payload = wire.encode_compact(flights)
+
+    assert payload["delta"] is False
+    assert payload["count"] == payload["rows"] == 3
+    assert payload["version"] == wire.snapshot_version(flights)
+    assert decode(payload) == [{k: v for k, v in f.items() if v is not None} for f in flights]
+    # Repeated strings are sent once.
+    assert sorted(payload["strings"]) == ["KRK", "London Heathrow", "London Stansted", "WAW"]
+
+
+def test_delta_carries_only_changes_since_a_known_version():
+    before = [flight("1"), flight("2"), flight("3")]
+    base = wire.encode_compact(before)["version"]
+
+    after = [flight("1"), flight("2", lat=52.5), flight("4")]
+    payload = wire.encode_compact(after, since=base)
+
+    assert payload["delta"] is True
+    assert payload["base"] == base
+    assert payload["count"] == 3
+    assert [row["id"] for row in decode(payload)] == ["2", "4"]
+    assert payload["removed"] == ["3"]
+
+
+def test_unknown_base_version_gets_the_full_result():
+    flights = [flight("1"), flight("2")]
+    payload = wire.encode_compact(flights, since="0123456789abcdef")
+
+    assert payload["delta"] is False
+    assert payload["rows"] == 2
+
+
+def test_version_changes_with_the_results():
+    assert wire.snapshot_version([flight("1")]) == wire.snapshot_version([flight("1")])
+    assert wire.snapshot_version([flight("1")]) != wire.snapshot_version([flight("1", lat=53.0)])
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected, decompress",
+    [
+        ("gzip, deflate, br", "br", brotli.decompress),
+        ("gzip", "gzip", gzip.decompress),
+        ("identity", None, lambda body: body),
+        (None, None, lambda body: body),
+    ],
+)
+def test_encode_body(accept_encoding, expected, decompress):
+    payload = wire.encode_compact([flight(str(i)) for i in range(50)])
+    body, encoding = wire.encode_body(payload, accept_encoding)
+
+    assert encoding == expected
+    assert json.loads(decompress(body)) == payload
+
+
+def test_small_bodies_are_not_compressed():
+    body, encoding = wire.encode_body({"rows": 0}, "br")
+    assert encoding is None
+    assert json.loads(body) == {"rows": 0}
@@ -2,6 +2,18 @@ import { NextResponse } from "next/server"
 
 const API_BASE = process.env.NEXT_PUBLIC_API_BASE_URL
 
+// Backend headers passed through so browsers and CDNs can cache and revalidate results.
+const CACHE_HEADERS = ["etag", "last-modified", "cache-control", "vary", "x-data-stale"]
+const CONDITIONAL_HEADERS = ["if-none-match", "if-modified-since"]
+
+function validateParams(source: { lat?: unknown; lon?: unknown; radius_km?: unknown; limit?: unknown }) {
+  const lat = Number(source.lat ?? 0)
+  const lon = Number(source.lon ?? 0)
+  const radius_km = Math.min(100, Math.max(5, Number(source.radius_km ?? 25)))
+  const limit = Math.min(50, Math.max(1, Number(source.limit ?? 10)))
+  return { lat, lon, radius_km, limit }
+}
+
 async function proxyToBackend(body: any) {
   console.log("[proxy] Backend API URL:", API_BASE)
   if (!API_BASE) {
@@ -70,12 +82,7 @@ export async function POST(req: Request) {
     return NextResponse.json({ message: "Invalid JSON in request body" }, { status: 400 })
   }
 
-  const lat = Number(body.lat ?? 0)
-  const lon = Number(body.lon ?? 0)
-  const radius_km = Math.min(100, Math.max(5, Number(body.radius_km ?? 25)))
-  const limit = Math.min(50, Math.max(1, Number(body.limit ?? 10)))
-  
-  const validatedBody = { lat, lon, radius_km, limit }
+  const validatedBody = validateParams(body)
   console.log("[api/flights/search] Validated body for proxy:", validatedBody)
 
   const proxied = await proxyToBackend(validatedBody)
@@ -99,4 +106,64 @@ export async function POST(req: Request) {
     console.error("[api/flights/search] Data that failed serialization:", proxied)
     return NextResponse.json({ message: "Invalid data from backend" }, { status: 500 })
   }
-}
\ No newline at end of file
+}
+
+export async function GET(req: Request) {
+  const url = new URL(req.url)
+  const params = validateParams({
+    lat: url.searchParams.get("lat"),
+    lon: url.searchParams.get("lon"),
+    radius_km: url.searchParams.get("radius_km"),
+    limit: url.searchParams.get("limit"),
+  })
+  console.log("[api/flights/search] Received GET request:", params)
+
+  if (!API_BASE) {
+    console.error("[api/flights/search] Backend API URL is not configured.")
+    return NextResponse.json({ message: "Backend API URL is not configured." }, { status: 500 })
+  }
+
+  const query = new URLSearchParams(Object.entries(params).map(([key, value]) => [key, String(value)]))
+  // Forward the client's validators so an unchanged result comes back as a bodiless 304.
+  const headers: Record<string, string> = { Accept: "application/json" }
+  for (const name of CONDITIONAL_HEADERS) {
+    const value = req.headers.get(name)
+    if (value) headers[name] = value
+  }
+
+  try {
+    const controller = new AbortController()
+    const timeout = setTimeout(() => controller.abort(), 10000)
+    const res = await fetch(`${API_BASE}/flights/search?${query}`, {
+      headers,
+      signal: controller.signal,
+      cache: "no-store",
+    })
+    clearTimeout(timeout)
+
+    const passthrough = new Headers()
+    for (const name of CACHE_HEADERS) {
+      const value = res.headers.get(name)
+      if (value) passthrough.set(name, value)
+    }
+
+    if (res.status === 304) {
+      return new NextResponse(null, { status: 304, headers: passthrough })
+    }
+
+    const responseText = await res.text()
+    if (!res.ok) {
+      console.error(`[api/flights/search] Backend responded with non-OK status ${res.status}. Body: ${responseText}`)
+      return NextResponse.json({ message: responseText }, { status: res.status })
+    }
+
+    passthrough.set("content-type", "application/json")
+    return new NextResponse(responseText, { status: 200, headers: passthrough })
+  } catch (e: any) {
+    console.error("[api/flights/search] Error proxying GET to backend:", e)
+    if (e.name === "AbortError") {
+      return NextResponse.json({ message: "Request to backend timed out." }, { status: 504 })
+    }
+    return NextResponse.json({ message: e?.message || "Backend request failed" }, { status: 502 })
+  }
+}
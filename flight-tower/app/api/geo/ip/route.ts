@@ -2,7 +2,7 @@ import { NextResponse } from "next/server"
 
 const API_BASE = process.env.NEXT_PUBLIC_API_BASE_URL
 
-export async function GET() {
+export async function GET(req: Request) {
   if (!API_BASE) {
     return NextResponse.json({ message: "Backend API URL is not configured." }, { status: 500 });
   }
@@ -10,7 +10,12 @@ export async function GET() {
   try {
     const controller = new AbortController()
     const timeout = setTimeout(() => controller.abort(), 8000)
-    const res = await fetch(`${API_BASE}/geo/ip`, { signal: controller.signal })
+    // The backend sees this server as the peer; pass on who the request came from.
+    const forwardedFor = req.headers.get("x-forwarded-for") ?? req.headers.get("x-real-ip")
+    const res = await fetch(`${API_BASE}/geo/ip`, {
+      signal: controller.signal,
+      headers: forwardedFor ? { "X-Forwarded-For": forwardedFor } : {},
+    })
     clearTimeout(timeout)
     if (res.ok) {
       const json = await res.json()
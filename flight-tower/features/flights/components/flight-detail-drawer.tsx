@@ -21,8 +21,9 @@ export function FlightDetailDrawer({
   const [loading, setLoading] = useState(false)
   const [data, setData] = useState<FlightDetail | null>(null)
 
-  // Function to get country code from country name
-  const getCountryCode = (countryName: string): string | undefined => {
+  // Function to get country code, preferring the one resolved by the backend
+  const getCountryCode = (countryName: string, code?: string | null): string | undefined => {
+    if (code) return code.toLowerCase();
     if (!countryName) return undefined;
     const country = countries.find(c => 
       c.name.common.toLowerCase() === countryName.toLowerCase() ||
@@ -90,9 +91,9 @@ export function FlightDetailDrawer({
                 {data.origin_country && (
                   <div className="flex items-center gap-1">
                     <span className="text-lg flex items-center">
-                      {getCountryCode(data.origin_country) ? (
+                      {getCountryCode(data.origin_country, data.origin_country_code) ? (
                         <img 
-                          src={`https://flagcdn.com/24x18/${getCountryCode(data.origin_country)}.png`}
+                          src={`https://flagcdn.com/24x18/${getCountryCode(data.origin_country, data.origin_country_code)}.png`}
                           alt={data.origin_country}
                           className="mr-1 h-4 w-6 object-cover rounded-sm shadow-sm"
                           title={data.origin_country}
@@ -107,9 +108,9 @@ export function FlightDetailDrawer({
                 {data.destination_country && (
                   <div className="flex items-center gap-1">
                     <span className="text-lg flex items-center">
-                      {getCountryCode(data.destination_country) ? (
+                      {getCountryCode(data.destination_country, data.destination_country_code) ? (
                         <img 
-                          src={`https://flagcdn.com/24x18/${getCountryCode(data.destination_country)}.png`}
+                          src={`https://flagcdn.com/24x18/${getCountryCode(data.destination_country, data.destination_country_code)}.png`}
                           alt={data.destination_country}
                           className="mr-1 h-4 w-6 object-cover rounded-sm shadow-sm"
                           title={data.destination_country}
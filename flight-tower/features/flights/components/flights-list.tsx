@@ -45,7 +45,7 @@ export function FlightsList({
                   <div className="min-w-0">
                     <div className="font-medium truncate">{f.callsign ?? t('flights_list.unknown')}</div>
                     <div className="text-xs text-muted-foreground">
-                      {f.origin_airport_iata ?? t('flights_list.unknown_airport')} → {f.destination_airport_iata ?? t('flights_list.unknown_airport')} • {f.distance_km.toFixed(1)} {t('units.km')}
+                      {f.origin_country_flag ? `${f.origin_country_flag} ` : ''}{f.origin_airport_iata ?? t('flights_list.unknown_airport')} → {f.destination_country_flag ? `${f.destination_country_flag} ` : ''}{f.destination_airport_iata ?? t('flights_list.unknown_airport')} • {f.distance_km.toFixed(1)} {t('units.km')}
                     </div>
                     <div className="text-xs text-muted-foreground">
                       {Math.round((f.altitude_ft ?? 0) * 0.3048)} {t('units.m')} • {Math.round((f.speed_kts ?? 0) * 1.852)} {t('units.kmh')} • {t('units.heading')} {(f.heading_deg ?? 0).toFixed(0)}°
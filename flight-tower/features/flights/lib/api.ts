@@ -11,11 +11,11 @@ export async function searchFlights(payload: {
 }) {
   console.log("[api.ts] searchFlights called with payload:", payload)
   try {
-    const res = await fetch(`/api/flights/search`, {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload),
-      cache: "no-store",
+    const query = new URLSearchParams(Object.entries(payload).map(([key, value]) => [key, String(value)]))
+    // GET lets the browser revalidate with the ETag it already holds and reuse its copy on 304.
+    const res = await fetch(`/api/flights/search?${query}`, {
+      method: "GET",
+      cache: "no-cache",
     })
     
     console.log(`[api.ts] searchFlights response status: ${res.status}`)
@@ -62,11 +62,14 @@ export async function getFlightDetail(id: string) {
   }
 }
 
+// Resolves to null when the backend can't place the address (no IP range table,
+// or an address it doesn't cover); callers then keep their default center.
 export async function getIpLocation() {
   const res = await fetch(`${getApiBase()}/geo/ip`, { cache: "no-store" })
   if (!res.ok) {
     const text = await res.text().catch(() => "")
     throw new Error(text || "Failed to fetch IP location")
   }
-  return res.json()
+  const data = await res.json()
+  return data.source ? data : null
 }
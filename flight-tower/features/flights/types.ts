@@ -11,6 +11,15 @@ export type FlightSummary = {
   destination_airport_name: string | null
   destination_airport_iata: string | null
   heading_deg: number | null
+  origin_country?: string | null
+  origin_country_code?: string | null
+  origin_country_flag?: string | null
+  destination_country?: string | null
+  destination_country_code?: string | null
+  destination_country_flag?: string | null
+  airline_name?: string | null
+  aircraft_code?: string | null
+  aircraft_type?: string | null
 }
 
 export type FlightDetail = {
@@ -24,9 +33,17 @@ export type FlightDetail = {
   }
   origin_country: string | null
   destination_country: string | null
+  origin_country_code?: string | null
+  origin_country_flag?: string | null
+  destination_country_code?: string | null
+  destination_country_flag?: string | null
+  // Served from the last known copy while FlightRadar24 is unavailable
+  stale?: boolean
 }
 
 export type FlightsSearchResponse = {
   count: number
   flights: FlightSummary[]
+  // Positions are older than usual because FlightRadar24 is unavailable
+  stale?: boolean
 }
@@ -49,7 +49,9 @@ translations = {
         "flight_time": "Czas lotu",
         "current_location": "Aktualna lokalizacja",
         "location_updated_ip": "Lokalizacja zaktualizowana (na podstawie adresu IP) o {time}",
-        "location_error_ip": "Nie można pobrać lokalizacji (IP). Błąd: {error}"
+        "location_error_ip": "Nie można pobrać lokalizacji (IP). Błąd: {error}",
+        "aircraft_cluster": "{count} samolotów",
+        "map_unavailable": "Nie można pobrać ruchu lotniczego dla mapy: {error}"
     },
     "en": {
         "page_title": "Flight Tower",
@@ -101,6 +103,8 @@ translations = {
         "flight_time": "Flight Time",
         "current_location": "Current Location",
         "location_updated_ip": "Location updated (based on IP address) at {time}",
-        "location_error_ip": "Could not get location (IP). Error: {error}"
+        "location_error_ip": "Could not get location (IP). Error: {error}",
+        "aircraft_cluster": "{count} aircraft",
+        "map_unavailable": "Could not load the traffic for the map: {error}"
     }
 }
\ No newline at end of file